@@ -20,3 +20,4 @@
 #
 ################################################################################
 from . import models
+from . import controllers
@@ -1,4 +1,3 @@
-<<<<<<< HEAD
 # hr_zk_attendance/__manifest__.py
 {
     'name': 'Biometric Device Integration',
@@ -8,14 +7,6 @@
     'description': "This module integrates Odoo with the biometric device(Model: ZKteco uFace 202),odoo17,odoo,hr,attendance",
     'author': 'Concept Solutions ',
     'website': 'https://www.csloman.com',
-=======
-{
-    'name': 'Biometric Device Integration',
-    'version': '17.0.1.3.0',
-    'category': 'Human Resources',
-    'summary': "Integrating Biometric Device (Model: ZKteco uFace 202) With HR Attendance (Face + Thumb)",
-    'description': "This module integrates Odoo with the biometric device(Model: ZKteco uFace 202),odoo17,odoo,hr,attendance",
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
     'depends': ['base_setup', 'hr_attendance', 'resource'],
     'external_dependencies': {
         'python': ['pyzk'],
@@ -29,8 +20,16 @@
         'views/daily_attendance_views.xml',
         'views/biometric_device_attendance_menus.xml',
         'views/resource_calendar_views.xml',
+        'views/res_company_views.xml',
         'views/hr_attendance_report_views.xml',
         'views/hr_night_shift_schedule_views.xml',
+        'views/hr_employee_shift_roster_views.xml',
+        'views/hr_attendance_daily_fact_views.xml',
+        'views/zk_machine_attendance_archive_views.xml',
+        'views/zk_attendance_purge_wizard_views.xml',
+        'views/biometric_sync_run_views.xml',
+        'views/zk_attendance_reprocess_wizard_views.xml',
+        'views/hr_attendance_recompute_job_views.xml',
         'data/download_data.xml',
         'data/ir_cron_data.xml'
     ],
@@ -0,0 +1,141 @@
+# hr_zk_attendance/controllers/iclock.py
+import logging
+import threading
+from time import monotonic
+from odoo import http
+from odoo.http import request
+
+_logger = logging.getLogger(__name__)
+
+# Options sent to a device on its handshake (see the ZKTeco PUSH SDK)
+PUSH_OPTIONS = [
+    "ErrorDelay=30",
+    "Delay=10",
+    "TransTimes=00:00;14:05",
+    "TransInterval=1",
+    "TransFlag=TransData AttLog",
+    "Realtime=1",
+    "Encrypt=None",
+]
+# Rejected requests allowed per source address and window before answering 429
+REJECTED_PUSH_LIMIT = 20
+REJECTED_PUSH_WINDOW = 60
+REJECTED_PUSH_MAX_SOURCES = 10000
+
+
+class RejectedPushTracker:
+    """
+    In-process count of the rejected push requests per source address.
+    The first rejection of a window is logged, the following ones are
+    summed up when the window ends, and sources above the limit are
+    throttled until then.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._windows = {}
+
+    def reject(self, remote_addr, serial_number, reason):
+        """Record a rejected request, return whether the source is throttled"""
+        now = monotonic()
+        with self._lock:
+            started, count, serials = self._windows.get(remote_addr, (now, 0, set()))
+            if now - started > REJECTED_PUSH_WINDOW:
+                if count > 1:
+                    _logger.warning(f"Rejected {count} push requests from {remote_addr} "
+                                    f"(SN {', '.join(sorted(serials))}) in {REJECTED_PUSH_WINDOW}s.")
+                started, count, serials = now, 0, set()
+            if not count:
+                _logger.warning(f"Rejected push request from {remote_addr} SN={serial_number}: {reason}")
+            serials.add(str(serial_number))
+            self._windows[remote_addr] = (started, count + 1, serials)
+            if len(self._windows) > REJECTED_PUSH_MAX_SOURCES:
+                self._windows = {addr: window for addr, window in self._windows.items()
+                                 if now - window[0] <= REJECTED_PUSH_WINDOW}
+            return count + 1 > REJECTED_PUSH_LIMIT
+
+
+rejected_pushes = RejectedPushTracker()
+
+
+class IclockController(http.Controller):
+    """Endpoints of the ZKTeco push protocol (ADMS/iclock).
+
+    Devices configured with the "ADMS Push" sync mode call these routes
+    themselves: a GET on /iclock/cdata as handshake, then POSTs of their
+    attendance log in batches, acknowledged with the number of records.
+    A request is only served when it carries the push token of the device
+    and/or comes from one of its allowed networks, see
+    biometric.device.details._check_push_request.
+
+    Devices cannot log in, so the routes are auth='none' and only reachable
+    when Odoo can pick the database of a request without a session: the
+    server must serve a single database or a dbfilter must select it, e.g.
+    from the hostname the devices push to.
+    """
+
+    def _text_response(self, body, status=200):
+        return request.make_response(body, headers=[('Content-Type', 'text/plain')], status=status)
+
+    def _get_push_device(self, serial_number):
+        if not serial_number:
+            return request.env['biometric.device.details']
+        return request.env['biometric.device.details'].sudo().search([
+            ('serial_number', '=', serial_number),
+            ('sync_mode', '=', 'push'),
+        ], limit=1)
+
+    def _authenticate_push(self, serial_number, token):
+        """Return the device of an authorized request, or the response refusing it"""
+        remote_addr = request.httprequest.remote_addr
+        token = token or request.httprequest.headers.get('X-Push-Token')
+        device = self._get_push_device(serial_number)
+        if not device:
+            reason, status = 'unknown device', 404
+        elif not device._check_push_request(token, remote_addr):
+            reason, status = 'invalid token or source address', 403
+        else:
+            return device, None
+        if rejected_pushes.reject(remote_addr, serial_number, reason):
+            return None, self._text_response('ERROR: too many requests', status=429)
+        return None, self._text_response(f'ERROR: {reason}', status=status)
+
+    @http.route('/iclock/cdata', type='http', auth='none', methods=['GET', 'POST'],
+                csrf=False, save_session=False)
+    def iclock_cdata(self, SN=None, table=None, Stamp=None, token=None, **kwargs):
+        """Handshake (GET) and log uploads (POST) of a push device"""
+        device, refusal = self._authenticate_push(SN, token)
+        if refusal:
+            return refusal
+
+        if request.httprequest.method == 'GET':
+            # Tell the device which logs to upload and from which stamp on
+            options = [
+                f"GET OPTION FROM: {SN}",
+                f"ATTLOGStamp={device.push_stamp or 'None'}",
+                "OPERLOGStamp=9999",
+                "ATTPHOTOStamp=None",
+            ] + PUSH_OPTIONS
+            return self._text_response('\n'.join(options) + '\n')
+
+        if table != 'ATTLOG':
+            # Operation logs, photos and user data are not used, only acknowledged
+            return self._text_response('OK')
+
+        payload = request.httprequest.get_data(as_text=True)
+        count = device._ingest_push_attlog(payload, stamp=Stamp)
+        return self._text_response(f'OK: {count}')
+
+    @http.route(['/iclock/getrequest', '/iclock/ping'], type='http', auth='none',
+                methods=['GET'], csrf=False, save_session=False)
+    def iclock_getrequest(self, SN=None, token=None, **kwargs):
+        """Command polling of the device, no command is ever queued"""
+        _device, refusal = self._authenticate_push(SN, token)
+        return refusal or self._text_response('OK')
+
+    @http.route('/iclock/devicecmd', type='http', auth='none', methods=['POST'],
+                csrf=False, save_session=False)
+    def iclock_devicecmd(self, SN=None, token=None, **kwargs):
+        """Results of device commands, only acknowledged"""
+        _device, refusal = self._authenticate_push(SN, token)
+        return refusal or self._text_response('OK')
@@ -0,0 +1,31 @@
+# hr_zk_attendance/controllers/metrics.py
+import hmac
+from odoo import http
+from odoo.http import request
+from odoo.addons.hr_zk_attendance.models.hr_employee import shift_cache
+from odoo.addons.hr_zk_attendance.models.sync_metrics import render_metrics, sync_metrics
+
+
+class SyncMetricsController(http.Controller):
+    """Prometheus exposition of the attendance synchronization counters.
+
+    The route is disabled until the hr_zk_attendance.metrics_token system
+    parameter is set. Scrapers pass the token as a bearer token or as the
+    token query parameter.
+    """
+
+    @http.route('/hr_zk_attendance/metrics', type='http', auth='none', methods=['GET'],
+                csrf=False, save_session=False)
+    def metrics(self, token=None, **kwargs):
+        expected = request.env['ir.config_parameter'].sudo().get_param('hr_zk_attendance.metrics_token')
+        if not expected:
+            return request.not_found()
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):]
+        if not token or not hmac.compare_digest(token, expected):
+            return request.make_response('Forbidden', headers=[('Content-Type', 'text/plain')], status=403)
+
+        punch_ages = request.env['biometric.device.details'].sudo()._get_newest_punch_ages()
+        body = render_metrics(sync_metrics.snapshot(), punch_ages, shift_cache.stats())
+        return request.make_response(body, headers=[('Content-Type', 'text/plain; version=0.0.4')])
@@ -19,15 +19,20 @@
 #    If not, see <http://www.gnu.org/licenses/>.
 #
 ################################################################################
+from . import biometric_sync_run
 from . import biometric_device_details
 from . import zk_machine_attendance
+from . import zk_machine_attendance_archive
+from . import zk_attendance_purge_wizard
+from . import zk_attendance_reprocess_job
+from . import zk_attendance_reprocess_wizard
 from . import daily_attendance
 from . import hr_employee
+from . import hr_employee_shift_roster
 from . import hr_employee_worksheet
 from . import hr_attendance
-<<<<<<< HEAD
+from . import hr_attendance_daily_fact
+from . import hr_attendance_recompute_job
+from . import res_company
 from . import resource_calendar
 from . import hr_night_shift_schedule
-=======
-from . import resource_calendar
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
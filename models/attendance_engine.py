@@ -0,0 +1,356 @@
+# hr_zk_attendance/models/attendance_engine.py
+"""Attendance computations on plain data, without any ORM access.
+
+Punches are naive UTC datetimes, shifts are the dicts built by
+hr.employee._build_shift (start_local, end_local, break_from_local,
+break_to_local, planned_work_hours, is_night_shift, is_holiday). The
+functions can be run on any number of employees outside a transaction,
+the model methods of biometric.device.details delegate to them.
+
+process_punch_batch runs the whole pipeline on many punches at once, on
+NumPy arrays when NumPy is installed and with the scalar functions
+otherwise. Both paths return the same results.
+
+The status flags are stored as a bitmask on hr.attendance, see STATUS_BITS.
+"""
+from datetime import date, datetime, timedelta
+import pytz
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# A punch up to this long after the end of the previous day's night shift belongs to it
+NIGHT_SHIFT_GRACE = timedelta(hours=4)
+# A missing check-out is closed this long after the check-in
+MISSED_CHECKOUT_HOURS = 18.0
+# Status flags are only raised beyond this difference to the planned hours
+EXTRA_HOURS_MARGIN = 0.1
+# Shift of the workdays without any shift or holiday defined
+HOLIDAY_SHIFT = {'is_holiday': True, 'planned_work_hours': 0.0}
+
+EPOCH = datetime(1970, 1, 1)
+EPOCH_DATE = date(1970, 1, 1)
+EPOCH_UTC = pytz.utc.localize(EPOCH)
+MICROSECOND = timedelta(microseconds=1)
+MINUTE_US = 60 * 10 ** 6
+DAY_US = 86400 * 10 ** 6
+# Bits of the status flags in hr.attendance.status_mask, stored values: never renumber them
+STATUS_BITS = {
+    'early_checkin': 1 << 0,
+    'late_checkin': 1 << 1,
+    'early_checkout': 1 << 2,
+    'late_checkout': 1 << 3,
+    'extra_hours': 1 << 4,
+    'less_hours': 1 << 5,
+    'Missed checkin': 1 << 6,
+    'Missed checkout': 1 << 7,
+    'Holiday Work': 1 << 8,
+    'night_shift': 1 << 9,
+    'invalid_order_fixed': 1 << 10,
+}
+
+
+def to_utc(local_dt):
+    return local_dt.astimezone(pytz.utc).replace(tzinfo=None)
+
+
+def status_to_mask(status_list):
+    """Bitmask of the status flags, the unknown flags are ignored"""
+    mask = 0
+    for name in status_list:
+        mask |= STATUS_BITS.get(name, 0)
+    return mask
+
+
+def mask_to_status(mask):
+    """Status flags of a bitmask, in the order of STATUS_BITS"""
+    return [name for name, bit in STATUS_BITS.items() if mask & bit]
+
+
+def get_workday(punch_time_local, prev_shift):
+    """
+    Return the workday of a punch given in the operating timezone: the
+    previous day when the punch closes that day's night shift, else the
+    day of the punch.
+    """
+    punch_date = punch_time_local.date()
+    if prev_shift and not prev_shift.get('is_holiday') and prev_shift['is_night_shift'] \
+            and punch_time_local <= prev_shift['end_local'] + NIGHT_SHIFT_GRACE:
+        return punch_date - timedelta(days=1)
+    return punch_date
+
+
+def process_punches(punches, shift, employee_id=None, now=None):
+    """
+    Compute the attendance of one employee workday from its punches.
+    The first punch is the check-in, the last one the check-out. Returns
+    the check-in/out, worked and extra hours and the status flags, or
+    {'has_punches': False} without punches.
+    """
+    punches = sorted(punches)
+    if not punches:
+        return {"has_punches": False}
+
+    check_in = punches[0]
+    check_out = punches[-1] if len(punches) > 1 else None
+    results = {
+        "employee_id": employee_id,
+        "date": check_in.date(),
+        "check_in": check_in,
+        "check_out": check_out,
+        "status": [],
+        "worked_hours": 0.0,
+        "extra_hours": 0.0,
+        "has_punches": True,
+    }
+
+    # Holiday or no worksheet: all the time worked is extra
+    if shift.get('is_holiday'):
+        if check_out:
+            worked_hours = (check_out - check_in).total_seconds() / 3600.0
+            results.update({
+                "status": ["Holiday Work", "extra_hours"],
+                "worked_hours": round(worked_hours, 2),
+                "extra_hours": round(worked_hours, 2),
+            })
+        else:
+            results["status"].append("Missed checkout")
+        return results
+
+    shift_start_utc = to_utc(shift['start_local'])
+    shift_end_utc = to_utc(shift['end_local'])
+    break_from_utc = to_utc(shift['break_from_local']) if shift.get('break_from_local') else None
+    break_to_utc = to_utc(shift['break_to_local']) if shift.get('break_to_local') else None
+    planned_hours = shift.get('planned_work_hours', 0.0)
+    status_flags = []
+
+    if check_out:
+        # Only the part of the break inside the worked period is deducted
+        break_overlap_seconds = 0
+        if break_from_utc and break_to_utc:
+            overlap_start = max(check_in, break_from_utc)
+            overlap_end = min(check_out, break_to_utc)
+            if overlap_end > overlap_start:
+                break_overlap_seconds = (overlap_end - overlap_start).total_seconds()
+
+        worked_hours = ((check_out - check_in).total_seconds() - break_overlap_seconds) / 3600.0
+        extra_hours = worked_hours - planned_hours
+        results["worked_hours"] = round(worked_hours, 2)
+        results["extra_hours"] = round(extra_hours, 2)
+
+        if check_in < shift_start_utc:
+            status_flags.append("early_checkin")
+        elif check_in > shift_start_utc:
+            status_flags.append("late_checkin")
+
+        if check_out < shift_end_utc:
+            status_flags.append("early_checkout")
+        elif check_out > shift_end_utc:
+            status_flags.append("late_checkout")
+
+        if extra_hours < -EXTRA_HOURS_MARGIN:
+            status_flags.append("less_hours")
+        elif extra_hours > EXTRA_HOURS_MARGIN:
+            status_flags.append("extra_hours")
+    else:
+        status_flags.append("Missed checkout")
+        now = now or datetime.now()
+        if now >= check_in + timedelta(hours=MISSED_CHECKOUT_HOURS):
+            results["check_out"] = check_in + timedelta(hours=MISSED_CHECKOUT_HOURS)
+            results["worked_hours"] = MISSED_CHECKOUT_HOURS
+            results["extra_hours"] = round(MISSED_CHECKOUT_HOURS - planned_hours, 2)
+
+    results["status"] = status_flags
+    return results
+
+
+def process_workdays(workdays, now=None):
+    """
+    Process many workdays at once. workdays is an iterable of
+    (employee id, punches, shift), return the results in the same order.
+    """
+    now = now or datetime.now()
+    return [process_punches(punches, shift, employee_id, now) for employee_id, punches, shift in workdays]
+
+
+def _localize(punch_time, operating_tz):
+    if punch_time.tzinfo is None:
+        return operating_tz.localize(punch_time, is_dst=None)
+    return punch_time.astimezone(operating_tz)
+
+
+def process_punch_batch(punches, operating_tz, get_shift, now=None, use_numpy=None):
+    """
+    Assign the punches to workdays and compute the attendance of every
+    employee workday. punches is a list of (employee id, punch time), the
+    time being naive in the operating timezone or timezone aware.
+    get_shift(employee id, day) returns the shift of the employee on the
+    day (or None). Return {(employee id, workday): result of
+    process_punches}, ordered by employee and workday.
+    """
+    now = now or datetime.now()
+    if not punches:
+        return {}
+    if use_numpy is None:
+        use_numpy = np is not None
+    if use_numpy:
+        return _process_punch_batch_numpy(punches, operating_tz, get_shift, now)
+    return _process_punch_batch_scalar(punches, operating_tz, get_shift, now)
+
+
+def process_punch_chunk(punches, shifts, tz_name, now):
+    """
+    process_punch_batch on plain data only: the shifts are given
+    as a dict {(employee id, day): shift} instead of a lookup function.
+    """
+    return process_punch_batch(punches, pytz.timezone(tz_name),
+                               lambda employee_id, day: shifts.get((employee_id, day)), now)
+
+
+def _process_punch_batch_scalar(punches, operating_tz, get_shift, now):
+    punches_by_workday = {}
+    for employee_id, punch_time in punches:
+        local_dt = _localize(punch_time, operating_tz)
+        workday = get_workday(local_dt, get_shift(employee_id, local_dt.date() - timedelta(days=1)))
+        punches_by_workday.setdefault((employee_id, workday), []).append(to_utc(local_dt))
+    return {(employee_id, workday): process_punches(punches_by_workday[(employee_id, workday)],
+                                                    get_shift(employee_id, workday) or HOLIDAY_SHIFT,
+                                                    employee_id, now)
+            for employee_id, workday in sorted(punches_by_workday)}
+
+
+def _to_us(naive_dt):
+    return (naive_dt - EPOCH) // MICROSECOND
+
+
+def _aware_to_us(aware_dt):
+    """Microseconds since the epoch of a timezone aware datetime, in UTC"""
+    return (aware_dt - EPOCH_UTC) // MICROSECOND
+
+
+def _from_us(value):
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _process_punch_batch_numpy(punches, operating_tz, get_shift, now):
+    """Vectorized process_punch_batch, see _process_punch_batch_scalar"""
+    count = len(punches)
+    employee_ids = np.fromiter((employee_id for employee_id, _time in punches), dtype=np.int64, count=count)
+
+    # Wall clock times in the operating timezone and their UTC offsets. The
+    # naive times are localized once per distinct minute, timezone
+    # transitions never happen within a minute.
+    aware = [index for index, (_id, punch_time) in enumerate(punches) if punch_time.tzinfo is not None]
+    local_times = [punch_time for _id, punch_time in punches]
+    offsets = np.zeros(count, dtype=np.int64)
+    for index in aware:
+        local_dt = local_times[index].astimezone(operating_tz)
+        local_times[index] = local_dt.replace(tzinfo=None)
+        offsets[index] = local_dt.utcoffset() // MICROSECOND
+    wall = np.array(local_times, dtype='datetime64[us]').astype(np.int64)
+    naive = np.ones(count, dtype=bool)
+    naive[aware] = False
+    if naive.any():
+        minutes, inverse = np.unique(wall[naive] // MINUTE_US, return_inverse=True)
+        minute_offsets = np.array([
+            operating_tz.localize(EPOCH + timedelta(minutes=int(minute)), is_dst=None).utcoffset() // MICROSECOND
+            for minute in minutes], dtype=np.int64)
+        offsets[naive] = minute_offsets[inverse]
+    utc = wall - offsets
+    days = wall // DAY_US
+
+    # Workday: the previous day when the punch closes its night shift
+    day_keys, day_inverse = np.unique(np.stack([employee_ids, days], axis=1), axis=0, return_inverse=True)
+    night_limits = np.full(len(day_keys), np.iinfo(np.int64).min, dtype=np.int64)
+    for index, (employee_id, day) in enumerate(day_keys.tolist()):
+        prev_shift = get_shift(employee_id, EPOCH_DATE + timedelta(days=day - 1))
+        if prev_shift and not prev_shift.get('is_holiday') and prev_shift['is_night_shift']:
+            night_limits[index] = _aware_to_us(prev_shift['end_local'] + NIGHT_SHIFT_GRACE)
+    workdays = days - (utc <= night_limits[day_inverse.ravel()])
+
+    # First and last punch, and number of punches, per employee workday
+    group_keys, group_inverse = np.unique(np.stack([employee_ids, workdays], axis=1), axis=0,
+                                          return_inverse=True)
+    group_inverse = group_inverse.ravel()
+    order = np.lexsort((utc, group_inverse))
+    sorted_utc = utc[order]
+    starts = np.flatnonzero(np.r_[True, group_inverse[order][1:] != group_inverse[order][:-1]])
+    ends = np.r_[starts[1:], count] - 1
+    first = sorted_utc[starts]
+    last = sorted_utc[ends]
+    has_check_out = ends > starts
+
+    # Shift windows of the workdays
+    group_count = len(group_keys)
+    is_holiday = np.zeros(group_count, dtype=bool)
+    has_break = np.zeros(group_count, dtype=bool)
+    shift_start = np.zeros(group_count, dtype=np.int64)
+    shift_end = np.zeros(group_count, dtype=np.int64)
+    break_from = np.zeros(group_count, dtype=np.int64)
+    break_to = np.zeros(group_count, dtype=np.int64)
+    planned = np.zeros(group_count, dtype=np.float64)
+    workday_dates = []
+    for index, (employee_id, workday) in enumerate(group_keys.tolist()):
+        workday = EPOCH_DATE + timedelta(days=workday)
+        workday_dates.append(workday)
+        shift = get_shift(employee_id, workday) or HOLIDAY_SHIFT
+        planned[index] = shift.get('planned_work_hours', 0.0)
+        if shift.get('is_holiday'):
+            is_holiday[index] = True
+            continue
+        shift_start[index] = _aware_to_us(shift['start_local'])
+        shift_end[index] = _aware_to_us(shift['end_local'])
+        if shift.get('break_from_local') and shift.get('break_to_local'):
+            has_break[index] = True
+            break_from[index] = _aware_to_us(shift['break_from_local'])
+            break_to[index] = _aware_to_us(shift['break_to_local'])
+
+    # Only the part of the break inside the worked period is deducted
+    overlap = np.where(has_break, np.minimum(last, break_to) - np.maximum(first, break_from), 0)
+    overlap = np.maximum(overlap, 0)
+    total_seconds = (last - first) / 10 ** 6
+    worked_hours = np.where(is_holiday, total_seconds, total_seconds - overlap / 10 ** 6) / 3600.0
+    extra_hours = worked_hours - planned
+    missed_closed = ~has_check_out & (_to_us(now) >= first + int(MISSED_CHECKOUT_HOURS * 3600 * 10 ** 6))
+    checkin_flags = np.select([first < shift_start, first > shift_start], [1, 2], 0)
+    checkout_flags = np.select([last < shift_end, last > shift_end], [1, 2], 0)
+    hours_flags = np.select([extra_hours < -EXTRA_HOURS_MARGIN, extra_hours > EXTRA_HOURS_MARGIN], [1, 2], 0)
+
+    results = {}
+    for index, (employee_id, _workday) in enumerate(group_keys.tolist()):
+        check_in = _from_us(first[index])
+        result = {
+            "employee_id": employee_id,
+            "date": check_in.date(),
+            "check_in": check_in,
+            "check_out": _from_us(last[index]) if has_check_out[index] else None,
+            "status": [],
+            "worked_hours": 0.0,
+            "extra_hours": 0.0,
+            "has_punches": True,
+        }
+        if is_holiday[index]:
+            if has_check_out[index]:
+                hours = round(float(worked_hours[index]), 2)
+                result.update({"status": ["Holiday Work", "extra_hours"], "worked_hours": hours,
+                               "extra_hours": hours})
+            else:
+                result["status"] = ["Missed checkout"]
+        elif has_check_out[index]:
+            result["worked_hours"] = round(float(worked_hours[index]), 2)
+            result["extra_hours"] = round(float(extra_hours[index]), 2)
+            result["status"] = [flag for flag in (
+                (None, "early_checkin", "late_checkin")[checkin_flags[index]],
+                (None, "early_checkout", "late_checkout")[checkout_flags[index]],
+                (None, "less_hours", "extra_hours")[hours_flags[index]],
+            ) if flag]
+        else:
+            result["status"] = ["Missed checkout"]
+            if missed_closed[index]:
+                result["check_out"] = check_in + timedelta(hours=MISSED_CHECKOUT_HOURS)
+                result["worked_hours"] = MISSED_CHECKOUT_HOURS
+                result["extra_hours"] = round(MISSED_CHECKOUT_HOURS - float(planned[index]), 2)
+        results[(employee_id, workday_dates[index])] = result
+    return results
@@ -1,18 +1,71 @@
 # hr_zk_attendance/models/biometric_device_details.py
+import hmac
+import ipaddress
 import logging
+import secrets
+import struct
+import threading
 import pytz
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import timedelta, datetime, time
+from time import monotonic
 from odoo import api, fields, models, _
 from odoo.exceptions import UserError, ValidationError
-from . import sample_punches
+from . import attendance_engine, sample_punches
+from .biometric_sync_run import SyncStageTimer
+from .res_company import ATTENDANCE_NOTIFICATION_MODES
+from .sync_metrics import sync_metrics
+from .zk_live_capture import LiveCaptureListener
 from markupsafe import Markup
 
 _logger = logging.getLogger(__name__)
 try:
-    from zk import ZK
+    from zk import ZK, const
+    from zk.attendance import Attendance
 except ImportError:
     _logger.error("Please Install pyzk library.")
 
+DEFAULT_DOWNLOAD_WORKERS = 4
+DEFAULT_LIVE_CAPTURE_WINDOW = 50
+DEFAULT_LIVE_CAPTURE_WORKERS = 8
+# A live device whose listener was silent for longer is polled again
+LIVE_STALE_AFTER = timedelta(minutes=5)
+# Layout of the 40 byte attendance records of the uFace/ZK6 firmwares
+ATTLOG_RECORD_SIZE = 40
+ATTLOG_RECORD_FORMAT = '<H24sB4sB8s'
+# Key of the attendance notifications queued in the cursor callbacks data
+NOTIFICATION_QUEUE_KEY = 'hr_zk_attendance.attendance_notifications'
+# Statuses notified to the attendance managers, with their digest label
+ATTENDANCE_NOTIFICATION_STATUSES = {
+    'early_checkin': "Early check-in",
+    'late_checkin': "Late check-in",
+    'Missed checkin': "Missed check-in, first log",
+    'early_checkout': "Early check-out",
+    'late_checkout': "Late check-out",
+    'Missed checkout': "Missed check-out, auto-checked out",
+}
+
+
+class DevicePunch:
+    """A punch not read through pyzk (sample data, push uploads)"""
+
+    def __init__(self, user_id, timestamp, status=1, punch=0):
+        self.user_id = user_id
+        self.timestamp = timestamp
+        self.status = status
+        self.punch = punch
+
+
+def _decode_zk_time(raw):
+    """Decode a packed device timestamp (see zkemsdk.c - DecodeTime)"""
+    t = struct.unpack('<I', raw)[0]
+    second, t = t % 60, t // 60
+    minute, t = t % 60, t // 60
+    hour, t = t % 24, t // 24
+    day, t = t % 31 + 1, t // 31
+    month, t = t % 12 + 1, t // 12
+    return datetime(t + 2000, month, day, hour, minute, second)
+
 
 class BiometricDeviceDetails(models.Model):
     """Model for configuring and connect the biometric device with odoo"""
@@ -21,10 +74,12 @@ class BiometricDeviceDetails(models.Model):
     _description = 'Biometric Device Details'
 
     name = fields.Char(string='Name', required=True, help='Record Name')
-    device_ip = fields.Char(string='Device IP', required=True,
+    device_ip = fields.Char(string='Device IP',
                             help='The IP address of the Device')
-    port_number = fields.Integer(string='Port Number', required=True,
+    port_number = fields.Integer(string='Port Number',
                                  help="The Port Number of the Device")
+    serial_number = fields.Char(string='Serial Number', index=True, copy=False,
+                                help="Serial number (SN) the device reports when pushing its logs")
     address_id = fields.Many2one('res.partner', string='Working Address',
                                  help='Working address of the partner')
     company_id = fields.Many2one('res.company', string='Company',
@@ -35,6 +90,44 @@ class BiometricDeviceDetails(models.Model):
                                   help="The number of past days to sync attendance for. Set to 0 to sync all records.")
     last_download_time = fields.Datetime(string="Last Download Time",
                                          help="The last time attendance data was downloaded from this device.")
+    last_record_count = fields.Integer(string="Downloaded Records", readonly=True, copy=False,
+                                       help="Number of records of the device log that were already downloaded. "
+                                            "Only the records after this watermark are processed on the next download.")
+    sync_mode = fields.Selection([('poll', 'Polling'), ('live', 'Live Capture'),
+                                  ('push', 'ADMS Push')],
+                                 string="Sync Mode", default='poll', required=True,
+                                 help="Polling downloads the attendance log with the scheduled download. "
+                                      "Live Capture keeps a listener connected to the device and imports "
+                                      "punches as they happen, falling back to polling when the listener "
+                                      "is not running. ADMS Push devices upload their logs to "
+                                      "/iclock/cdata themselves and are never polled.")
+    live_heartbeat = fields.Datetime(string="Listener Heartbeat", readonly=True, copy=False,
+                                     help="Last time the live capture listener reported activity.")
+    push_token = fields.Char(string="Push Token", copy=False, groups='hr_attendance.group_hr_attendance_manager',
+                             help="Secret a push device (or the reverse proxy in front of Odoo) must send "
+                                  "as the token query parameter or the X-Push-Token header.")
+    push_allowed_networks = fields.Char(string="Allowed Push Networks",
+                                        help="Comma separated IP addresses or networks (CIDR) the device "
+                                             "may push from, e.g. 10.0.5.12, 192.168.1.0/24.")
+    push_stamp = fields.Char(string="Push Log Stamp", readonly=True, copy=False,
+                             help="Stamp of the last attendance log upload acknowledged to the device.")
+    sync_run_line_ids = fields.One2many('biometric.sync.run.line', 'device_id', string="Sync Runs",
+                                        readonly=True)
+    notification_mode = fields.Selection(ATTENDANCE_NOTIFICATION_MODES, string="Notifications",
+                                         help="How the irregular punches downloaded from this device are "
+                                              "notified. Leave empty to use the setting of the company.")
+
+    _sql_constraints = [
+        ('serial_number_uniq', 'unique(serial_number)',
+         'A device with this serial number already exists.'),
+    ]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        devices = super().create(vals_list)
+        for device in devices.sudo().filtered(lambda d: not d.push_token):
+            device.push_token = secrets.token_urlsafe(24)
+        return devices
 
     def device_connect(self, zk):
         """Function for connecting the device with Odoo"""
@@ -42,6 +135,7 @@ class BiometricDeviceDetails(models.Model):
             return zk.connect()
         except Exception as e:
             _logger.error(f"Failed to connect to device: {e}")
+            sync_metrics.inc_connect_failure(self[:1].name or 'unknown')
             return False
 
     def action_test_connection(self):
@@ -107,7 +201,9 @@ class BiometricDeviceDetails(models.Model):
                 try:
                     conn.enable_device()
                     conn.clear_attendance()
-                    self._cr.execute("""delete from zk_machine_attendance""")
+                    # Only the punches downloaded from this device
+                    self.env['zk.machine.attendance']._purge_punches(device_ids=info.ids)
+                    info.last_record_count = 0
                     conn.disconnect()
                 except Exception as e:
                     raise UserError(
@@ -115,6 +211,17 @@ class BiometricDeviceDetails(models.Model):
             else:
                 raise UserError(_('Unable to connect to Attendance Device.'))
 
+    def action_open_purge_wizard(self):
+        """Open the wizard purging the punches of the devices"""
+        return {
+            'type': 'ir.actions.act_window',
+            'name': _('Purge Punches'),
+            'res_model': 'zk.attendance.purge.wizard',
+            'view_mode': 'form',
+            'target': 'new',
+            'context': {'default_device_ids': self.ids},
+        }
+
     def action_restart_device(self):
         """For restarting the device"""
         zk = ZK(self.device_ip, port=self.port_number, timeout=30)
@@ -124,204 +231,275 @@ class BiometricDeviceDetails(models.Model):
 
     @api.model
     def cron_download(self):
-        """Cron job to download attendance data from all configured devices."""
-        machines = self.env['biometric.device.details'].search([])
-        for machine in machines:
-            machine.action_download_attendance()
-
-    def action_download_attendance(self):
-        use_sample_data = False
-        _logger.info("--- Starting attendance download ---")
+        """Cron job to download attendance data from all configured devices.
 
+        When more than one download worker is configured, the devices are
+        fetched concurrently and the downloaded logs are then ingested one
+        device after the other in the cron's own transaction.
+        """
+        machines = self.env['biometric.device.details'].search([])
+        machines = machines.filtered(
+            lambda m: m.sync_mode == 'poll' or (m.sync_mode == 'live' and m._is_live_capture_stale()))
+        machines._download_attendance('cron')
+
+    def _download_attendance(self, trigger):
+        """Download and ingest the attendance of the devices as one sync run.
+
+        The devices are fetched concurrently when more than one download
+        worker is configured, the downloaded logs are then ingested one
+        device after the other in the caller's transaction. A device that
+        fails is recorded as such on the run without stopping the others.
+        """
+        started = monotonic()
+        run = self.env['biometric.sync.run']._start(trigger)
+        timers = {device.id: SyncStageTimer() for device in self}
+        max_workers = self._get_download_max_workers()
+        if max_workers > 1 and len(self) > 1:
+            _logger.info(f"--- Starting parallel attendance download ({max_workers} workers) ---")
+            attendance_by_device = self._fetch_attendance_parallel(max_workers, timers)
+        else:
+            attendance_by_device = {}
         for device in self:
-            attendance_data = []
-            if use_sample_data:
-                _logger.info("Using sample data from 'sample_punches.py'.")
-                class SampleAttendance:
-                    def __init__(self, att_dict):
-                        self.user_id = att_dict.get('user_id')
-                        self.timestamp = att_dict.get('timestamp')
-                        self.status = att_dict.get('status', 1)
-                        self.punch = att_dict.get('punch', 0)
-                attendance_data = [SampleAttendance(p) for p in sample_punches.data]
-            else:
-                zk = ZK(device.device_ip, port=device.port_number, timeout=30)
-                conn = device.device_connect(zk)
-                if conn:
-                    conn.disable_device()
-                    attendance_data = conn.get_attendance()
-                    conn.enable_device()
-                    conn.disconnect()
-
-            if not attendance_data:
-                _logger.warning("No new attendance data found to process.")
-                continue
-
-<<<<<<< HEAD
-            # **FIX**: Set the last download time before filtering
-            latest_punch_time = max(att.timestamp for att in attendance_data)
-
-            if device.last_download_time:
-                start_filter_time = device.last_download_time
-                attendance_data = [att for att in attendance_data if att.timestamp > start_filter_time]
-
-            # **FIX**: Update the last download time regardless of whether new records are processed
-            device.last_download_time = latest_punch_time
-
-            if not attendance_data:
-                _logger.warning("No new attendance data found after filtering.")
-                continue
-
-            zk_attendance = self.env['zk.machine.attendance']
-            operating_tz_str = self.env.user.tz or 'UTC'
-            operating_tz = pytz.timezone(operating_tz_str)
-
-            punches_by_workday = {}
-
-            for punch in sorted(attendance_data, key=lambda p: p.timestamp):
-                employee = self.env['hr.employee'].search([('device_id_num', '=', str(punch.user_id))], limit=1)
-                if not employee:
-                    continue
-                
-                raw_dt = punch.timestamp
-                if getattr(raw_dt, 'tzinfo', None) is None:
-                    local_dt = operating_tz.localize(raw_dt, is_dst=None)
-                else:
-                    local_dt = raw_dt.astimezone(operating_tz)
+            timer = timers[device.id]
+            try:
+                with self.env.cr.savepoint():
+                    if device.id in attendance_by_device:
+                        attendance_data, record_count = attendance_by_device[device.id]
+                    else:
+                        attendance_data, record_count = device._fetch_attendance_data(timer)
+                    device._ingest_attendance_data(attendance_data, record_count, timer)
+            except Exception as e:
+                _logger.error(f"Failed to synchronize attendance of device {device.name}: {e}")
+                timer.error = str(e)
+            run._add_device_result(device, timer)
+            sync_metrics.observe_sync(device.name, timer.elapsed, failed=bool(timer.error))
+        run._finish(started)
+        return run
+
+    def _get_download_max_workers(self):
+        """Maximum number of devices the cron downloads from at the same time"""
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'hr_zk_attendance.download_max_workers', DEFAULT_DOWNLOAD_WORKERS)
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return DEFAULT_DOWNLOAD_WORKERS
+
+    def _fetch_attendance_parallel(self, max_workers, timers):
+        """Fetch the attendance logs of the devices in a bounded thread pool.
+
+        Every worker thread opens its own cursor and environment, so a slow
+        or unreachable device only blocks its own worker. Returns a dict
+        mapping the device id to the result of _fetch_attendance_data,
+        timers maps the device ids to their SyncStageTimer.
+        """
+        call = self._get_threaded_device_call()
+        attendance_by_device = {}
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(self)),
+                                thread_name_prefix='zk_download') as executor:
+            futures = {executor.submit(call, device.id, '_fetch_attendance_data', timers[device.id]): device
+                       for device in self}
+            for future in as_completed(futures):
+                device = futures[future]
+                try:
+                    attendance_by_device[device.id] = future.result()
+                except Exception as e:
+                    _logger.error(f"Failed to download attendance from device {device.name}: {e}")
+                    timers[device.id].error = str(e)
+                    attendance_by_device[device.id] = ([], None)
+        return attendance_by_device
 
-                utc_dt = local_dt.astimezone(pytz.utc)
+    @api.model
+    def cron_live_capture(self):
+        """Cron job running the live capture listeners of the live devices.
+
+        Every listener stays connected for the configured window (a bit
+        shorter than the cron interval) and the cron starts a new session
+        afterwards. Each session first catches up on the punches stored
+        on the device in the meantime.
+        """
+        devices = self.env['biometric.device.details'].search([('sync_mode', '=', 'live')])
+        if not devices:
+            return
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'hr_zk_attendance.live_capture_window', DEFAULT_LIVE_CAPTURE_WINDOW)
+        try:
+            window = max(1, int(value))
+        except (TypeError, ValueError):
+            window = DEFAULT_LIVE_CAPTURE_WINDOW
+
+        # Every listener holds a thread and a cursor for the whole window
+        max_workers = self._get_live_capture_max_workers()
+        if len(devices) > max_workers:
+            _logger.warning(f"Live capture is limited to {max_workers} devices, "
+                            f"{', '.join(devices[max_workers:].mapped('name'))} fall back to polling.")
+            devices = devices[:max_workers]
+
+        call = devices._get_threaded_device_call()
+        deadline = monotonic() + window
+        listeners = [LiveCaptureListener(call, device.id, device.name, device.device_ip,
+                                         device.port_number, deadline)
+                     for device in devices]
+        with ThreadPoolExecutor(max_workers=len(listeners), thread_name_prefix='zk_live') as executor:
+            futures = {executor.submit(listener.run): listener for listener in listeners}
+            for future in as_completed(futures):
+                try:
+                    future.result()
+                except Exception as e:
+                    _logger.error(f"Live capture listener of device {futures[future].device_name} failed: {e}")
 
-                atten_time = fields.Datetime.to_string(utc_dt)
+    def _get_live_capture_max_workers(self):
+        """Maximum number of devices with a live capture listener at the same time"""
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'hr_zk_attendance.live_capture_max_workers', DEFAULT_LIVE_CAPTURE_WORKERS)
+        try:
+            return max(1, int(value))
+        except (TypeError, ValueError):
+            return DEFAULT_LIVE_CAPTURE_WORKERS
 
-                existing_punch = zk_attendance.search([
-                    ('employee_id', '=', employee.id),
-                    ('punching_time', '=', atten_time)
-                ], limit=1)
-
-                if not existing_punch:
-                    zk_attendance.create({
-                        'employee_id': employee.id,
-                        'device_id_num': str(punch.user_id),
-                        'punch_type': str(punch.punch),
-                        'attendance_type': str(punch.status),
-                        'punching_time': atten_time,
-                        'address_id': device.address_id.id,
-                    })
-
-                workday = self._get_workday_for_punch(employee, local_dt, operating_tz)
-                if not workday:
-                    _logger.warning(f"Could not determine workday for punch at {local_dt} for employee {employee.name}")
-                    continue
+    @api.model
+    def _get_newest_punch_ages(self):
+        """
+        Age in seconds of the newest punch downloaded from each device. The
+        download time is the device clock, read in the timezone of the
+        scheduled download user like the punches themselves.
+        """
+        cron = self.env.ref('hr_zk_attendance.cron_download_data', raise_if_not_found=False)
+        operating_tz = pytz.timezone((cron and cron.sudo().user_id.tz) or 'UTC')
+        now = datetime.now(operating_tz).replace(tzinfo=None)
+        return {
+            device['name']: (now - device['last_download_time']).total_seconds()
+            for device in self.sudo().search_read([('last_download_time', '!=', False)],
+                                                  ['name', 'last_download_time'])
+        }
 
-                punches_by_workday.setdefault((employee.id, workday), []).append({
-                    "timestamp": utc_dt.replace(tzinfo=None),
-                    "local_time": local_dt
-                })
-            
-            # FIXED LOGIC: Iterate directly over the grouped punches
-            for (employee_id, workday), punches in punches_by_workday.items():
-                employee = self.env['hr.employee'].browse(employee_id)
-                shift = employee._get_employee_shift_for_day(workday, operating_tz)
-                if not shift:
-                    # This case handles when an employee has a punch, but no shift or holiday is defined for that day.
-                    # We will treat this as a holiday work day.
-                    shift = {
-                        'is_holiday': True,
-                        'planned_work_hours': 0.0,
-                    }
-                    
-                punch_timestamps = [p["timestamp"] for p in punches]
-                
-                result = self.process_attendance(punch_timestamps, employee, shift, operating_tz)
-                self._create_or_update_attendance(result, employee, self.env['hr.attendance'])
+    def _is_live_capture_stale(self):
+        """Whether the live listener of the device stopped reporting"""
+        self.ensure_one()
+        return not self.live_heartbeat or \
+            fields.Datetime.now() - self.live_heartbeat > LIVE_STALE_AFTER
 
+    def _live_catch_up(self):
+        """Download what the device stored while no listener was running"""
+        self._ingest_attendance_data(*self._fetch_attendance_data())
+        self._touch_live_heartbeat()
 
-            _logger.info("--- Attendance download finished ---")
+    def _ingest_live_punches(self, punches):
+        """Ingest a micro-batch of punches received from the live capture"""
+        self._ingest_attendance_data(punches)
+        self._touch_live_heartbeat()
 
-=======
-            if device.last_download_time:
-                attendance_data = [att for att in attendance_data if att.timestamp > device.last_download_time]
+    def _touch_live_heartbeat(self):
+        self.live_heartbeat = fields.Datetime.now()
 
-            if not attendance_data:
-                _logger.warning("No new attendance data found after filtering.")
+    @api.constrains('push_allowed_networks')
+    def _check_push_allowed_networks(self):
+        for device in self:
+            try:
+                device._get_push_networks()
+            except ValueError as e:
+                raise ValidationError(_("Invalid allowed push network: %s", e))
+
+    def _get_push_networks(self):
+        return [ipaddress.ip_network(network.strip(), strict=False)
+                for network in (self.push_allowed_networks or '').split(',') if network.strip()]
+
+    def _check_push_request(self, token, remote_addr):
+        """
+        Whether a push request comes from the device: it must carry the push
+        token when one is set and come from an allowed network when some are
+        configured. A device with neither configured accepts no push at all.
+        """
+        self.ensure_one()
+        device = self.sudo()
+        networks = device._get_push_networks()
+        if not device.push_token and not networks:
+            return False
+        if device.push_token and not (token and hmac.compare_digest(token, device.push_token)):
+            return False
+        if networks:
+            try:
+                address = ipaddress.ip_address(remote_addr or '')
+            except ValueError:
+                return False
+            if not any(address in network for network in networks):
+                return False
+        return True
+
+    def action_generate_push_token(self):
+        """Replace the push token, the device must then be configured with the new one"""
+        for device in self:
+            device.push_token = secrets.token_urlsafe(24)
+
+    def _ingest_push_attlog(self, payload, stamp=None):
+        """Ingest an ATTLOG upload of the push (ADMS/iclock) protocol.
+
+        Every line holds PIN, time, punch state and verify mode separated
+        by tabs. The punches are ingested as the scheduled download user,
+        so that they are localized like downloaded ones, and whatever the
+        last download time. Returns the number of records read from the
+        payload, to be acknowledged to the device.
+        """
+        self.ensure_one()
+        punches = []
+        for line in payload.splitlines():
+            values = line.strip().split('\t')
+            if len(values) < 2 or not values[0]:
                 continue
+            try:
+                timestamp = datetime.strptime(values[1].strip(), '%Y-%m-%d %H:%M:%S')
+                punch = int(values[2]) if len(values) > 2 and values[2] else 0
+                status = int(values[3]) if len(values) > 3 and values[3] else 1
+            except ValueError:
+                _logger.warning(f"Skipping malformed ATTLOG line from device {self.name}: {line!r}")
+                continue
+            punches.append(DevicePunch(values[0].strip(), timestamp, status, punch))
+
+        cron = self.env.ref('hr_zk_attendance.cron_download_data', raise_if_not_found=False)
+        device = self.with_user(cron.sudo().user_id) if cron else self
+        # Devices upload again or out of order, the unique punch index makes that harmless
+        device._ingest_attendance_data(punches, filter_downloaded=False)
+        if stamp:
+            self.push_stamp = stamp
+        return len(punches)
+
+    def _get_threaded_device_call(self):
+        """Return a function calling a device method in a new cursor.
+
+        Worker threads must never share the cursor of the environment they
+        were started from, so each call opens and commits its own one.
+        """
+        registry = self.env.registry
+        dbname = self.env.cr.dbname
+        uid = self.env.uid
+        context = dict(self.env.context)
+
+        def call(device_id, method, *args):
+            threading.current_thread().dbname = dbname
+            with registry.cursor() as cr:
+                env = api.Environment(cr, uid, context)
+                device = env['biometric.device.details'].browse(device_id)
+                return getattr(device, method)(*args)
+        return call
 
-            zk_attendance = self.env['zk.machine.attendance']
-            # Get operating timezone from user preferences or default to UTC
-            operating_tz_str = self.env.user.tz or 'UTC'
-            operating_tz = pytz.timezone(operating_tz_str)
-
-            punches_by_workday = {}
-
-            for punch in sorted(attendance_data, key=lambda p: p.timestamp):
-                employee = self.env['hr.employee'].search([('device_id_num', '=', str(punch.user_id))], limit=1)
-                if not employee:
-                    continue
-
-                # Convert device timestamp to local timezone
-                raw_dt = punch.timestamp
-                if getattr(raw_dt, 'tzinfo', None) is None:
-                    local_dt = operating_tz.localize(raw_dt, is_dst=None)
-                else:
-                    local_dt = raw_dt.astimezone(operating_tz)
-
-                # Convert to UTC for database storage
-                utc_dt = local_dt.astimezone(pytz.utc)
-                utc_str = fields.Datetime.to_string(utc_dt)
-                local_day = local_dt.date()
-
-                # Save raw punch data
-                existing_punch = zk_attendance.search([
-                    ('employee_id', '=', employee.id),
-                    ('punching_time', '=', utc_str)
-                ], limit=1)
-
-                if not existing_punch:
-                    zk_attendance.create({
-                        'employee_id': employee.id,
-                        'device_id_num': str(punch.user_id),
-                        'punch_type': str(punch.punch),
-                        'attendance_type': str(punch.status),
-                        'punching_time': utc_str,
-                        'address_id': device.address_id.id,
-                    })
-
-                # Group punches by employee and workday
-                workday = self._get_workday_for_punch(employee, local_dt, operating_tz)
-                if not workday:
-                    _logger.warning(f"Could not determine workday for punch at {local_dt} for employee {employee.name}")
-                    continue
-
-                punches_by_workday.setdefault((employee.id, workday), []).append({
-                    "timestamp": utc_dt.replace(tzinfo=None),  # Store as naive datetime for processing
-                    "local_time": local_dt
-                })
-
-            # Process all punches
-            all_workdays = set(day for (_, day) in punches_by_workday.keys())
-            all_employees = self.env['hr.employee'].browse(list(set(emp_id for (emp_id, _) in punches_by_workday.keys())))
-
-            for employee in all_employees:
-                for workday in all_workdays:
-                    # **FIX**: Pass the entire shift dictionary from the employee model
-                    shift = employee._get_employee_shift_for_day(workday, operating_tz)
-                    if not shift:
-                        continue
-
-                    # Get punches for this employee and workday
-                    punches = [punch_data["timestamp"] for punch_data in punches_by_workday.get((employee.id, workday), [])]
-
-                    # Process attendance
-                    result = self.process_attendance(punches, employee, shift, operating_tz)
-                    self._create_or_update_attendance(result, employee, self.env['hr.attendance'])
-
-            # Update last download time
-            if attendance_data:
-                device.last_download_time = max(att.timestamp for att in attendance_data)
-
-            _logger.info("--- Attendance download finished ---")
+    def action_download_attendance(self):
+        _logger.info("--- Starting attendance download ---")
+        run = self._download_attendance('manual')
+        failed_lines = run.line_ids.filtered(lambda line: line.state == 'failed')
+        if failed_lines:
+            # Not raised: the run and the punches of the other devices must be kept
+            return {
+                'type': 'ir.actions.client',
+                'tag': 'display_notification',
+                'params': {
+                    'title': _('Attendance download failed'),
+                    'message': '\n'.join(f"{line.device_id.name}: {line.error}" for line in failed_lines),
+                    'type': 'warning',
+                    'sticky': True,
+                    'next': {'type': 'ir.actions.client', 'tag': 'reload'},
+                }
+            }
 
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
         return {
             'type': 'ir.actions.client',
             'tag': 'display_notification',
@@ -334,425 +512,430 @@ class BiometricDeviceDetails(models.Model):
             }
         }
 
-    def _get_workday_for_punch(self, employee, punch_time_local, operating_tz):
-        """Determine the workday for a punch, handling night shifts"""
-        punch_date = punch_time_local.date()
-
-        # Check if this punch belongs to previous day's night shift
-        prev_date = punch_date - timedelta(days=1)
-<<<<<<< HEAD
-        prev_shift = employee._get_employee_shift_for_day(prev_date, operating_tz)
-        if prev_shift and not prev_shift.get('is_holiday') and prev_shift['is_night_shift'] and punch_time_local <= (prev_shift['end_local'] + timedelta(hours=4)):
-            return prev_date
-
-        # Check current day's shift
-        current_shift = employee._get_employee_shift_for_day(punch_date, operating_tz)
-        if current_shift and not current_shift.get('is_holiday') and punch_time_local >= (current_shift['start_local'] - timedelta(hours=3)):
-=======
-        # **FIX**: Use employee method
-        prev_shift = employee._get_employee_shift_for_day(prev_date, operating_tz)
-        if prev_shift and prev_shift['is_night_shift'] and punch_time_local <= (prev_shift['end_local'] + timedelta(hours=4)):
-            return prev_date
-
-        # Check current day's shift
-        # **FIX**: Use employee method
-        current_shift = employee._get_employee_shift_for_day(punch_date, operating_tz)
-        if current_shift and punch_time_local >= (current_shift['start_local'] - timedelta(hours=3)):
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
-            return punch_date
-
-        return punch_date
-
-    def process_attendance(self, punches, employee, shift, tz):
-        """Process punches of one employee for one day"""
-        punches = sorted(punches)
-        check_in = None
-        check_out = None
-        status_flags = []
-
-<<<<<<< HEAD
-        # FIXED LOGIC: Consistently get first and last punch for check-in/out
-        if punches:
-            check_in = punches[0]
-            check_out = punches[-1] if len(punches) > 1 else None
-        else:
-            return {"has_punches": False}
-
-        results = {
-            "employee_id": employee.id,
-            "date": punches[0].date(),
-            "check_in": check_in,
-            "check_out": check_out,
-            "status": [],
-            "worked_hours": 0.0,
-            "extra_hours": 0.0,
-            "has_punches": bool(punches),
-        }
-
-        # Handle cases without a defined shift (holiday or no worksheet)
-        if shift.get('is_holiday'):
-            if check_in and check_out:
-                worked_hours = (check_out - check_in).total_seconds() / 3600.0
-                results.update({
-                    "status": ["Holiday Work", "extra_hours"],
-                    "worked_hours": round(worked_hours, 2),
-                    "extra_hours": round(worked_hours, 2),
-                })
-            elif check_in and not check_out:
-                results["status"].append("Missed checkout")
-            return results
-
-
-        shift_start_utc = shift['start_local'].astimezone(pytz.utc).replace(tzinfo=None)
-        shift_end_utc = shift['end_local'].astimezone(pytz.utc).replace(tzinfo=None)
-        break_from_utc = shift.get('break_from_local').astimezone(pytz.utc).replace(tzinfo=None) if shift.get('break_from_local') else None
-        break_to_utc = shift.get('break_to_local').astimezone(pytz.utc).replace(tzinfo=None) if shift.get('break_to_local') else None
-
-        planned_hours = shift.get('planned_work_hours', 0.0)
-
-        # FIXED LOGIC: Now process attendance based on first/last punch
-        if check_in and check_out:
-            if check_out < check_in:
-                check_out = shift_end_utc
-                status_flags.append("invalid_order_fixed")
-
-            # Calculate break overlap
-            break_overlap_seconds = 0
-            if break_from_utc and break_to_utc:
-                overlap_start = max(check_in, break_from_utc)
-                overlap_end = min(check_out, break_to_utc)
-                if overlap_end > overlap_start:
-                    break_overlap_seconds = (overlap_end - overlap_start).total_seconds()
-
-            total_duration_seconds = (check_out - check_in).total_seconds()
-            worked_seconds = total_duration_seconds - break_overlap_seconds
-            worked_hours = worked_seconds / 3600.0
-            results["worked_hours"] = round(worked_hours, 2)
-
-            extra_hours = worked_hours - planned_hours
-            results["extra_hours"] = round(extra_hours, 2)
-
-            if check_in < shift_start_utc:
-                status_flags.append("early_checkin")
-            elif check_in > shift_start_utc:
-                status_flags.append("late_checkin")
-
-            if check_out < shift_end_utc:
-                status_flags.append("early_checkout")
-            elif check_out > shift_end_utc:
-                status_flags.append("late_checkout")
-
-            if extra_hours < -0.1:
-                status_flags.append("less_hours")
-            elif extra_hours > 0.1:
-                status_flags.append("extra_hours")
-
-        elif check_in and not check_out:
-            status_flags.append("Missed checkout")
-            if datetime.now() >= check_in + timedelta(hours=18):
-                check_out = check_in + timedelta(hours=18)
-                results["check_out"] = check_out
-                worked_hours = 18.0
-                results["worked_hours"] = worked_hours
-                extra_hours = worked_hours - planned_hours
-                results["extra_hours"] = round(extra_hours, 2)
-
-        elif check_out and not check_in:
-            status_flags.append("Missed checkin")
-            check_in = shift_start_utc
-            results["check_in"] = check_in
-            worked_hours = (check_out - check_in).total_seconds() / 3600.0
-            results["worked_hours"] = round(worked_hours, 2)
-            extra_hours = worked_hours - planned_hours
-            results["extra_hours"] = round(extra_hours, 2)
-            if extra_hours > 0.1:
-                 status_flags.append("extra_hours")
+    def _fetch_attendance_data(self, timer=None):
+        """Download the new records of the attendance log of one device.
 
+        Returns the attendance records and the record count of the device
+        log, to be stored as the new watermark (None when unknown).
+        """
+        self.ensure_one()
+        timer = timer or SyncStageTimer()
+        use_sample_data = False
+        attendance_data = []
+        record_count = None
+        if use_sample_data:
+            _logger.info("Using sample data from 'sample_punches.py'.")
+            attendance_data = [DevicePunch(p.get('user_id'), p.get('timestamp'),
+                                           p.get('status', 1), p.get('punch', 0))
+                               for p in sample_punches.data]
         else:
-            status_flags.append("absent")
-
-=======
-        shift_start_utc = shift['start_local'].astimezone(pytz.utc).replace(tzinfo=None)
-        shift_end_utc = shift['end_local'].astimezone(pytz.utc).replace(tzinfo=None)
-        break_from_utc = shift.get('break_from_local').astimezone(pytz.utc).replace(tzinfo=None) if shift.get('break_from_local') else None
-        break_to_utc = shift.get('break_to_local').astimezone(pytz.utc).replace(tzinfo=None) if shift.get('break_to_local') else None
-
-        planned_hours = shift.get('planned_work_hours', 0.0)
-
-        if len(punches) == 1:
-            punch_time = punches[0]
-            if abs(punch_time - shift_start_utc) <= abs(punch_time - shift_end_utc):
-                check_in = punch_time
+            with timer.stage('connect'):
+                zk = ZK(self.device_ip, port=self.port_number, timeout=30)
+                conn = self.device_connect(zk)
+            if conn:
+                with timer.stage('fetch'):
+                    conn.disable_device()
+                    conn.read_sizes()
+                    record_count = conn.records
+                    # A smaller log than the watermark means it was cleared on the device
+                    watermark = self.last_record_count if record_count >= self.last_record_count else 0
+                    if record_count == watermark:
+                        _logger.info(f"No new records on device {self.name} ({record_count} stored).")
+                    else:
+                        attendance_data = self._read_attendance_records(conn, watermark)
+                    conn.enable_device()
+                    conn.disconnect()
             else:
-                check_out = punch_time
-        elif len(punches) > 1:
-            check_in = punches[0]
-            check_out = punches[-1]
-
-        results = {
-            "employee_id": employee.id,
-            "date": punches[0].date() if punches else None,
-            "check_in": check_in,
-            "check_out": check_out,
-            "status": [],
-            "worked_hours": 0,
-            "extra_hours": 0,
-            "has_punches": bool(punches),
-        }
+                timer.error = _("Unable to connect to the device")
+        timer.count('fetched', len(attendance_data))
+        return attendance_data, record_count
+
+    def _read_attendance_records(self, conn, start_index):
+        """Read the attendance log and decode the records from start_index on.
+
+        pyzk 0.9 can only transfer the whole log buffer, so the download
+        itself is not incremental: only the records beyond the watermark are
+        decoded and, for the 40 byte record layout, the user table is not
+        downloaded at all. The buffer is freed on the device once read.
+        """
+        if not conn.records:
+            return []
+        try:
+            data, size = conn.read_with_buffer(const.CMD_ATTLOG_RRQ)
+        finally:
+            conn.free_data()
+        if size < 4:
+            return []
+        total_size = struct.unpack('I', data[:4])[0]
+        if total_size // conn.records != ATTLOG_RECORD_SIZE:
+            return conn.get_attendance()[start_index:]
+
+        records = data[4 + start_index * ATTLOG_RECORD_SIZE:]
+        records = records[:len(records) - len(records) % ATTLOG_RECORD_SIZE]
+        attendance_data = []
+        for uid, user_id, status, timestamp, punch, _space in struct.iter_unpack(ATTLOG_RECORD_FORMAT, records):
+            user_id = user_id.split(b'\x00')[0].decode(errors='ignore')
+            attendance_data.append(Attendance(user_id, _decode_zk_time(timestamp), status, punch, uid))
+        return attendance_data
+
+    def _ingest_attendance_data(self, attendance_data, record_count=None, timer=None, filter_downloaded=True):
+        """
+        Store the downloaded punches and build the hr.attendance records.
+        Unless filter_downloaded is False, the punches up to the last
+        download time of the device are skipped as already downloaded.
+        """
+        self.ensure_one()
+        timer = timer or SyncStageTimer()
+        device = self
+        if record_count is not None:
+            device.last_record_count = record_count
+        if not attendance_data:
+            _logger.warning("No new attendance data found to process.")
+            return
 
-        if check_in and check_out:
-            if check_out < check_in:
-                check_out = shift_end_utc
-                status_flags.append("invalid_order_fixed")
-
-            # Calculate break overlap
-            break_overlap_seconds = 0
-            if break_from_utc and break_to_utc:
-                overlap_start = max(check_in, break_from_utc)
-                overlap_end = min(check_out, break_to_utc)
-                if overlap_end > overlap_start:
-                    break_overlap_seconds = (overlap_end - overlap_start).total_seconds()
-
-            total_duration_seconds = (check_out - check_in).total_seconds()
-            worked_seconds = total_duration_seconds - break_overlap_seconds
-            worked_hours = worked_seconds / 3600.0
-            results["worked_hours"] = round(worked_hours, 2)
-
-            extra_hours = worked_hours - planned_hours
-            results["extra_hours"] = round(extra_hours, 2)
-
-            if check_in < shift_start_utc:
-                status_flags.append("early_checkin")
-            elif check_in > shift_start_utc:
-                status_flags.append("late_checkin")
-
-            if check_out < shift_end_utc:
-                status_flags.append("early_checkout")
-            elif check_out > shift_end_utc:
-                status_flags.append("late_checkout")
-
-            if extra_hours < -0.1:
-                status_flags.append("less_hours")
-            elif extra_hours > 0.1:
-                status_flags.append("extra_hours")
-
-        elif check_in and not check_out:
-            status_flags.append("Missed checkout")
-            if datetime.now() >= check_in + timedelta(hours=18):
-                check_out = check_in + timedelta(hours=18)
-                results["check_out"] = check_out
-                worked_hours = 18.0
-                results["worked_hours"] = worked_hours
-                extra_hours = worked_hours - planned_hours
-                results["extra_hours"] = round(extra_hours, 2)
-
-        elif check_out and not check_in:
-            status_flags.append("Missed checkin")
-            check_in = shift_start_utc
-            results["check_in"] = check_in
-            worked_hours = (check_out - check_in).total_seconds() / 3600.0
-            results["worked_hours"] = round(worked_hours, 2)
-            extra_hours = worked_hours - planned_hours
-            results["extra_hours"] = round(extra_hours, 2)
-            if extra_hours > 0.1:
-                 status_flags.append("extra_hours")
+        # **FIX**: Set the last download time before filtering
+        latest_punch_time = max(att.timestamp for att in attendance_data)
 
-        else:
-            status_flags.append("absent")
+        if filter_downloaded and device.last_download_time:
+            start_filter_time = device.last_download_time
+            fetched_count = len(attendance_data)
+            attendance_data = [att for att in attendance_data if att.timestamp > start_filter_time]
+            timer.count('filtered', fetched_count - len(attendance_data))
 
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
-        results["status"] = status_flags
-        return results
+        # **FIX**: Update the last download time regardless of whether new records are processed
+        device.last_download_time = max(latest_punch_time, device.last_download_time or latest_punch_time)
 
-    def _create_or_update_attendance(self, result, employee, hr_attendance):
-        """Helper to insert/update hr.attendance records"""
-        if not result["has_punches"]:
+        if not attendance_data:
+            _logger.warning("No new attendance data found after filtering.")
             return
 
-        status_list = result["status"]
-        status_ids = []
-
-        for status_name in status_list:
-            status_tag = self.env['hr.attendance.status.tag'].search([('name', '=', status_name)], limit=1)
-            if not status_tag:
-                status_tag = self.env['hr.attendance.status.tag'].create({'name': status_name})
-            status_ids.append(status_tag.id)
-
-        vals = {
-            'employee_id': employee.id,
-            'check_in': result["check_in"],
-            'check_out': result["check_out"],
-            'worked_hours': result["worked_hours"],
-            'status_ids': [(6, 0, status_ids)],
-            'overtime_hours': result["extra_hours"],
-            'was_missing_checkin': "Missed checkin" in status_list,
-            'was_missing_checkout': "Missed checkout" in status_list,
-        }
+        zk_attendance = self.env['zk.machine.attendance']
+        operating_tz_str = self.env.user.tz or 'UTC'
+        operating_tz = pytz.timezone(operating_tz_str)
+
+        workday_punches = []
+        punch_vals_list = []
+        unknown_users = {}
+        retention_cutoff = zk_attendance._get_retention_cutoff()
+        expired_count = 0
+
+        with timer.stage('employee_lookup'):
+            employee_by_user = self.env['hr.employee']._get_device_user_map()
+            # Resolve the shifts of the punching employees for the whole period at
+            # once, the workday detection looks at the day before each punch.
+            punch_employee_ids = {employee_by_user[str(punch.user_id)] for punch in attendance_data
+                                  if str(punch.user_id) in employee_by_user}
+            punch_days = [punch.timestamp.date() for punch in attendance_data]
+            self.env['hr.employee'].browse(punch_employee_ids)._prefetch_shifts(
+                min(punch_days) - timedelta(days=1), max(punch_days) + timedelta(days=1), operating_tz)
+
+        with timer.stage('grouping'):
+            for punch in sorted(attendance_data, key=lambda p: p.timestamp):
+                employee_id = employee_by_user.get(str(punch.user_id))
+                if not employee_id:
+                    unknown_users[str(punch.user_id)] = unknown_users.get(str(punch.user_id), 0) + 1
+                    continue
+                employee = self.env['hr.employee'].browse(employee_id)
 
-        workday_date = result['check_in'].date() if result.get('check_in') else (result.get('check_out').date() if result.get('check_out') else None)
-        if not workday_date:
-            return
+                raw_dt = punch.timestamp
+                if getattr(raw_dt, 'tzinfo', None) is None:
+                    local_dt = operating_tz.localize(raw_dt, is_dst=None)
+                else:
+                    local_dt = raw_dt.astimezone(operating_tz)
+
+                utc_dt = local_dt.astimezone(pytz.utc)
+                if retention_cutoff and utc_dt.replace(tzinfo=None) < retention_cutoff:
+                    # Out of the hot range, the punch was archived or purged already
+                    expired_count += 1
+                    continue
 
-        start_of_day = datetime.combine(workday_date, time.min)
-        end_of_day = datetime.combine(workday_date, time.max)
+                atten_time = fields.Datetime.to_string(utc_dt)
 
-        existing = hr_attendance.search([
-            ('employee_id', '=', employee.id),
-            ('check_in', '>=', start_of_day),
-            ('check_in', '<=', end_of_day),
-        ], limit=1)
+                punch_vals_list.append({
+                    'employee_id': employee.id,
+                    'device_id': device.id,
+                    'device_id_num': str(punch.user_id),
+                    'punch_type': str(punch.punch),
+                    'attendance_type': str(punch.status),
+                    'punching_time': atten_time,
+                    'address_id': device.address_id.id,
+                })
 
-        if existing and existing.is_corrected:
-            _logger.info(f"Skipping auto-update for manually corrected attendance record {existing.id} for {employee.name} on {workday_date}.")
-            return
+                workday_punches.append((employee.id, local_dt))
+
+        with timer.stage('insert'):
+            inserted_ids = zk_attendance._insert_punches(punch_vals_list)
+        sync_metrics.inc_punches(device.name, len(inserted_ids), len(punch_vals_list) - len(inserted_ids))
+        timer.count('new', len(inserted_ids))
+        timer.count('duplicate', len(punch_vals_list) - len(inserted_ids))
+        timer.count('expired', expired_count)
+        timer.count('unknown_user', sum(unknown_users.values()))
+        _logger.info(f"Device {device.name}: stored {len(inserted_ids)} new punches, "
+                     f"{len(punch_vals_list) - len(inserted_ids)} duplicates skipped.")
+
+        if expired_count:
+            _logger.info(f"Device {device.name}: skipped {expired_count} punches older than "
+                         f"the retention period.")
+        if unknown_users:
+            _logger.warning(f"Device {device.name}: skipped {sum(unknown_users.values())} punches of "
+                            f"{len(unknown_users)} device users not linked to any employee: "
+                            f"{', '.join(sorted(unknown_users))}")
+
+        # Workdays and attendance figures of all the punches at once, see attendance_engine
+        Employee = self.env['hr.employee']
+        with timer.stage('process'):
+            results = attendance_engine.process_punch_batch(
+                workday_punches, operating_tz,
+                lambda employee_id, day: Employee.browse(employee_id)._get_employee_shift_for_day(day, operating_tz))
+        with timer.stage('attendance'):
+            self._upsert_attendance_batch(results.values(), timer)
+
+        _logger.info("--- Attendance download finished ---")
 
-<<<<<<< HEAD
-        attendance_rec = None
-        if existing:
-            # FIX: Only update check_out, worked_hours, status_ids, etc.
-            # Do not touch the original check_in field.
+    def _get_workday_for_punch(self, employee, punch_time_local, operating_tz):
+        """Determine the workday for a punch, handling night shifts"""
+        prev_shift = employee._get_employee_shift_for_day(
+            punch_time_local.date() - timedelta(days=1), operating_tz)
+        return attendance_engine.get_workday(punch_time_local, prev_shift)
+
+    def process_attendance(self, punches, employee, shift, tz):
+        """Process punches of one employee for one day"""
+        return attendance_engine.process_punches(punches, shift, employee.id)
+
+    def _create_or_update_attendance(self, result, employee, hr_attendance, timer=None):
+        """Helper to insert/update the hr.attendance record of one workday result"""
+        self._upsert_attendance_batch([dict(result, employee_id=employee.id)], timer)
+
+    def _upsert_attendance_batch(self, results, timer=None, rewrite_check_in=False):
+        """
+        Insert or update the hr.attendance records of many workday results
+        (see process_attendance), an attendance per employee and UTC day of
+        the check-in. The existing attendances are read in one query, the new
+        ones created at once and the updates grouped by identical values.
+        Attendances corrected by hand are left untouched. A result for a day
+        already written in the batch updates that attendance, like sequential
+        calls would. The check-in of an existing attendance is kept, unless
+        rewrite_check_in is set (reprocessing). Returns the attendances
+        written and the number of results skipped as corrected.
+        """
+        timer = timer or SyncStageTimer()
+        Attendance = self.env['hr.attendance'].with_context(zk_attendance_automated=True)
+        workday_results = []
+        for result in results:
+            stamp = result.get('check_in') or result.get('check_out')
+            if result["has_punches"] and stamp:
+                workday_results.append(((result['employee_id'], stamp.date()), result))
+        if not workday_results:
+            return Attendance, 0
+
+        days = [day for (_employee_id, day), _result in workday_results]
+        existing_by_key = {}
+        # In the default order (latest check-in first) like a search with limit=1 per day
+        for attendance in Attendance.search_fetch([
+            ('employee_id', 'in', list({employee_id for (employee_id, _day), _result in workday_results})),
+            ('check_in', '>=', datetime.combine(min(days), time.min)),
+            ('check_in', '<=', datetime.combine(max(days), time.max)),
+        ], ['employee_id', 'check_in', 'is_corrected']):
+            existing_by_key.setdefault((attendance.employee_id.id, attendance.check_in.date()), attendance)
+
+        create_vals_by_key = {}
+        update_vals_by_attendance = {}
+        notifications = []
+        corrected = Attendance
+        for key, result in workday_results:
+            status_list = result["status"]
+            # Only update check_out, worked_hours, status_mask, etc. The check-in is kept.
             update_vals = {
                 'check_out': result["check_out"],
                 'worked_hours': result["worked_hours"],
-                'status_ids': [(6, 0, status_ids)],
+                'status_mask': attendance_engine.status_to_mask(status_list),
                 'overtime_hours': result["extra_hours"],
                 'was_missing_checkout': "Missed checkout" in status_list,
             }
-            existing.write(update_vals)
-=======
-        # **FIX**: Consolidate attendance record reference
-        attendance_rec = None
-        if existing:
-            existing.write(vals)
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
-            attendance_rec = existing
-        else:
-            attendance_rec = hr_attendance.create(vals)
-
-        if not attendance_rec:
+            if rewrite_check_in:
+                update_vals.update({
+                    'check_in': result["check_in"],
+                    'was_missing_checkin': "Missed checkin" in status_list,
+                })
+            existing = existing_by_key.get(key)
+            if existing and existing.is_corrected:
+                corrected |= existing
+                continue
+            if existing:
+                update_vals_by_attendance[existing] = update_vals
+            elif key in create_vals_by_key:
+                create_vals_by_key[key].update(update_vals)
+            else:
+                create_vals_by_key[key] = {
+                    **update_vals,
+                    'employee_id': result['employee_id'],
+                    'check_in': result["check_in"],
+                    'was_missing_checkin': "Missed checkin" in status_list,
+                    'from_device': True,
+                }
+            notifications.append((key, status_list))
+        if corrected:
+            _logger.info(f"Skipping auto-update for manually corrected attendance records {corrected.ids}.")
+
+        attendance_by_key = {key: attendance for key, attendance in existing_by_key.items()
+                             if attendance in update_vals_by_attendance}
+        if create_vals_by_key:
+            created = Attendance.create(list(create_vals_by_key.values()))
+            attendance_by_key.update(zip(create_vals_by_key, created))
+        updates = {}
+        for attendance, vals in update_vals_by_attendance.items():
+            updates.setdefault(tuple(sorted(vals.items())), (vals, []))[1].append(attendance.id)
+        for vals, attendance_ids in updates.values():
+            Attendance.browse(attendance_ids).write(vals)
+
+        with timer.stage('message_post'):
+            self._notify_attendance_events([(attendance_by_key[key], status_list)
+                                            for key, status_list in notifications])
+        return Attendance.union(*attendance_by_key.values()), len(corrected)
+
+    def _get_notification_settings(self):
+        """Notification mode and asynchronous delivery of the device, see res.company"""
+        device = self[:1]
+        company = device.company_id or self.env.company
+        return device.notification_mode or company.zk_notification_mode or 'instant', company.zk_notification_async
+
+    def _notify_attendance_events(self, events):
+        """
+        Notify the irregularities of the attendances written by a sync, a
+        list of (attendance, status_list). Instant notifications are posted
+        right away, digests are queued and sent once per transaction when it
+        is committed (the whole sync run), or after the commit in their own
+        transaction when the delivery is asynchronous.
+        """
+        events = [(attendance, status_list) for attendance, status_list in events
+                  if set(status_list) & set(ATTENDANCE_NOTIFICATION_STATUSES)]
+        if self.env.context.get('zk_attendance_no_notification') or not events:
             return
-<<<<<<< HEAD
-            
-        hr_admin_group = self.env.ref('hr_attendance.group_hr_attendance_manager', raise_if_not_found=False)
-        if not hr_admin_group:
+        mode, deliver_async = self._get_notification_settings()
+        if mode == 'instant' and not deliver_async:
+            self._deliver_attendance_notifications(mode, events)
             return
-            
-        hr_admin_users = self.env['res.users'].search([('groups_id', 'in', hr_admin_group.ids)])
-
-        ci_str, co_str = "", ""
-        if attendance_rec.check_in:
-            ci_local = fields.Datetime.context_timestamp(attendance_rec, attendance_rec.check_in)
-            ci_str = ci_local.strftime("%Y-%m-%d %H:%M")
-
-        if attendance_rec.check_out:
-=======
+        callbacks = self.env.cr.postcommit if deliver_async else self.env.cr.precommit
+        queued = callbacks.data.setdefault(NOTIFICATION_QUEUE_KEY, {})
+        if not queued:
+            device_model = self.env['biometric.device.details']
+            callbacks.add(device_model._send_queued_notifications_async if deliver_async
+                          else device_model._send_queued_notifications)
+        # The latest status of an attendance written twice in the transaction wins
+        queued.setdefault(mode, {}).update((attendance.id, list(status_list)) for attendance, status_list in events)
+
+    def _send_queued_notifications(self):
+        """Precommit hook sending the notifications queued by the transaction"""
+        self._send_attendance_notifications(self.env.cr.precommit.data.pop(NOTIFICATION_QUEUE_KEY, {}))
+
+    def _send_queued_notifications_async(self):
+        """Postcommit hook sending the queued notifications in a new transaction"""
+        queued = self.env.cr.postcommit.data.pop(NOTIFICATION_QUEUE_KEY, {})
+        try:
+            with self.pool.cursor() as cr:
+                self.with_env(self.env(cr=cr))._send_attendance_notifications(queued)
+        except Exception as e:
+            _logger.error(f"Failed to send the attendance notifications: {e}")
+
+    def _send_attendance_notifications(self, queued):
+        """Send the queued notifications, {mode: {attendance id: status_list}}"""
+        for mode, status_by_attendance in queued.items():
+            # Attendances of a device sync rolled back since are gone
+            attendances = self.env['hr.attendance'].browse(list(status_by_attendance)).exists()
+            events = [(attendance, status_by_attendance[attendance.id]) for attendance in attendances]
+            self._deliver_attendance_notifications(mode, events)
+            _logger.info(f"Sent the {mode} notifications of {len(events)} attendances.")
+
+    def _deliver_attendance_notifications(self, mode, events):
+        """Post the notifications of a list of (attendance, status_list) in the given mode"""
+        if mode == 'employee':
+            self._post_employee_digests(events)
+        elif mode == 'manager':
+            self._send_manager_digests(events)
+        else:
+            self._post_attendance_digests(events)
 
-        # Notification logic remains the same...
+    def _get_attendance_managers(self):
         hr_admin_group = self.env.ref('hr_attendance.group_hr_attendance_manager', raise_if_not_found=False)
         if not hr_admin_group:
-            return
-            
-        hr_admin_users = self.env['res.users'].search([('groups_id', 'in', hr_admin_group.ids)])
-
-        ci_str, co_str = "", ""
-        if result["check_in"]:
-            ci_local = fields.Datetime.context_timestamp(attendance_rec, attendance_rec.check_in)
-            ci_str = ci_local.strftime("%Y-%m-%d %H:%M")
-
-        if result["check_out"]:
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
-            co_local = fields.Datetime.context_timestamp(attendance_rec, attendance_rec.check_out)
-            co_str = co_local.strftime("%Y-%m-%d %H:%M")
-
-        if "early_checkin" in status_list:
-            attendance_rec.message_post(
-                body=Markup(f"""
-                    <p>
-                        Dear <b>{employee.name}</b>, you checked in
-                        <span style="color:green;">early</span>
-                        at <span style="color:blue;">{ci_str}</span>.
-                    </p>
-                """),
-                partner_ids=hr_admin_users.mapped('partner_id').ids,
-                subtype_xmlid="mail.mt_note"
-            )
-
-        if "late_checkin" in status_list:
-            attendance_rec.message_post(
-                body=Markup(f"""
-                    <p>
-                        Dear <b>{employee.name}</b>, you checked in
-                        <span style="color:red;">late</span>
-                        at <span style="color:blue;">{ci_str}</span>.
-                    </p>
-                """),
-                partner_ids=hr_admin_users.mapped('partner_id').ids,
-                subtype_xmlid="mail.mt_note"
-            )
-
-        if "early_checkout" in status_list:
-            attendance_rec.message_post(
-                body=Markup(f"""
-                    <p>
-                        Dear <b>{employee.name}</b>, you checked out
-                        <span style="color:red;">early</span>
-                        at <span style="color:blue;">{co_str}</span>.
-                    </p>
-                """),
-                partner_ids=hr_admin_users.mapped('partner_id').ids,
-                subtype_xmlid="mail.mt_note"
+            return self.env['res.users']
+        return self.env['res.users'].search([('groups_id', 'in', hr_admin_group.ids)])
+
+    def _get_attendance_event_lines(self, attendance, status_list):
+        """One line of text per irregularity of an attendance, for the notifications"""
+        ci_str = co_str = ""
+        if attendance.check_in:
+            ci_str = fields.Datetime.context_timestamp(attendance, attendance.check_in).strftime("%Y-%m-%d %H:%M")
+        if attendance.check_out:
+            co_str = fields.Datetime.context_timestamp(attendance, attendance.check_out).strftime("%Y-%m-%d %H:%M")
+        lines = []
+        for status in ATTENDANCE_NOTIFICATION_STATUSES:
+            if status not in status_list:
+                continue
+            stamp = ci_str if status in ('early_checkin', 'late_checkin', 'Missed checkin') else co_str
+            if stamp:
+                lines.append(f"{ATTENDANCE_NOTIFICATION_STATUSES[status]} at {stamp}")
+        return lines
+
+    def _render_attendance_digest(self, events, with_employee=False):
+        items = Markup()
+        for attendance, status_list in events:
+            for line in self._get_attendance_event_lines(attendance, status_list):
+                if with_employee:
+                    items += Markup("<li><b>%s</b>: %s</li>") % (attendance.employee_id.name, line)
+                else:
+                    items += Markup("<li>%s</li>") % line
+        return Markup("<ul>%s</ul>") % items if items else None
+
+    def _post_attendance_digests(self, events):
+        """Post the irregularities of every attendance on its own chatter"""
+        partner_ids = self._get_attendance_managers().partner_id.ids
+        for attendance, status_list in events:
+            digest = self._render_attendance_digest([(attendance, status_list)])
+            if not digest:
+                continue
+            attendance.message_post(
+                body=Markup("<p>Dear <b>%s</b>, the following attendance irregularities were recorded:</p>%s")
+                % (attendance.employee_id.name, digest),
+                partner_ids=partner_ids,
+                subtype_xmlid="mail.mt_note",
             )
 
-        if "late_checkout" in status_list:
-            attendance_rec.message_post(
-                body=Markup(f"""
-                    <p>
-                        Dear <b>{employee.name}</b>, you checked out
-                        <span style="color:green;">late</span>
-                        at <span style="color:blue;">{co_str}</span>.
-                    </p>
-                """),
-                partner_ids=hr_admin_users.mapped('partner_id').ids,
-                subtype_xmlid="mail.mt_note"
+    def _post_employee_digests(self, events):
+        """Post one summary of the irregularities on the chatter of every employee"""
+        partner_ids = self._get_attendance_managers().partner_id.ids
+        events_by_employee = {}
+        for attendance, status_list in events:
+            events_by_employee.setdefault(attendance.employee_id, []).append((attendance, status_list))
+        for employee, employee_events in events_by_employee.items():
+            digest = self._render_attendance_digest(employee_events)
+            if not digest:
+                continue
+            employee.message_post(
+                body=Markup("<p>Dear <b>%s</b>, the following attendance irregularities were recorded:</p>%s")
+                % (employee.name, digest),
+                partner_ids=partner_ids,
+                subtype_xmlid="mail.mt_note",
             )
 
-<<<<<<< HEAD
-        if "Missed checkin" in status_list and attendance_rec.check_in:
-=======
-        if "Missed checkin" in status_list and result["check_in"]:
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
-            attendance_rec.message_post(
-                body=Markup(f"""
-                    <p>
-                        Dear <b>{employee.name}</b>,
-                        you <span style="color:red;">missed check-in</span>.
-                    </p>
-                    <p>
-                        System considered first log at
-                        <b style="color:blue;">{ci_str}</b>.
-                    </p>
-                """),
-                partner_ids=hr_admin_users.mapped('partner_id').ids,
-                subtype_xmlid="mail.mt_note"
+    def _send_manager_digests(self, events):
+        """
+        Send one summary to every manager, listing the irregularities of the
+        employees they approve the attendances of, or of all the employees
+        without an attendance manager to the HR attendance managers.
+        """
+        hr_managers = self._get_attendance_managers()
+        events_by_manager = {}
+        for attendance, status_list in events:
+            for manager in attendance.employee_id.attendance_manager_id or hr_managers:
+                events_by_manager.setdefault(manager, []).append((attendance, status_list))
+        for manager, manager_events in events_by_manager.items():
+            digest = self._render_attendance_digest(manager_events, with_employee=True)
+            if not digest:
+                continue
+            self.env['mail.thread'].message_notify(
+                partner_ids=manager.partner_id.ids,
+                subject=_("Attendance irregularities"),
+                body=Markup("<p>Dear <b>%s</b>, the following attendance irregularities were recorded:</p>%s")
+                % (manager.name, digest),
             )
-
-<<<<<<< HEAD
-        if "Missed checkout" in status_list and attendance_rec.check_out:
-=======
-        if "Missed checkout" in status_list and result["check_out"]:
->>>>>>> a58772681a33aa74879ebd15d5baa7319d4cb73b
-            attendance_rec.message_post(
-                body=Markup(f"""
-                    <p>
-                        Dear <b>{employee.name}</b>, you checked in at
-                        <span style="color:blue;">{ci_str}</span>
-                        but <span style="color:red;">missed checkout</span>.
-                    </p>
-                    <p>
-                        System auto-checked out at
-                        <b style="color:green;">{co_str}</b>.
-                    </p>
-                """),
-                partner_ids=hr_admin_users.mapped('partner_id').ids,
-                subtype_xmlid="mail.mt_note"
-            )
\ No newline at end of file
@@ -0,0 +1,141 @@
+# hr_zk_attendance/models/biometric_sync_run.py
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+from time import monotonic
+from odoo import api, fields, models
+
+# Sync runs older than this are removed by the autovacuum
+SYNC_RUN_RETENTION = timedelta(days=30)
+SYNC_STAGES = ['connect', 'fetch', 'employee_lookup', 'grouping', 'insert',
+               'process', 'attendance', 'message_post']
+SYNC_COUNTS = ['fetched', 'filtered', 'new', 'duplicate', 'unknown_user', 'expired']
+
+
+class SyncStageTimer:
+    """Durations of the stages of one device sync and its punch counts.
+
+    Stages may be nested, the time of a stage then excludes the time of
+    the stages nested in it. A timer is a plain object, it can be filled
+    from a download worker thread and stored once back in the cron's
+    transaction (see biometric.sync.run.line).
+    """
+
+    def __init__(self):
+        self.durations = defaultdict(float)
+        self.counts = defaultdict(int)
+        self.error = None
+        self.started = monotonic()
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        now = monotonic()
+        if self._stack:
+            parent = self._stack[-1]
+            self.durations[parent[0]] += now - parent[1]
+        self._stack.append([name, now])
+        try:
+            yield
+        finally:
+            name, since = self._stack.pop()
+            now = monotonic()
+            self.durations[name] += now - since
+            if self._stack:
+                self._stack[-1][1] = now
+
+    def count(self, name, value=1):
+        self.counts[name] += value
+
+    @property
+    def elapsed(self):
+        return monotonic() - self.started
+
+
+class BiometricSyncRun(models.Model):
+    """One run of the attendance download, manual or scheduled"""
+    _name = 'biometric.sync.run'
+    _description = 'Biometric Sync Run'
+    _order = 'date_start desc, id desc'
+    _rec_name = 'date_start'
+
+    trigger = fields.Selection([('cron', 'Scheduled'), ('manual', 'Manual')],
+                               string='Trigger', required=True, default='manual')
+    date_start = fields.Datetime(string='Started', required=True, default=fields.Datetime.now)
+    duration = fields.Float(string='Duration (s)', digits=(16, 3))
+    line_ids = fields.One2many('biometric.sync.run.line', 'run_id', string='Devices')
+    state = fields.Selection([('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')],
+                             string='Status', default='running', required=True,
+                             help="Failed when the download of at least one device failed")
+    new_count = fields.Integer(string='New Punches', compute='_compute_totals', store=True)
+    fetched_count = fields.Integer(string='Fetched Punches', compute='_compute_totals', store=True)
+
+    @api.depends('line_ids.new_count', 'line_ids.fetched_count')
+    def _compute_totals(self):
+        for run in self:
+            run.new_count = sum(run.line_ids.mapped('new_count'))
+            run.fetched_count = sum(run.line_ids.mapped('fetched_count'))
+
+    @api.model
+    def _start(self, trigger):
+        return self.sudo().create({'trigger': trigger})
+
+    def _add_device_result(self, device, timer):
+        """Store the stage durations and punch counts of one device"""
+        self.ensure_one()
+        vals = {
+            'run_id': self.id,
+            'device_id': device.id,
+            'state': 'failed' if timer.error else 'success',
+            'error': timer.error,
+            'duration_total': timer.elapsed,
+        }
+        vals.update({f'duration_{stage}': timer.durations.get(stage, 0.0) for stage in SYNC_STAGES})
+        vals.update({f'{name}_count': timer.counts.get(name, 0) for name in SYNC_COUNTS})
+        return self.env['biometric.sync.run.line'].sudo().create(vals)
+
+    def _finish(self, started):
+        self.write({
+            'duration': monotonic() - started,
+            'state': 'failed' if any(line.state == 'failed' for line in self.line_ids) else 'done',
+        })
+
+    @api.autovacuum
+    def _gc_sync_runs(self):
+        self.sudo().search([('date_start', '<', fields.Datetime.now() - SYNC_RUN_RETENTION)]).unlink()
+
+
+class BiometricSyncRunLine(models.Model):
+    """Result of one device in a sync run"""
+    _name = 'biometric.sync.run.line'
+    _description = 'Biometric Sync Run Device'
+    _order = 'id desc'
+
+    run_id = fields.Many2one('biometric.sync.run', string='Sync Run', required=True,
+                             ondelete='cascade', index=True)
+    date_start = fields.Datetime(related='run_id.date_start', store=True, string='Started')
+    trigger = fields.Selection(related='run_id.trigger')
+    device_id = fields.Many2one('biometric.device.details', string='Device', required=True,
+                                ondelete='cascade', index=True)
+    state = fields.Selection([('success', 'Success'), ('failed', 'Failed')],
+                             string='Status', required=True, default='success')
+    error = fields.Char(string='Error')
+
+    fetched_count = fields.Integer(string='Fetched', help="Records read from the device log")
+    filtered_count = fields.Integer(string='Filtered',
+                                    help="Records older than the last download time")
+    new_count = fields.Integer(string='New', help="Punches stored")
+    duplicate_count = fields.Integer(string='Duplicates', help="Punches already stored")
+    unknown_user_count = fields.Integer(string='Unknown Users',
+                                        help="Punches of device users not linked to an employee")
+    expired_count = fields.Integer(string='Expired', help="Punches older than the retention period")
+
+    duration_total = fields.Float(string='Total (s)', digits=(16, 3))
+    duration_connect = fields.Float(string='Connect (s)', digits=(16, 3))
+    duration_fetch = fields.Float(string='Log Download (s)', digits=(16, 3))
+    duration_employee_lookup = fields.Float(string='Employee Lookup (s)', digits=(16, 3))
+    duration_grouping = fields.Float(string='Workday Grouping (s)', digits=(16, 3))
+    duration_insert = fields.Float(string='Punch Insert (s)', digits=(16, 3))
+    duration_process = fields.Float(string='Processing (s)', digits=(16, 3))
+    duration_attendance = fields.Float(string='Attendance Write (s)', digits=(16, 3))
+    duration_message_post = fields.Float(string='Notifications (s)', digits=(16, 3))
@@ -19,7 +19,17 @@
 #    If not, see <http://www.gnu.org/licenses/>.
 #
 ################################################################################
-from odoo import fields, models, tools
+import logging
+from datetime import timedelta
+from odoo import api, fields, models, tools
+from odoo.exceptions import UserError
+from odoo.tools.sql import TableKind, table_kind
+
+_logger = logging.getLogger(__name__)
+
+DAILY_ATTENDANCE_REFRESH_KEY = 'hr_zk_attendance.daily_attendance_refresh'
+# Commits within this many seconds are covered by the same refresh
+DAILY_ATTENDANCE_REFRESH_DELAY = 60
 
 
 class DailyAttendance(models.Model):
@@ -46,13 +56,27 @@ class DailyAttendance(models.Model):
     punching_time = fields.Datetime(string='Punching Time',
                                     help='Punching time in the device')
 
+    @api.model
+    def _is_materialized(self):
+        """Whether the report is stored as a materialized view, see the
+        hr_zk_attendance.daily_attendance_materialized parameter"""
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'hr_zk_attendance.daily_attendance_materialized', 'False')
+        return value.strip().lower() in ('1', 'true', 'yes')
+
+    @api.model
+    def _is_materialized_view(self):
+        """Whether the report is currently built as a materialized view"""
+        return table_kind(self._cr, self._table) == TableKind.Materialized
+
     def init(self):
         """Retrieve the data's for attendance report"""
         tools.drop_view_if_exists(self._cr, 'daily_attendance')
-        query = """
-                create or replace view daily_attendance as (
+        # Raw punches are unique per employee and punching time, there is
+        # nothing left to group.
+        select = """
                     select
-                        min(z.id) as id,
+                        z.id as id,
                         z.employee_id as employee_id,
                         z.write_date as punching_day,
                         z.address_id as address_id,
@@ -61,18 +85,48 @@ class DailyAttendance(models.Model):
                         z.punch_type as punch_type
                     from zk_machine_attendance z
                         join hr_employee e on (z.employee_id=e.id)
-                    GROUP BY
-                        z.employee_id,
-                        z.write_date,
-                        z.address_id,
-                        z.attendance_type,
-                        z.punch_type,
-                        z.punching_time
-                )
             """
-        self._cr.execute(query)
+        if not self._is_materialized():
+            self._cr.execute(f"create or replace view daily_attendance as ({select})")
+            return
+        self._cr.execute(f"create materialized view daily_attendance as ({select})")
+        # The unique index on id allows refreshing the view concurrently
+        self._cr.execute("create unique index daily_attendance_id_uniq on daily_attendance (id)")
+        self._cr.execute("""create index daily_attendance_employee_punching_time_idx
+                            on daily_attendance (employee_id, punching_time)""")
+        self._cr.execute("create index daily_attendance_punching_time_idx on daily_attendance (punching_time)")
+        self._cr.execute("create index daily_attendance_punching_day_idx on daily_attendance (punching_day)")
 
+    @api.model
+    def _schedule_refresh(self):
+        """
+        Queue a refresh of the materialized report. The refresh runs in the
+        cron a little later, so that the commits of a download or of a burst
+        of pushes are covered by a single refresh instead of one each.
+        """
+        if not self._is_materialized() and not self._is_materialized_view():
+            return
+        precommit = self.env.cr.precommit
+        if precommit.data.get(DAILY_ATTENDANCE_REFRESH_KEY):
+            return
+        precommit.data[DAILY_ATTENDANCE_REFRESH_KEY] = True
+        cron = self.env.ref('hr_zk_attendance.cron_refresh_daily_attendance', raise_if_not_found=False)
+        if cron:
+            cron._trigger(fields.Datetime.now() + timedelta(seconds=DAILY_ATTENDANCE_REFRESH_DELAY))
 
+    @api.model
+    def _cron_refresh(self):
+        """
+        Refresh the materialized report, concurrently so that it stays
+        readable meanwhile. The report is rebuilt instead when the
+        daily_attendance_materialized parameter changed since it was built.
+        """
+        if self._is_materialized() != self._is_materialized_view():
+            self.init()
+            _logger.info(f"Rebuilt the daily attendance report, "
+                         f"materialized: {self._is_materialized_view()}.")
+        elif self._is_materialized_view():
+            self._cr.execute("refresh materialized view concurrently daily_attendance")
 
     def unlink(self):
         for rec in self:
@@ -7,10 +7,32 @@ class HrAttendance(models.Model):
 
     is_corrected = fields.Boolean(string="Is Corrected", default=False,
                                   help="Indicates if this attendance record has been manually corrected.")
+    from_device = fields.Boolean(string="From Device", readonly=True, copy=False,
+                                 help="Built from the punches of the biometric devices. Only these "
+                                      "attendances are removed when a period is reprocessed.")
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        attendances = super().create(vals_list)
+        self.env['hr.attendance.daily.fact']._mark_attendances_dirty(attendances)
+        return attendances
 
     def write(self, vals):
-        # **FIX**: Set 'is_corrected' to True on manual edits by HR Managers
-        if self.env.user.has_group('hr_attendance.group_hr_attendance_manager') and \
+        # **FIX**: Set 'is_corrected' to True on manual edits by HR Managers,
+        # not on the updates of the device synchronization
+        if not self.env.context.get('zk_attendance_automated') and \
+           self.env.user.has_group('hr_attendance.group_hr_attendance_manager') and \
            any(field in ['check_in', 'check_out'] for field in vals):
             vals['is_corrected'] = True
-        return super(HrAttendance, self).write(vals)
\ No newline at end of file
+        Fact = self.env['hr.attendance.daily.fact']
+        # Both the former and the new days of the attendances change
+        moves_day = 'check_in' in vals or 'employee_id' in vals
+        if moves_day:
+            Fact._mark_attendances_dirty(self)
+        res = super(HrAttendance, self).write(vals)
+        Fact._mark_attendances_dirty(self)
+        return res
+
+    def unlink(self):
+        self.env['hr.attendance.daily.fact']._mark_attendances_dirty(self)
+        return super().unlink()
\ No newline at end of file
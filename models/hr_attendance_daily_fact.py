@@ -0,0 +1,355 @@
+# hr_zk_attendance/models/hr_attendance_daily_fact.py
+import logging
+from datetime import datetime, timedelta
+import pytz
+from odoo import api, fields, models, tools
+from .attendance_engine import STATUS_BITS
+
+_logger = logging.getLogger(__name__)
+
+FACT_PRECOMMIT_KEY = 'hr_zk_attendance.fact_keys'
+FACT_EMPLOYEE_BATCH = 100
+# Fact fields summed by the attendance report
+FACT_REPORT_FIELDS = ['working_days', 'present_days', 'absent_days', 'week_off_days', 'early_in', 'late_in',
+                      'early_out', 'late_out', 'worked_hours', 'overtime_hours', 'checked_out_count']
+# Status flags counted on the facts, by flag name
+FACT_STATUS_FIELDS = {
+    'early_checkin': 'early_in',
+    'late_checkin': 'late_in',
+    'early_checkout': 'early_out',
+    'late_checkout': 'late_out',
+}
+
+
+class HrAttendanceDailyFact(models.Model):
+    """
+    Attendance figures of an employee for one day, in the employee's timezone.
+    Facts are refreshed before commit whenever an attendance of the day
+    changes, dropped when the shifts of the employee change and built by a
+    daily cron. The attendance report computes the missing days on the fly.
+    """
+    _name = 'hr.attendance.daily.fact'
+    _description = 'Daily Attendance Fact'
+    _order = 'date desc, employee_id'
+    _rec_name = 'employee_id'
+
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True,
+                                  ondelete='cascade', index=True)
+    department_id = fields.Many2one(related='employee_id.department_id', store=True)
+    date = fields.Date(string='Date', required=True, index=True)
+    day_status = fields.Selection([
+        ('present', 'Present'),
+        ('absent', 'Absent'),
+        ('week_off', 'Week Off'),
+    ], string='Day Status', required=True)
+    planned_hours = fields.Float(string='Planned Hours')
+    worked_hours = fields.Float(string='Worked Hours')
+    overtime_hours = fields.Float(string='Over Time')
+    working_days = fields.Integer(string='Working Days',
+                                  help="1 on a scheduled working day or a day worked off schedule")
+    present_days = fields.Integer(string='Present Days')
+    absent_days = fields.Integer(string='Absent Days')
+    week_off_days = fields.Integer(string='Week Offs')
+    attendance_count = fields.Integer(string='Attendances')
+    checked_out_count = fields.Integer(string='Checked Out')
+    early_in = fields.Integer(string='Early In')
+    late_in = fields.Integer(string='Late In')
+    early_out = fields.Integer(string='Early Out')
+    late_out = fields.Integer(string='Late Out')
+
+    _sql_constraints = [
+        ('employee_date_uniq', 'unique(employee_id, date)',
+         'An employee can only have one attendance fact per day.'),
+    ]
+
+    @api.model
+    def _get_employee_tz(self, employee):
+        return pytz.timezone(employee.tz or 'UTC')
+
+    @api.model
+    def _get_fact_days(self, employees, date_from, date_to):
+        """
+        Return {employee: (first day, last day)} of the facts the employees
+        can have in the range: not before the employee was created and not
+        after the current day in the employee's timezone.
+        """
+        fact_days = {}
+        for employee in employees:
+            emp_tz = self._get_employee_tz(employee)
+            created = pytz.utc.localize(employee.create_date).astimezone(emp_tz).date()
+            first_day = max(date_from, created)
+            last_day = min(date_to, datetime.now(emp_tz).date())
+            if first_day <= last_day:
+                fact_days[employee] = (first_day, last_day)
+        return fact_days
+
+    @api.model
+    def _ensure_daily_facts(self, employee_ids, date_from, date_to):
+        """Build the missing facts of the employees over the date range"""
+        self._refresh_pending_facts()
+        if not employee_ids:
+            return
+        self.flush_model()
+        self._cr.execute(f"""
+            SELECT employee_id, date FROM {self._table}
+             WHERE employee_id IN %s AND date BETWEEN %s AND %s
+        """, [tuple(employee_ids), date_from, date_to])
+        existing_keys = set(self._cr.fetchall())
+        employees = self.env['hr.employee'].sudo().with_context(active_test=False).browse(employee_ids)
+        missing_keys = []
+        for employee, (first_day, last_day) in self._get_fact_days(employees, date_from, date_to).items():
+            for offset in range((last_day - first_day).days + 1):
+                key = (employee.id, first_day + timedelta(days=offset))
+                if key not in existing_keys:
+                    missing_keys.append(key)
+        if missing_keys:
+            facts = self._refresh_facts(missing_keys)
+            _logger.info(f"Built {len(facts)} daily attendance facts between {date_from} and {date_to}.")
+
+    @api.model
+    def _refresh_facts(self, keys):
+        """Recompute and store the facts of the given (employee id, date) keys"""
+        keys = set(keys)
+        if not keys:
+            return self
+        vals_list = self._compute_fact_vals(keys)
+        # Facts out of the employees' days, e.g. before an employee was created, are dropped
+        stale_keys = keys.difference((vals['employee_id'], vals['date']) for vals in vals_list)
+        if stale_keys:
+            self._delete_facts(stale_keys)
+        if not vals_list:
+            return self
+        return self._upsert_facts(vals_list)
+
+    @api.model
+    def _compute_fact_vals(self, keys):
+        """
+        Compute the values of the facts of the given (employee id, date)
+        keys, without storing them. Keys out of the employees' fact days
+        (see _get_fact_days) get no values.
+        """
+        if not keys:
+            return []
+        employee_ids = {employee_id for employee_id, _day in keys}
+        employees = self.env['hr.employee'].sudo().with_context(active_test=False).browse(employee_ids).exists()
+        fact_days = self._get_fact_days(employees, min(day for _id, day in keys), max(day for _id, day in keys))
+        valid_keys = {}
+        for employee, (first_day, last_day) in fact_days.items():
+            for employee_id, day in keys:
+                if employee_id == employee.id and first_day <= day <= last_day:
+                    valid_keys[(employee_id, day)] = employee
+        if not valid_keys:
+            return []
+
+        # Resolve the shifts of all the keys in one pass per timezone
+        employees_by_tz = {}
+        for employee in set(valid_keys.values()):
+            emp_tz = self._get_employee_tz(employee)
+            employees_by_tz[emp_tz] = employees_by_tz.get(emp_tz, employees.browse()) | employee
+        days = [day for _employee_id, day in valid_keys]
+        for emp_tz, tz_employees in employees_by_tz.items():
+            tz_employees._prefetch_shifts(min(days), max(days), emp_tz)
+
+        stats = self._read_daily_attendance_stats(
+            [(employee_id, day, self._get_employee_tz(employee).zone)
+             for (employee_id, day), employee in valid_keys.items()])
+        vals_list = []
+        for (employee_id, day), employee in sorted(valid_keys.items(), key=lambda item: item[0]):
+            shift = employee._get_employee_shift_for_day(day, self._get_employee_tz(employee))
+            is_scheduled_off = not shift or shift.get('is_holiday')
+            day_stats = stats.get((employee_id, day), {})
+            has_attendance = bool(day_stats.get('attendance_count'))
+            if has_attendance:
+                day_status = 'present'
+            elif is_scheduled_off:
+                day_status = 'week_off'
+            else:
+                day_status = 'absent'
+            vals = {
+                'employee_id': employee_id,
+                'date': day,
+                'day_status': day_status,
+                'planned_hours': shift.get('planned_work_hours', 0.0) if shift else 0.0,
+                'working_days': int(day_status != 'week_off'),
+                'present_days': int(day_status == 'present'),
+                'absent_days': int(day_status == 'absent'),
+                'week_off_days': int(day_status == 'week_off'),
+            }
+            vals.update(day_stats)
+            vals_list.append(vals)
+        return vals_list
+
+    @api.model
+    def _get_report_totals(self, employee_ids, date_from, date_to):
+        """
+        Sum the facts of the employees over the date range, as {employee id:
+        {fact field: sum}}. Nothing is written: the stored facts are read,
+        and the days without a stored fact, or whose attendances changed in
+        the current transaction, are computed on the fly.
+        """
+        if not employee_ids:
+            return {}
+        self.flush_model()
+        self._cr.execute(f"""
+            SELECT employee_id, date, {', '.join(FACT_REPORT_FIELDS)} FROM {self._table}
+             WHERE employee_id IN %s AND date BETWEEN %s AND %s
+        """, [tuple(employee_ids), date_from, date_to])
+        pending_keys = self.env.cr.precommit.data.get(FACT_PRECOMMIT_KEY, set())
+        totals = {}
+
+        def add(employee_id, values):
+            employee_totals = totals.setdefault(employee_id, dict.fromkeys(FACT_REPORT_FIELDS, 0))
+            for fname, value in zip(FACT_REPORT_FIELDS, values):
+                employee_totals[fname] += value or 0
+
+        stored_keys = set()
+        for employee_id, day, *values in self._cr.fetchall():
+            if (employee_id, day) not in pending_keys:
+                stored_keys.add((employee_id, day))
+                add(employee_id, values)
+        employees = self.env['hr.employee'].sudo().with_context(active_test=False).browse(employee_ids)
+        missing_keys = set()
+        for employee, (first_day, last_day) in self._get_fact_days(employees, date_from, date_to).items():
+            for offset in range((last_day - first_day).days + 1):
+                key = (employee.id, first_day + timedelta(days=offset))
+                if key not in stored_keys:
+                    missing_keys.add(key)
+        for vals in self._compute_fact_vals(missing_keys):
+            add(vals['employee_id'], [vals.get(fname, 0) for fname in FACT_REPORT_FIELDS])
+        return totals
+
+    @api.model
+    def _upsert_facts(self, vals_list):
+        """
+        Write the facts with an upsert on (employee_id, date), so that two
+        transactions refreshing the same day overwrite each other's fact
+        instead of failing on the unique constraint. Return the facts.
+        """
+        self.flush_model()
+        employees = self.env['hr.employee'].sudo().with_context(active_test=False).browse(
+            {vals['employee_id'] for vals in vals_list})
+        department_ids = {employee.id: employee.department_id.id or None for employee in employees}
+        fnames = sorted(set().union(*vals_list))
+        columns = fnames + ['department_id', 'create_uid', 'create_date', 'write_uid', 'write_date']
+        updated_columns = [column for column in columns if column not in ('employee_id', 'date',
+                                                                          'create_uid', 'create_date')]
+        now = fields.Datetime.now()
+        rows = []
+        for vals in vals_list:
+            row = [self._fields[fname].convert_to_column(vals.get(fname), self) for fname in fnames]
+            rows.append(tuple(row + [department_ids[vals['employee_id']], self.env.uid, now, self.env.uid, now]))
+
+        fact_ids = []
+        for batch in self._cr.split_for_in_conditions(rows):
+            self._cr.execute(f"""
+                INSERT INTO {self._table} ({', '.join(f'"{column}"' for column in columns)})
+                VALUES {', '.join(['%s'] * len(batch))}
+                ON CONFLICT (employee_id, date) DO UPDATE
+                   SET {', '.join(f'"{column}" = EXCLUDED."{column}"' for column in updated_columns)}
+                RETURNING id
+            """, batch)
+            fact_ids.extend(row[0] for row in self._cr.fetchall())
+        self.invalidate_model()
+        return self.browse(fact_ids)
+
+    @api.model
+    def _read_daily_attendance_stats(self, windows):
+        """
+        Aggregate the attendances per employee and local check-in day.
+        windows is a list of (employee id, date, timezone name). Return
+        {(employee id, date): values of the fact fields}.
+        """
+        Attendance = self.env['hr.attendance']
+        Attendance.flush_model(['employee_id', 'check_in', 'check_out', 'worked_hours',
+                                'overtime_hours', 'status_mask'])
+        employee_ids, days, tz_names = zip(*windows)
+        windows_query = f"""
+            unnest(%s::int[], %s::date[], %s::varchar[]) AS w(employee_id, day, tz)
+            JOIN {Attendance._table} a ON a.employee_id = w.employee_id
+             AND a.check_in >= (w.day::timestamp AT TIME ZONE w.tz) AT TIME ZONE 'UTC'
+             AND a.check_in < ((w.day + 1)::timestamp AT TIME ZONE w.tz) AT TIME ZONE 'UTC'
+        """
+        params = [list(employee_ids), list(days), list(tz_names)]
+
+        # Flags are counted with bit tests on the status bitmask
+        flag_counts = ', '.join(
+            f"COUNT(*) FILTER (WHERE a.status_mask & {STATUS_BITS[name]} != 0)" for name in FACT_STATUS_FIELDS)
+        stats = {}
+        self._cr.execute(f"""
+            SELECT w.employee_id, w.day, COUNT(a.id), COUNT(a.check_out),
+                   COALESCE(SUM(a.worked_hours), 0), COALESCE(SUM(a.overtime_hours), 0), {flag_counts}
+              FROM {windows_query}
+             GROUP BY w.employee_id, w.day
+        """, params)
+        for employee_id, day, attendance_count, checked_out_count, worked_hours, overtime_hours, *counts \
+                in self._cr.fetchall():
+            stats[(employee_id, day)] = {
+                'attendance_count': attendance_count,
+                'checked_out_count': checked_out_count,
+                'worked_hours': worked_hours,
+                'overtime_hours': overtime_hours,
+                **dict(zip(FACT_STATUS_FIELDS.values(), counts)),
+            }
+        return stats
+
+    @api.model
+    def _delete_facts(self, keys):
+        keys = list(keys)
+        self.flush_model()
+        self._cr.execute(f"""
+            DELETE FROM {self._table} f
+             USING unnest(%s::int[], %s::date[]) AS k(employee_id, day)
+             WHERE f.employee_id = k.employee_id AND f.date = k.day
+        """, [[employee_id for employee_id, _day in keys], [day for _employee_id, day in keys]])
+        self.invalidate_model()
+
+    @api.model
+    def _invalidate_facts(self, employee_ids, date_from=None, date_to=None):
+        """Drop the facts of the employees, they are rebuilt when next reported"""
+        if not employee_ids:
+            return
+        query = f"DELETE FROM {self._table} WHERE employee_id IN %s"
+        params = [tuple(employee_ids)]
+        if date_from:
+            query += " AND date >= %s"
+            params.append(date_from)
+        if date_to:
+            query += " AND date <= %s"
+            params.append(date_to)
+        self.flush_model()
+        self._cr.execute(query, params)
+        self.invalidate_model()
+
+    @api.model
+    def _mark_attendances_dirty(self, attendances):
+        """Refresh the facts of the attendances' days before commit"""
+        if attendances._name != 'hr.attendance':
+            # Raw punches of zk.machine.attendance inherit the overrides
+            return
+        keys = set()
+        for attendance in attendances.sudo():
+            if attendance.employee_id and attendance.check_in:
+                emp_tz = self._get_employee_tz(attendance.employee_id)
+                day = pytz.utc.localize(attendance.check_in).astimezone(emp_tz).date()
+                keys.add((attendance.employee_id.id, day))
+        if not keys:
+            return
+        pending_keys = self.env.cr.precommit.data.setdefault(FACT_PRECOMMIT_KEY, set())
+        if not pending_keys:
+            self.env.cr.precommit.add(self._refresh_pending_facts)
+        pending_keys.update(keys)
+
+    @api.model
+    def _refresh_pending_facts(self):
+        """Refresh the facts marked by _mark_attendances_dirty in this transaction"""
+        pending_keys = self.env.cr.precommit.data.pop(FACT_PRECOMMIT_KEY, set())
+        self._refresh_facts(pending_keys)
+
+    @api.model
+    def _cron_ensure_daily_facts(self):
+        """Record the facts of the previous days, absences included"""
+        today = fields.Date.context_today(self)
+        employee_ids = self.env['hr.employee'].sudo().search([]).ids
+        for batch_ids in tools.split_every(FACT_EMPLOYEE_BATCH, employee_ids):
+            self._ensure_daily_facts(list(batch_ids), today - timedelta(days=7), today)
+            self.env.cr.commit()
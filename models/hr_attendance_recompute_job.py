@@ -0,0 +1,177 @@
+# hr_zk_attendance/models/hr_attendance_recompute_job.py
+import logging
+from datetime import datetime, time, timedelta
+from time import monotonic
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_RECOMPUTE_PAST_DAYS = 62
+RECOMPUTE_CHUNK_SIZE = 1000
+# A cron run stops taking new chunks after this long and is triggered again
+RECOMPUTE_TIME_BUDGET = 240
+RECOMPUTED_FIELDS = ['worked_hours', 'status_mask', 'overtime_hours']
+
+
+class HrAttendanceRecomputeJob(models.Model):
+    """
+    Deferred recomputation of the attendance figures (worked hours, status
+    flags, overtime) after a shift change. Jobs are queued whenever the
+    shifts of some days change (see hr.employee.shift.roster
+    _invalidate_roster) and processed by a cron in committed chunks, so
+    that editing a worksheet does not recompute the whole attendance
+    history in the user's request.
+    """
+    _name = 'hr.attendance.recompute.job'
+    _description = 'Attendance Recompute Job'
+    _order = 'id desc'
+
+    name = fields.Char(string='Changed', required=True)
+    calendar_id = fields.Many2one('resource.calendar', string='Working Hours', ondelete='cascade',
+                                  help="Recompute the attendances of the employees with these working hours")
+    employee_ids = fields.Many2many('hr.employee', string='Employees',
+                                    help="Recompute the attendances of these employees")
+    date_from = fields.Date(string='From', help="Empty to recompute the whole history")
+    date_to = fields.Date(string='To', help="Empty to recompute up to the latest attendance")
+    state = fields.Selection([('pending', 'Pending'), ('running', 'In Progress'), ('done', 'Done'),
+                              ('failed', 'Failed')], string='Status', default='pending', required=True)
+    attendance_count = fields.Integer(string='Attendances', readonly=True)
+    done_count = fields.Integer(string='Recomputed', readonly=True)
+    progress = fields.Float(string='Progress', compute='_compute_progress')
+    last_attendance_id = fields.Integer(string='Last Attendance', readonly=True,
+                                        help="Attendances up to this id are recomputed")
+    date_done = fields.Datetime(string='Finished', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+
+    @api.depends('attendance_count', 'done_count', 'state')
+    def _compute_progress(self):
+        for job in self:
+            if job.state == 'done':
+                job.progress = 100.0
+            elif job.attendance_count:
+                job.progress = min(100.0, 100.0 * job.done_count / job.attendance_count)
+            else:
+                job.progress = 0.0
+
+    @api.model
+    def _get_recompute_past_days(self):
+        value = self.env['ir.config_parameter'].sudo().get_param(
+            'hr_zk_attendance.recompute_past_days', DEFAULT_RECOMPUTE_PAST_DAYS)
+        try:
+            return max(0, int(value))
+        except (TypeError, ValueError):
+            return DEFAULT_RECOMPUTE_PAST_DAYS
+
+    @api.model
+    def _enqueue(self, employee_ids=None, calendar_ids=None, date_from=None, date_to=None):
+        """
+        Queue the recomputation of the attendances of the employees, or of
+        the employees with the given working hours, over a date range. The
+        range is limited to the recompute_past_days last days (0 for the
+        whole history). A pending job of the same working hours, or of the
+        same employees, is widened instead of queuing another one.
+        """
+        past_days = self._get_recompute_past_days()
+        if past_days:
+            oldest = fields.Date.context_today(self) - timedelta(days=past_days)
+            date_from = max(date_from, oldest) if date_from else oldest
+            if date_to and date_to < date_from:
+                return self
+        jobs = self.sudo()
+        pending = self.sudo().search([('state', '=', 'pending')])
+        for calendar in self.env['resource.calendar'].sudo().browse(calendar_ids or []):
+            job = pending.filtered(lambda j: j.calendar_id == calendar)[:1]
+            jobs |= job._widen(date_from, date_to) if job else self.sudo().create({
+                'name': calendar.display_name,
+                'calendar_id': calendar.id,
+                'date_from': date_from,
+                'date_to': date_to,
+            })
+        if employee_ids:
+            employees = self.env['hr.employee'].sudo().with_context(active_test=False).browse(employee_ids)
+            job = pending.filtered(lambda j: not j.calendar_id and set(j.employee_ids.ids) == set(employees.ids))[:1]
+            jobs |= job._widen(date_from, date_to) if job else self.sudo().create({
+                'name': ', '.join(employees[:3].mapped('name')) + ('...' if len(employees) > 3 else ''),
+                'employee_ids': [(6, 0, employees.ids)],
+                'date_from': date_from,
+                'date_to': date_to,
+            })
+        if jobs:
+            cron = self.env.ref('hr_zk_attendance.cron_process_recompute_jobs', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+        return jobs
+
+    def _widen(self, date_from, date_to):
+        """Extend the range of a pending job to cover date_from..date_to"""
+        self.write({
+            'date_from': self.date_from and date_from and min(self.date_from, date_from),
+            'date_to': self.date_to and date_to and max(self.date_to, date_to),
+        })
+        return self
+
+    def _get_attendance_domain(self):
+        self.ensure_one()
+        if self.calendar_id:
+            domain = [('employee_id.resource_calendar_id', '=', self.calendar_id.id)]
+        else:
+            domain = [('employee_id', 'in', self.employee_ids.ids)]
+        # Attendances of a day are found by their UTC check-in, with a day of margin for the timezones
+        if self.date_from:
+            domain.append(('check_in', '>=', datetime.combine(self.date_from - timedelta(days=1), time.min)))
+        if self.date_to:
+            domain.append(('check_in', '<=', datetime.combine(self.date_to + timedelta(days=1), time.max)))
+        return domain
+
+    def _process(self, deadline, chunk_size=RECOMPUTE_CHUNK_SIZE):
+        """
+        Recompute the attendances of the job by chunks of increasing ids,
+        committing after each chunk, until done or past the deadline.
+        Return whether the job is finished.
+        """
+        self.ensure_one()
+        Attendance = self.env['hr.attendance'].sudo().with_context(active_test=False)
+        domain = self._get_attendance_domain()
+        if self.state == 'pending':
+            self.write({'state': 'running', 'attendance_count': Attendance.search_count(domain)})
+            self.env.cr.commit()
+        while monotonic() < deadline:
+            attendances = Attendance.search(domain + [('id', '>', self.last_attendance_id)],
+                                            order='id', limit=chunk_size)
+            if not attendances:
+                self.write({'state': 'done', 'date_done': fields.Datetime.now()})
+                self.env.cr.commit()
+                _logger.info(f"Recompute job {self.name}: recomputed {self.done_count} attendances.")
+                return True
+            for fname in RECOMPUTED_FIELDS:
+                self.env.add_to_compute(Attendance._fields[fname], attendances)
+            attendances.flush_recordset(RECOMPUTED_FIELDS)
+            # The daily facts of these days were built with the old figures
+            self.env['hr.attendance.daily.fact']._mark_attendances_dirty(attendances)
+            self.write({
+                'done_count': self.done_count + len(attendances),
+                'last_attendance_id': attendances[-1].id,
+            })
+            self.env.cr.commit()
+        return False
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Process the queued recompute jobs, oldest first, within the time budget"""
+        deadline = monotonic() + RECOMPUTE_TIME_BUDGET
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            try:
+                if not job._process(deadline):
+                    # Out of time, carry on in another run
+                    self.env.ref('hr_zk_attendance.cron_process_recompute_jobs')._trigger()
+                    return
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.error(f"Recompute job {job.name} failed: {e}")
+                job.write({'state': 'failed', 'error': str(e)})
+                self.env.cr.commit()
+
+    def action_retry(self):
+        """Resume the failed jobs where they stopped"""
+        self.filtered(lambda job: job.state == 'failed').write({'state': 'running', 'error': False})
+        self.env.ref('hr_zk_attendance.cron_process_recompute_jobs')._trigger()
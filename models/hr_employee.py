@@ -1,7 +1,88 @@
 # hr_zk_attendance/models/hr_employee.py
-from odoo import fields, models, api
+import threading
+from odoo import fields, models, api, tools
+from odoo.osv import expression
 from datetime import timedelta, datetime, time, date
 import pytz
+from . import attendance_engine
+
+# Attendances computed per shift prefetch, keeps the prefetched shifts within the shift cache
+SHIFT_CONTEXT_BATCH = 5000
+# Sequence whose value is the generation of the shift cache, shared by all the server processes
+SHIFT_CACHE_SEQUENCE = 'hr_zk_attendance_shift_cache_seq'
+# Keys of the shift cache generation read by the transaction and of its pending invalidation
+SHIFT_CACHE_TOKEN_KEY = 'hr_zk_attendance.shift_cache_token'
+SHIFT_CACHE_INVALIDATED_KEY = 'hr_zk_attendance.shift_cache_invalidated'
+
+
+class ShiftCache:
+    """
+    In-process cache of resolved shifts keyed by (employee id, day, timezone).
+    Entries are tagged with the generation of the database's shift cache
+    (see HrEmployee._get_shift_cache_token), so bumping the generation, in
+    any server process, drops every entry of the database.
+    """
+    max_entries = 200000
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, dbname, token, key):
+        with self._lock:
+            entry_token, entries = self._entries.get(dbname, (None, {}))
+            shift = entries.get(key) if entry_token == token else None
+            if shift is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return shift
+
+    def put(self, dbname, token, key, shift):
+        with self._lock:
+            entry_token, entries = self._entries.get(dbname, (None, {}))
+            if entry_token != token or len(entries) >= self.max_entries:
+                entries = {}
+                self._entries[dbname] = (token, entries)
+            entries[key] = shift
+
+    def missing(self, dbname, token, keys):
+        """Return the keys without cached shift, counted as misses"""
+        with self._lock:
+            entry_token, entries = self._entries.get(dbname, (None, {}))
+            if entry_token != token:
+                entries = {}
+            missing_keys = [key for key in keys if key not in entries]
+            self.misses += len(missing_keys)
+            return missing_keys
+
+    def clear(self, dbname):
+        with self._lock:
+            self._entries.pop(dbname, None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'size': sum(len(entries) for _token, entries in self._entries.values()),
+            }
+
+
+shift_cache = ShiftCache()
+
+
+def get_shift_hours(work_from, work_to, break_from, break_to):
+    """Return (is_night_shift, planned_work_hours, break_duration) of a shift"""
+    is_night_shift = work_to < work_from
+    break_duration = max(0, break_to - break_from)
+    if is_night_shift:
+        planned_work_hours = (24.0 - work_from) + work_to - break_duration
+    else:
+        planned_work_hours = work_to - work_from - break_duration
+    return is_night_shift, max(0, planned_work_hours), break_duration
 
 
 class HrEmployee(models.Model):
@@ -10,56 +91,183 @@ class HrEmployee(models.Model):
     device_id_num = fields.Char(string='Biometric Device ID',
                                 help="Give the biometric device id")
 
+    @api.model_create_multi
+    def create(self, vals_list):
+        employees = super().create(vals_list)
+        if any(vals.get('device_id_num') for vals in vals_list):
+            self.env.registry.clear_cache()
+        return employees
+
+    def write(self, vals):
+        res = super().write(vals)
+        if 'device_id_num' in vals or 'active' in vals:
+            self.env.registry.clear_cache()
+        if 'resource_calendar_id' in vals:
+            self._invalidate_shift_cache()
+            self.env['hr.employee.shift.roster']._invalidate_roster(employee_ids=self.ids)
+        return res
+
+    def unlink(self):
+        has_device_user = any(self.mapped('device_id_num'))
+        res = super().unlink()
+        if has_device_user:
+            self.env.registry.clear_cache()
+        return res
+
+    @api.model
+    @tools.ormcache()
+    def _get_device_user_map(self):
+        """
+        Map the biometric device user ids to employee ids, loaded in one query.
+        The mapping is cached across downloads and invalidated whenever an
+        employee's device id changes. When several employees share a device
+        id, the first one in the default order wins, like a search would.
+        """
+        employee_by_user = {}
+        for employee in self.sudo().search_read([('device_id_num', '!=', False)], ['device_id_num']):
+            employee_by_user.setdefault(employee['device_id_num'], employee['id'])
+        return tools.frozendict(employee_by_user)
+
+    def init(self):
+        super().init()
+        self._cr.execute(f"CREATE SEQUENCE IF NOT EXISTS {SHIFT_CACHE_SEQUENCE}")
+
+    @api.model
+    def _get_shift_cache_token(self):
+        """
+        Generation of the shift cache, read once per transaction. Sequences
+        are not transactional, so a generation bumped by another transaction
+        is seen at once.
+        """
+        data = self.env.cr.precommit.data
+        token = data.get(SHIFT_CACHE_TOKEN_KEY)
+        if token is None:
+            # Until the first nextval(), last_value is already the start value
+            self.env.cr.execute(f"SELECT CASE WHEN is_called THEN last_value ELSE 0 END FROM {SHIFT_CACHE_SEQUENCE}")
+            token = data[SHIFT_CACHE_TOKEN_KEY] = self.env.cr.fetchone()[0]
+        return token
+
+    @api.model
+    def _invalidate_shift_cache(self):
+        """
+        Drop the resolved shifts after a worksheet, calendar or night shift
+        schedule change, by bumping the generation of the shift cache. The
+        generation is bumped again after commit, in case a concurrent
+        transaction cached the old shifts in the meantime. On rollback, the
+        shifts this process cached from the rolled back changes are dropped.
+        """
+        cr = self.env.cr
+        cr.execute(f"SELECT nextval('{SHIFT_CACHE_SEQUENCE}')")
+        cr.precommit.data[SHIFT_CACHE_TOKEN_KEY] = cr.fetchone()[0]
+        if cr.postcommit.data.get(SHIFT_CACHE_INVALIDATED_KEY):
+            return
+        cr.postcommit.data[SHIFT_CACHE_INVALIDATED_KEY] = True
+        registry = self.env.registry
+        dbname = cr.dbname
+
+        @cr.postcommit.add
+        def bump_shift_cache_token():
+            with registry.cursor() as new_cr:
+                new_cr.execute(f"SELECT nextval('{SHIFT_CACHE_SEQUENCE}')")
+
+        @cr.postrollback.add
+        def clear_shift_cache():
+            shift_cache.clear(dbname)
+
+    @api.model
+    def get_shift_cache_stats(self):
+        """Hit/miss counters of the shift cache of this server process"""
+        return shift_cache.stats()
+
     def _get_employee_shift_for_day(self, target_day, operating_tz):
+        """
+        Return the shift details of the employee for target_day, memoized per
+        (employee, day, timezone) and read from the stored shift roster when
+        it covers the day. The returned dict is a copy and may be modified by
+        the caller. See _resolve_employee_shift_for_day.
+        """
+        self.ensure_one()
+        dbname = self.env.cr.dbname
+        token = self._get_shift_cache_token()
+        key = (self.id, target_day, operating_tz.zone)
+        shift = shift_cache.get(dbname, token, key)
+        if shift is None:
+            times = self.env['hr.employee.shift.roster']._read_shift_times(
+                self.ids, target_day, target_day).get((self.id, target_day))
+            if times is None:
+                shift = self._resolve_employee_shift_for_day(target_day, operating_tz)
+            else:
+                shift = self._build_shift(target_day, operating_tz, times)
+            shift_cache.put(dbname, token, key, shift)
+        return dict(shift)
+
+    def _prefetch_shifts(self, date_from, date_to, operating_tz):
+        """
+        Resolve and cache the shifts of all the employees for every day of the
+        range that is not cached yet. The stored shift roster is read in one
+        query, the days it does not cover are resolved with the night shift
+        schedules of the whole range loaded at once.
+        """
+        if not self or date_from > date_to:
+            return
+        days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+        dbname = self.env.cr.dbname
+        token = self._get_shift_cache_token()
+        keys = [(employee_id, day, operating_tz.zone) for employee_id in self.ids for day in days]
+        missing_keys = shift_cache.missing(dbname, token, keys)
+        if not missing_keys:
+            return
+        rostered_times = self.env['hr.employee.shift.roster']._read_shift_times(
+            {employee_id for employee_id, _day, _tz_name in missing_keys}, date_from, date_to)
+        schedule_index = None
+        for employee_id, day, _tz_name in missing_keys:
+            employee = self.browse(employee_id)
+            times = rostered_times.get((employee_id, day))
+            if times is None:
+                if schedule_index is None:
+                    schedule_index = self.env['hr.night.shift.schedule']._get_schedule_index(
+                        date_from, date_to, self.ids)
+                times = employee._resolve_employee_shift_times(day, schedule_index)
+            shift = self._build_shift(day, operating_tz, times)
+            shift_cache.put(dbname, token, (employee_id, day, operating_tz.zone), shift)
+
+    def _resolve_employee_shift_for_day(self, target_day, operating_tz, schedule_index=None):
         """
         Helper method to get shift details.
         It first checks for a specific night shift schedule for the given day.
         If found, it builds the shift dynamically.
         If not found, it falls back to the employee's default resource calendar.
+        A preloaded schedule_index (see _get_schedule_index) avoids the search.
+        """
+        self.ensure_one()
+        times = self._resolve_employee_shift_times(target_day, schedule_index)
+        return self._build_shift(target_day, operating_tz, times)
+
+    def _resolve_employee_shift_times(self, target_day, schedule_index=None):
+        """
+        Return the shift timings of the employee for target_day as hours of
+        the day, independent of any timezone: a dict with work_from, work_to,
+        break_from, break_to, is_holiday and calendar_id.
         """
         self.ensure_one()
         employee = self
 
         # Check for a specific overriding shift schedule for the target day
-        night_shift_schedule = self.env['hr.night.shift.schedule'].search([
-            ('employee_ids', 'in', employee.id),
-            ('date_from', '<=', target_day),
-            ('date_to', '>=', target_day),
-        ], limit=1, order='create_date desc')
+        if schedule_index is not None and schedule_index.covers(target_day):
+            night_shift_schedule = schedule_index.lookup(employee.id, target_day)
+        else:
+            night_shift_schedule = self.env['hr.night.shift.schedule'].search([
+                ('employee_ids', 'in', employee.id),
+                ('date_from', '<=', target_day),
+                ('date_to', '>=', target_day),
+            ], limit=1, order='create_date desc')
 
         if night_shift_schedule:
-            # Dynamically build shift from the schedule record
-            work_from_hr = night_shift_schedule.time_from
-            work_to_hr = night_shift_schedule.time_to
-            break_from_hr = night_shift_schedule.break_from
-            break_to_hr = night_shift_schedule.break_to
-
-            is_night_shift = work_to_hr < work_from_hr
-            break_duration = max(0, break_to_hr - break_from_hr)
-            
-            if is_night_shift:
-                planned_work_hours = (24.0 - work_from_hr) + work_to_hr - break_duration
-            else:
-                planned_work_hours = work_to_hr - work_from_hr - break_duration
-            
-            start_dt_naive = datetime.combine(target_day, time.min) + timedelta(hours=work_from_hr)
-            break_from_naive = datetime.combine(target_day, time.min) + timedelta(hours=break_from_hr)
-            break_to_naive = datetime.combine(target_day, time.min) + timedelta(hours=break_to_hr)
-
-            end_day = target_day
-            if is_night_shift:
-                end_day += timedelta(days=1)
-
-            end_dt_naive = datetime.combine(end_day, time.min) + timedelta(hours=work_to_hr)
-            
             return {
-                'start_local': operating_tz.localize(start_dt_naive),
-                'end_local': operating_tz.localize(end_dt_naive),
-                'break_from_local': operating_tz.localize(break_from_naive),
-                'break_to_local': operating_tz.localize(break_to_naive),
-                'is_night_shift': is_night_shift,
-                'planned_work_hours': max(0, planned_work_hours),
-                'break_duration': break_duration,
+                'work_from': night_shift_schedule.time_from,
+                'work_to': night_shift_schedule.time_to,
+                'break_from': night_shift_schedule.break_from,
+                'break_to': night_shift_schedule.break_to,
                 'is_holiday': False,
                 'calendar_id': None,  # No specific calendar is used
             }
@@ -67,7 +275,7 @@ class HrEmployee(models.Model):
         # Fallback to default resource calendar
         resource_calendar = employee.resource_calendar_id
         if not resource_calendar:
-            return {'planned_work_hours': 0.0, 'is_holiday': True}
+            return {'is_holiday': True, 'calendar_id': None}
 
         day_of_week_str = target_day.strftime('%A').lower()
         worksheet = resource_calendar.worksheet_ids.filtered(
@@ -75,21 +283,32 @@ class HrEmployee(models.Model):
         )
 
         if not worksheet or (worksheet.work_from == 0 and worksheet.work_to == 0):
-            return {'planned_work_hours': 0.0, 'is_holiday': True, 'calendar_id': resource_calendar.id}
-
-        work_from_hr = worksheet.work_from
-        work_to_hr = worksheet.work_to
-        break_from_hr = worksheet.break_from
-        break_to_hr = worksheet.break_to
-
-        is_night_shift = work_to_hr < work_from_hr
-        break_duration = max(0, break_to_hr - break_from_hr)
+            return {'is_holiday': True, 'calendar_id': resource_calendar.id}
 
-        if is_night_shift:
-             planned_work_hours = (24.0 - work_from_hr) + work_to_hr - break_duration
-        else:
-             planned_work_hours = work_to_hr - work_from_hr - break_duration
+        return {
+            'work_from': worksheet.work_from,
+            'work_to': worksheet.work_to,
+            'break_from': worksheet.break_from,
+            'break_to': worksheet.break_to,
+            'is_holiday': False,
+            'calendar_id': resource_calendar.id,
+        }
 
+    @api.model
+    def _build_shift(self, target_day, operating_tz, times):
+        """Build the shift details of target_day from its timings (see _resolve_employee_shift_times)"""
+        if times['is_holiday']:
+            shift = {'planned_work_hours': 0.0, 'is_holiday': True}
+            if times['calendar_id']:
+                shift['calendar_id'] = times['calendar_id']
+            return shift
+
+        work_from_hr = times['work_from']
+        work_to_hr = times['work_to']
+        break_from_hr = times['break_from']
+        break_to_hr = times['break_to']
+        is_night_shift, planned_work_hours, break_duration = get_shift_hours(
+            work_from_hr, work_to_hr, break_from_hr, break_to_hr)
 
         start_dt_naive = datetime.combine(target_day, time.min) + timedelta(hours=work_from_hr)
         break_from_naive = datetime.combine(target_day, time.min) + timedelta(hours=break_from_hr)
@@ -107,10 +326,10 @@ class HrEmployee(models.Model):
             'break_from_local': operating_tz.localize(break_from_naive),
             'break_to_local': operating_tz.localize(break_to_naive),
             'is_night_shift': is_night_shift,
-            'planned_work_hours': max(0, planned_work_hours),
+            'planned_work_hours': planned_work_hours,
             'break_duration': break_duration,
             'is_holiday': False,
-            'calendar_id': resource_calendar.id,
+            'calendar_id': times['calendar_id'],
         }
 
     # ... The rest of the file (_compute_attendance_report_data, HrAttendance class, etc.) remains unchanged ...
@@ -128,10 +347,12 @@ class HrEmployee(models.Model):
     x_extra_work_hours = fields.Float(string="Total Extra Work", compute='_compute_attendance_report_data')
 
     def _compute_attendance_report_data(self):
-        """Computes attendance statistics based on context date filters."""
-        user_tz = pytz.timezone(self.env.user.tz or 'UTC')
-        today = fields.Date.context_today(self, timestamp=datetime.now(user_tz))
-
+        """
+        Computes attendance statistics based on context date filters, either
+        a named period (report_date_filter) or an explicit range
+        (report_date_from, report_date_to). The figures are summed from the
+        daily attendance facts, the missing days computed without storing them.
+        """
         user_tz = pytz.timezone(self.env.user.tz or 'UTC')
         today = fields.Date.context_today(self, timestamp=datetime.now(user_tz))
 
@@ -147,122 +368,65 @@ class HrEmployee(models.Model):
             date_from = today.replace(day=1)
             next_month = date_from.replace(day=28) + timedelta(days=4)
             date_to = next_month - timedelta(days=next_month.day)
-
-        Attendance = self.env['hr.attendance']
+        if self.env.context.get('report_date_from'):
+            date_from = fields.Date.to_date(self.env.context['report_date_from'])
+        if self.env.context.get('report_date_to'):
+            date_to = fields.Date.to_date(self.env.context['report_date_to'])
+
+        def reset_fields(employee):
+            employee.x_working_days = "0/0"
+            employee.x_week_offs = 0
+            employee.x_absent_days = 0
+            employee.x_early_in = 0
+            employee.x_late_in = 0
+            employee.x_early_out = 0
+            employee.x_late_out = 0
+            employee.x_worked_hours = 0.0
+            employee.x_extra_work_hours = 0.0
+            employee.x_on_time_check_in = 0
+            employee.x_on_time_check_out = 0
+
+        # Employees without working hours are only reported when a night
+        # shift schedule was ever assigned to them
+        scheduled_ids = self._get_night_shift_employee_ids()
+        reported_ids = []
         for employee in self:
-            employee_create_date = fields.Datetime.context_timestamp(
-                employee, employee.create_date).date()
-            calculation_start_date = max(date_from, employee_create_date)
-
-            def reset_fields():
-                employee.x_working_days = "0/0"
-                employee.x_week_offs = 0
-                employee.x_absent_days = 0
-                employee.x_early_in = 0
-                employee.x_late_in = 0
-                employee.x_early_out = 0
-                employee.x_late_out = 0
-                employee.x_worked_hours = 0.0
-                employee.x_extra_work_hours = 0.0
-                employee.x_on_time_check_in = 0
-                employee.x_on_time_check_out = 0
-
-            if calculation_start_date > date_to or (not employee.resource_calendar_id and not self.env['hr.night.shift.schedule'].search_count([('employee_ids', 'in', employee.id)])):
-                reset_fields()
+            reset_fields(employee)
+            if not employee.id or not employee.create_date:
                 continue
-
-            emp_tz = pytz.timezone(employee.tz or self.env.user.tz or 'UTC')
-            start_dt_utc = emp_tz.localize(
-                datetime.combine(calculation_start_date, time.min)
-            ).astimezone(pytz.utc)
-            end_dt_utc = emp_tz.localize(
-                datetime.combine(date_to, time.max)
-            ).astimezone(pytz.utc)
-
-            attendances = Attendance.search([
-                ('employee_id', '=', employee.id),
-                ('check_in', '>=', start_dt_utc.replace(tzinfo=None)),
-                ('check_in', '<=', end_dt_utc.replace(tzinfo=None)),
-            ])
-            attendances_by_date = {}
-            for att in attendances:
-                att_date = att.check_in.astimezone(emp_tz).date()
-                attendances_by_date[att_date] = att
-
-            working_days, present_days, week_offs, absent_days = 0, 0, 0, 0
-            current_date = calculation_start_date
-            while current_date <= date_to:
-                if current_date > today:
-                    current_date += timedelta(days=1)
-                    continue
-                
-                shift = employee._get_employee_shift_for_day(current_date, emp_tz)
-                is_scheduled_off = not shift or shift.get('is_holiday')
-                has_attendance = current_date in attendances_by_date
-
-                if not is_scheduled_off:
-                    working_days += 1
-                    if has_attendance:
-                        present_days += 1
-                    else:
-                        absent_days += 1
-                else:
-                    if has_attendance:
-                        absent_days += 1
-                else:
-                    if has_attendance:
-                        working_days += 1
-                        present_days += 1
-                    else:
-                        week_offs += 1
-                        present_days += 1
-                    else:
-                        week_offs += 1
-                current_date += timedelta(days=1)
-
-            employee.x_working_days = f"{present_days}/{working_days}"
-            employee.x_week_offs = week_offs
-            employee.x_absent_days = absent_days
-            employee.x_working_days = f"{present_days}/{working_days}"
-            employee.x_week_offs = week_offs
-            employee.x_absent_days = absent_days
-
-            if attendances:
-                status_tags = attendances.mapped('status_ids.name')
-                employee.x_early_in = status_tags.count('early_checkin')
-                employee.x_late_in = status_tags.count('late_checkin')
-                employee.x_early_out = status_tags.count('early_checkout')
-                employee.x_late_out = status_tags.count('late_checkout')
-                employee.x_worked_hours = sum(attendances.mapped('worked_hours'))
-                employee.x_extra_work_hours = sum(
-                    attendances.mapped('overtime_hours'))
-                on_time_in = present_days - (
-                        employee.x_late_in + employee.x_early_in)
-                employee.x_on_time_check_in = max(0, on_time_in)
-
-                checked_out_days = len(attendances.filtered(lambda a: a.check_out))
-                on_time_out = checked_out_days - (
-                        employee.x_early_out + employee.x_late_out)
-                employee.x_on_time_check_out = max(0, on_time_out)
-                employee.x_extra_work_hours = sum(
-                    attendances.mapped('overtime_hours'))
-                on_time_in = present_days - (
-                        employee.x_late_in + employee.x_early_in)
-                employee.x_on_time_check_in = max(0, on_time_in)
-
-                checked_out_days = len(attendances.filtered(lambda a: a.check_out))
-                on_time_out = checked_out_days - (
-                        employee.x_early_out + employee.x_late_out)
-                employee.x_on_time_check_out = max(0, on_time_out)
-            else:
-                reset_fields()
-                employee.x_working_days = f"0/{working_days}"
-                employee.x_week_offs = week_offs
-                employee.x_absent_days = absent_days
-                reset_fields()
-                employee.x_working_days = f"0/{working_days}"
-                employee.x_week_offs = week_offs
-                employee.x_absent_days = absent_days
+            if not employee.resource_calendar_id and employee.id not in scheduled_ids:
+                continue
+            reported_ids.append(employee.id)
+        if not reported_ids:
+            return
+
+        totals_by_employee = self.env['hr.attendance.daily.fact']._get_report_totals(
+            reported_ids, date_from, min(date_to, today))
+        for employee_id, totals in totals_by_employee.items():
+            employee = self.browse(employee_id)
+            employee.x_working_days = f"{totals['present_days']}/{totals['working_days']}"
+            employee.x_week_offs = totals['week_off_days']
+            employee.x_absent_days = totals['absent_days']
+            employee.x_early_in = totals['early_in']
+            employee.x_late_in = totals['late_in']
+            employee.x_early_out = totals['early_out']
+            employee.x_late_out = totals['late_out']
+            employee.x_worked_hours = totals['worked_hours']
+            employee.x_extra_work_hours = totals['overtime_hours']
+            employee.x_on_time_check_in = max(0, totals['present_days'] - (totals['late_in'] + totals['early_in']))
+            employee.x_on_time_check_out = max(
+                0, totals['checked_out_count'] - (totals['early_out'] + totals['late_out']))
+
+    def _get_night_shift_employee_ids(self):
+        """Ids of the employees of self with any night shift schedule"""
+        if not self.ids:
+            return set()
+        field = self.env['hr.night.shift.schedule']._fields['employee_ids']
+        self.env['hr.night.shift.schedule'].flush_model(['employee_ids'])
+        self.env.cr.execute(f"""
+            SELECT DISTINCT {field.column2} FROM {field.relation} WHERE {field.column2} IN %s
+        """, [tuple(self.ids)])
+        return {employee_id for employee_id, in self.env.cr.fetchall()}
 
 class AttendanceStatusTag(models.Model):
     _name = 'hr.attendance.status.tag'
@@ -270,183 +434,196 @@ class AttendanceStatusTag(models.Model):
     name = fields.Char(string='Status', required=True)
     color = fields.Integer(string='Color Index')
 
+    def init(self):
+        """Create the tags of the status flags, see attendance_engine.STATUS_BITS"""
+        self._cr.execute(f"""
+            INSERT INTO {self._table} (name, color, create_uid, create_date, write_uid, write_date)
+            SELECT flag.name, 0, %s, NOW() AT TIME ZONE 'UTC', %s, NOW() AT TIME ZONE 'UTC'
+              FROM unnest(%s::varchar[]) AS flag(name)
+             WHERE NOT EXISTS (SELECT 1 FROM {self._table} t WHERE t.name = flag.name)
+        """, [self.env.uid, self.env.uid, list(attendance_engine.STATUS_BITS)])
+
+    @api.model
+    def _get_tag_ids(self, names):
+        """Return {name: tag id} of the status names that have a tag"""
+        tag_ids = {}
+        for tag in self.sudo().search_fetch([('name', 'in', list(names))], ['name'], order='id'):
+            tag_ids.setdefault(tag.name, tag.id)
+        return tag_ids
+
 
 class HrAttendance(models.Model):
     _inherit = 'hr.attendance'
     was_missing_checkin = fields.Boolean(string="Was Missing Check-In", readonly=True, copy=False)
     was_missing_checkout = fields.Boolean(string="Was Missing Check-Out", readonly=True, copy=False)
-    worked_hours = fields.Float(string='Worked Hours', compute='_compute_worked_hours', store=True, readonly=True)
-    was_missing_checkin = fields.Boolean(string="Was Missing Check-In", readonly=True, copy=False)
-    was_missing_checkout = fields.Boolean(string="Was Missing Check-Out", readonly=True, copy=False)
-    worked_hours = fields.Float(string='Worked Hours', compute='_compute_worked_hours', store=True, readonly=True)
-
-    @api.depends('check_in', 'check_out', 'employee_id.resource_calendar_id')
-    @api.depends('check_in', 'check_out', 'employee_id.resource_calendar_id')
-    def _compute_worked_hours(self):
-        """
-        # FIXED LOGIC
-        Calculates worked hours, accurately subtracting ONLY the overlapping
-        portion of the scheduled break time.
-        # FIXED LOGIC
-        Calculates worked hours, accurately subtracting ONLY the overlapping
-        portion of the scheduled break time.
-        """
-        for att in self:
-            if not att.check_out or not att.check_in or not att.employee_id:
-            if not att.check_out or not att.check_in or not att.employee_id:
-                att.worked_hours = 0.0
-                continue
-
-            # Get timezone and localize check-in/out times
-            user_tz = pytz.timezone(att.employee_id.tz or self.env.user.tz or 'UTC')
-            check_in_local = att.check_in.astimezone(user_tz)
-            check_out_local = att.check_out.astimezone(user_tz)
-
-            # Get the correct shift for the day
-            shift = att.employee_id._get_employee_shift_for_day(check_in_local.date(), user_tz)
-
-            if not shift or shift.get('is_holiday'):
-                total_duration_seconds = (att.check_out - att.check_in).total_seconds()
-                att.worked_hours = max(0, total_duration_seconds / 3600.0)
-                continue
-
-            # Get shift break times (they are already localized from the helper)
-            break_from_local = shift.get('break_from_local') if shift else None
-            break_to_local = shift.get('break_to_local') if shift else None
-
-            # Calculate the actual duration of the break that overlaps with the work period
-            break_overlap_seconds = 0
-            if break_from_local and break_to_local:
-                # Find the intersection between the work period and the break period
-                overlap_start = max(check_in_local, break_from_local)
-                overlap_end = min(check_out_local, break_to_local)
-
-                if overlap_end > overlap_start:
-                    break_overlap_seconds = (overlap_end - overlap_start).total_seconds()
-
-            # Calculate total duration and subtract the break overlap
-            total_duration_seconds = (att.check_out - att.check_in).total_seconds()
-            worked_seconds = total_duration_seconds - break_overlap_seconds
-            att.worked_hours = max(0, worked_seconds / 3600.0)
-
-    status_ids = fields.Many2many('hr.attendance.status.tag', string='Status', compute='_compute_status_ids', store=True)
-    overtime_hours = fields.Float(string="Over Time", compute='_compute_overtime_hours', store=True)
+    worked_hours = fields.Float(string='Worked Hours', compute='_compute_attendance_figures', store=True,
+                                readonly=True)
+    status_mask = fields.Integer(string="Status Flags", compute='_compute_attendance_figures', store=True,
+                                 readonly=True,
+                                 help="Status flags of the attendance as a bitmask, see attendance_engine.STATUS_BITS")
+    status_ids = fields.Many2many('hr.attendance.status.tag', string='Status', compute='_compute_status_ids',
+                                  search='_search_status_ids',
+                                  help="Tags of the status flags, derived from the status bitmask")
+    overtime_hours = fields.Float(string="Over Time", compute='_compute_attendance_figures', store=True,
+                                  readonly=True)
     notification_sent = fields.Boolean(string="Notification Sent", default=False)
 
-    @api.depends('check_in', 'check_out', 'employee_id.resource_calendar_id.worksheet_ids',
-                 'is_corrected', 'was_missing_checkin', 'was_missing_checkout')
-    @api.depends('check_in', 'check_out', 'employee_id.resource_calendar_id.worksheet_ids',
-                 'is_corrected', 'was_missing_checkin', 'was_missing_checkout')
+    @api.depends('status_mask')
     def _compute_status_ids(self):
-        StatusTag = self.env['hr.attendance.status.tag']
-        status_tag_cache = {tag.name: tag for tag in StatusTag.search([])}
-
-        def get_tag(name):
-            if name not in status_tag_cache:
-                tag = StatusTag.create({'name': name})
-                status_tag_cache[name] = tag
-            return status_tag_cache[name]
-
+        tag_ids = self.env['hr.attendance.status.tag']._get_tag_ids(list(attendance_engine.STATUS_BITS))
         for att in self:
-            status_flags = set()
-            if not att.check_in or not att.employee_id:
-                att.status_ids = False
-                continue
-
-            if att.was_missing_checkin and not att.is_corrected:
-                status_flags.add("Missed checkin")
-                status_flags.add("Missed checkin")
-            if att.was_missing_checkout and not att.is_corrected:
-                status_flags.add("Missed checkout")
-                status_flags.add("Missed checkout")
+            att.status_ids = [(6, 0, [tag_ids[name] for name in attendance_engine.mask_to_status(att.status_mask)
+                                      if name in tag_ids])]
 
-            user_tz = pytz.timezone(
-                att.employee_id.tz or self.env.user.tz or 'UTC')
-            user_tz = pytz.timezone(
-                att.employee_id.tz or self.env.user.tz or 'UTC')
-            check_in_local = att.check_in.astimezone(user_tz)
-            shift = att.employee_id._get_employee_shift_for_day(
-                check_in_local.date(), user_tz)
-            shift = att.employee_id._get_employee_shift_for_day(
-                check_in_local.date(), user_tz)
-
-            if not shift or shift.get('is_holiday'):
-                status_flags.add("Holiday Work")
-                if att.worked_hours > 0:
-                    status_flags.add("extra_hours")
-                if att.was_missing_checkout:
-                     status_flags.add("Missed checkout")
-                att.status_ids = [(6, 0, [get_tag(flag).id for flag in status_flags])]
-                continue
-
-            shift_start_local = shift['start_local']
-            shift_end_local = shift['end_local']
-
-            if check_in_local < shift_start_local:
-                status_flags.add("early_checkin")
-            if check_in_local > (shift_start_local + timedelta(minutes=10)):
-                status_flags.add("late_checkin")
-
-            if att.check_out:
-                check_out_local = att.check_out.astimezone(user_tz)
-                if check_out_local < shift_end_local:
-                    status_flags.add("early_checkout")
-                if check_out_local > shift_end_local:
-                    status_flags.add("late_checkout")
-                if shift['is_night_shift']:
-                    status_flags.add('night_shift')
-
-                worked_seconds = att.worked_hours * 3600
-                planned_seconds = (shift['planned_work_hours'] * 3600)
-                worked_seconds = att.worked_hours * 3600
-                planned_seconds = (shift['planned_work_hours'] * 3600)
-
-                if worked_seconds > planned_seconds + 60:
-                    status_flags.add("extra_hours")
-                elif worked_seconds < planned_seconds - 60:
-                    status_flags.add("less_hours")
-            else:
-                if att.check_in.date() < datetime.now(
-                        user_tz).date() and not att.was_missing_checkout:
-                    status_flags.add("Missed checkout")
-                if att.check_in.date() < datetime.now(
-                        user_tz).date() and not att.was_missing_checkout:
-                    status_flags.add("Missed checkout")
-
-            status_tags = [get_tag(flag) for flag in status_flags]
-            att.status_ids = [(6, 0, [tag.id for tag in status_tags])]
-
-    @api.depends('worked_hours', 'employee_id.resource_calendar_id')
-    @api.depends('worked_hours', 'employee_id.resource_calendar_id')
-    def _compute_overtime_hours(self):
-        """Calculates overtime based on the new accurate worked_hours."""
-        """Calculates overtime based on the new accurate worked_hours."""
+    def _search_status_ids(self, operator, value):
+        """Search the attendances having any of the status tags, on the bitmask"""
+        StatusTag = self.env['hr.attendance.status.tag']
+        negative = operator in ('not in', '!=')
+        if operator in ('in', 'not in', '=', '!=') and not isinstance(value, str):
+            tag_ids = [tag_id for tag_id in (value if isinstance(value, (list, tuple)) else [value]) if tag_id]
+            if not tag_ids:
+                # status_ids = False, attendances without any status
+                return [('status_mask', '!=' if negative else '=', 0)]
+            names = StatusTag.browse(tag_ids).mapped('name')
+        elif operator in ('=', '!=') and value in attendance_engine.STATUS_BITS:
+            # Flag name, e.g. from the search filters, no tag lookup needed
+            names = [value]
+        else:
+            names = StatusTag.search([('name', operator, value)]).mapped('name')
+        mask = attendance_engine.status_to_mask(names)
+        if not mask:
+            return expression.TRUE_DOMAIN if negative else expression.FALSE_DOMAIN
+        query = self._search([])
+        query.add_where(f'"{self._table}"."status_mask" & %s != 0', [mask])
+        return [('id', 'not in' if negative else 'in', query)]
+
+    def _get_shift_context(self):
+        """
+        Return {attendance id: (timezone, local check-in, shift)} of the
+        attendances with a check-in and an employee. The shifts of all their
+        employees and days are prefetched at once, per timezone.
+        """
+        default_tz = self.env.user.tz or 'UTC'
+        tz_by_employee = {}
+        check_ins = {}
+        days_by_tz = {}
         for att in self:
             if not att.check_in or not att.employee_id:
-            if not att.check_in or not att.employee_id:
-                att.overtime_hours = 0.0
                 continue
-
-            user_tz = pytz.timezone(
-                att.employee_id.tz or self.env.user.tz or 'UTC')
-            user_tz = pytz.timezone(
-                att.employee_id.tz or self.env.user.tz or 'UTC')
+            employee = att.employee_id
+            if employee.id not in tz_by_employee:
+                tz_by_employee[employee.id] = pytz.timezone(employee.tz or default_tz)
+            user_tz = tz_by_employee[employee.id]
             check_in_local = att.check_in.astimezone(user_tz)
-            shift = att.employee_id._get_employee_shift_for_day(
-                check_in_local.date(), user_tz)
-            shift = att.employee_id._get_employee_shift_for_day(
-                check_in_local.date(), user_tz)
-
-            if not shift or shift.get('is_holiday'):
-                att.overtime_hours = att.worked_hours
-                continue
-            
-            if not shift.get('planned_work_hours'):
-                att.overtime_hours = 0.0
-                continue
+            check_ins[att.id] = (att, user_tz, check_in_local)
+            employee_ids, days = days_by_tz.setdefault(user_tz, (set(), set()))
+            employee_ids.add(employee.id)
+            days.add(check_in_local.date())
+        Employee = self.env['hr.employee']
+        for user_tz, (employee_ids, days) in days_by_tz.items():
+            Employee.browse(employee_ids)._prefetch_shifts(min(days), max(days), user_tz)
+        return {
+            att_id: (user_tz, check_in_local,
+                     att.employee_id._get_employee_shift_for_day(check_in_local.date(), user_tz))
+            for att_id, (att, user_tz, check_in_local) in check_ins.items()
+        }
 
-            att.overtime_hours = att.worked_hours - shift['planned_work_hours']
-            att.overtime_hours = att.worked_hours - shift['planned_work_hours']
+    @api.depends('check_in', 'check_out', 'employee_id',
+                 'is_corrected', 'was_missing_checkin', 'was_missing_checkout')
+    def _compute_attendance_figures(self):
+        """
+        Compute worked_hours, status_mask and overtime_hours in one pass,
+        the timezone and shift of every attendance being resolved once for
+        the three, in batches sharing a shift prefetch. Shift changes do not
+        trigger it, they queue a hr.attendance.recompute.job instead.
+        """
+        for batch in tools.split_every(SHIFT_CONTEXT_BATCH, self.ids, self.browse):
+            shift_context = batch._get_shift_context()
+            for att in batch:
+                if att.id not in shift_context:
+                    att.worked_hours = 0.0
+                    att.status_mask = 0
+                    att.overtime_hours = 0.0
+                    continue
+                user_tz, check_in_local, shift = shift_context[att.id]
+                worked_hours = att._get_worked_hours(user_tz, check_in_local, shift)
+                att.worked_hours = worked_hours
+                att.status_mask = attendance_engine.status_to_mask(
+                    att._get_status_flags(user_tz, check_in_local, shift, worked_hours))
+                att.overtime_hours = att._get_overtime_hours(shift, worked_hours)
+
+    def _get_worked_hours(self, user_tz, check_in_local, shift):
+        """
+        Calculates worked hours, accurately subtracting ONLY the overlapping
+        portion of the scheduled break time.
+        """
+        if not self.check_out:
+            return 0.0
+        check_out_local = self.check_out.astimezone(user_tz)
+        total_duration_seconds = (self.check_out - self.check_in).total_seconds()
+        if not shift or shift.get('is_holiday'):
+            return max(0, total_duration_seconds / 3600.0)
+
+        # Calculate the actual duration of the break that overlaps with the work period
+        break_from_local = shift.get('break_from_local')
+        break_to_local = shift.get('break_to_local')
+        break_overlap_seconds = 0
+        if break_from_local and break_to_local:
+            overlap_start = max(check_in_local, break_from_local)
+            overlap_end = min(check_out_local, break_to_local)
+            if overlap_end > overlap_start:
+                break_overlap_seconds = (overlap_end - overlap_start).total_seconds()
+        return max(0, (total_duration_seconds - break_overlap_seconds) / 3600.0)
+
+    def _get_status_flags(self, user_tz, check_in_local, shift, worked_hours):
+        """Status flags of the attendance, see attendance_engine.STATUS_BITS"""
+        status_flags = set()
+        if self.was_missing_checkin and not self.is_corrected:
+            status_flags.add("Missed checkin")
+        if self.was_missing_checkout and not self.is_corrected:
+            status_flags.add("Missed checkout")
+
+        if not shift or shift.get('is_holiday'):
+            status_flags.add("Holiday Work")
+            if worked_hours > 0:
+                status_flags.add("extra_hours")
+            if self.was_missing_checkout:
+                status_flags.add("Missed checkout")
+            return status_flags
+
+        shift_start_local = shift['start_local']
+        shift_end_local = shift['end_local']
+        if check_in_local < shift_start_local:
+            status_flags.add("early_checkin")
+        if check_in_local > (shift_start_local + timedelta(minutes=10)):
+            status_flags.add("late_checkin")
+
+        if self.check_out:
+            check_out_local = self.check_out.astimezone(user_tz)
+            if check_out_local < shift_end_local:
+                status_flags.add("early_checkout")
+            if check_out_local > shift_end_local:
+                status_flags.add("late_checkout")
+            if shift['is_night_shift']:
+                status_flags.add('night_shift')
+
+            worked_seconds = worked_hours * 3600
+            planned_seconds = (shift['planned_work_hours'] * 3600)
+            if worked_seconds > planned_seconds + 60:
+                status_flags.add("extra_hours")
+            elif worked_seconds < planned_seconds - 60:
+                status_flags.add("less_hours")
+        elif self.check_in.date() < datetime.now(user_tz).date() and not self.was_missing_checkout:
+            status_flags.add("Missed checkout")
+        return status_flags
+
+    def _get_overtime_hours(self, shift, worked_hours):
+        """Overtime of the worked hours over the planned hours of the shift"""
+        if not shift or shift.get('is_holiday'):
+            return worked_hours
+        if not shift.get('planned_work_hours'):
+            return 0.0
+        return worked_hours - shift['planned_work_hours']
 
     @api.constrains('check_in', 'check_out', 'employee_id')
     def _check_validity(self):
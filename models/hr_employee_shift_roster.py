@@ -0,0 +1,209 @@
+# hr_zk_attendance/models/hr_employee_shift_roster.py
+import logging
+from datetime import timedelta
+from odoo import api, fields, models, tools
+from .hr_employee import get_shift_hours
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_ROSTER_PAST_DAYS = 62
+DEFAULT_ROSTER_HORIZON_DAYS = 31
+ROSTER_EMPLOYEE_BATCH = 100
+
+
+class HrEmployeeShiftRoster(models.Model):
+    """
+    Stored shift of an employee for a day, resolved from the night shift
+    schedules and the worksheet of the employee's working hours. Timings are
+    hours of the day, like on the worksheet, so that the same row serves any
+    operating timezone. Rows are generated ahead by a cron and regenerated
+    whenever a worksheet, a schedule or an employee's working hours change.
+    """
+    _name = 'hr.employee.shift.roster'
+    _description = 'Employee Shift Roster'
+    _order = 'date desc, employee_id'
+    _rec_name = 'employee_id'
+
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True,
+                                  ondelete='cascade', index=True)
+    date = fields.Date(string='Date', required=True, index=True)
+    work_from = fields.Float(string='Work From')
+    work_to = fields.Float(string='Work To')
+    break_from = fields.Float(string='Break From')
+    break_to = fields.Float(string='Break To')
+    planned_work_hours = fields.Float(string='Planned Hours')
+    is_holiday = fields.Boolean(string='Holiday')
+    is_night_shift = fields.Boolean(string='Night Shift')
+    calendar_id = fields.Many2one('resource.calendar', string='Working Hours', ondelete='cascade',
+                                  help="Empty when the shift comes from a night shift schedule")
+
+    _sql_constraints = [
+        ('employee_date_uniq', 'unique(employee_id, date)',
+         'An employee can only have one rostered shift per day.'),
+    ]
+
+    @api.model
+    def _read_shift_times(self, employee_ids, date_from, date_to):
+        """
+        Return the rostered shift timings of the employees over the date range
+        as {(employee id, date): timings}, see
+        hr.employee._resolve_employee_shift_times for the timings.
+        """
+        if not employee_ids:
+            return {}
+        self.flush_model()
+        self._cr.execute(f"""
+            SELECT employee_id, date, work_from, work_to, break_from, break_to,
+                   is_holiday, calendar_id
+              FROM {self._table}
+             WHERE employee_id IN %s AND date BETWEEN %s AND %s
+        """, [tuple(employee_ids), date_from, date_to])
+        return {
+            (employee_id, day): {
+                'work_from': work_from,
+                'work_to': work_to,
+                'break_from': break_from,
+                'break_to': break_to,
+                'is_holiday': is_holiday,
+                'calendar_id': calendar_id,
+            }
+            for employee_id, day, work_from, work_to, break_from, break_to, is_holiday, calendar_id
+            in self._cr.fetchall()
+        }
+
+    @api.model
+    def _generate_roster(self, keys):
+        """Resolve and store the shifts of the given (employee id, date) keys"""
+        keys = set(keys)
+        if not keys:
+            return self
+        self.flush_model()
+        date_from = min(day for _employee_id, day in keys)
+        date_to = max(day for _employee_id, day in keys)
+        employee_ids = {employee_id for employee_id, _day in keys}
+        # Skip the days rostered in the meantime, e.g. by the cron
+        self._cr.execute(f"""
+            SELECT employee_id, date FROM {self._table}
+             WHERE employee_id IN %s AND date BETWEEN %s AND %s
+        """, [tuple(employee_ids), date_from, date_to])
+        keys.difference_update(self._cr.fetchall())
+
+        employees = self.env['hr.employee'].sudo().with_context(active_test=False).browse(employee_ids).exists()
+        existing_ids = set(employees.ids)
+        schedule_index = self.env['hr.night.shift.schedule'].sudo()._get_schedule_index(
+            date_from, date_to, employees.ids)
+        vals_list = []
+        for employee_id, day in sorted(keys):
+            if employee_id not in existing_ids:
+                continue
+            times = employees.browse(employee_id)._resolve_employee_shift_times(day, schedule_index)
+            vals = {
+                'employee_id': employee_id,
+                'date': day,
+                'is_holiday': times['is_holiday'],
+                'calendar_id': times['calendar_id'],
+            }
+            if not times['is_holiday']:
+                is_night_shift, planned_work_hours, _break_duration = get_shift_hours(
+                    times['work_from'], times['work_to'], times['break_from'], times['break_to'])
+                vals.update({
+                    'work_from': times['work_from'],
+                    'work_to': times['work_to'],
+                    'break_from': times['break_from'],
+                    'break_to': times['break_to'],
+                    'planned_work_hours': planned_work_hours,
+                    'is_night_shift': is_night_shift,
+                })
+            vals_list.append(vals)
+        return self._upsert_roster(vals_list)
+
+    @api.model
+    def _upsert_roster(self, vals_list):
+        """
+        Write the rostered shifts with an upsert on (employee_id, date), so
+        that a day rostered by another transaction in the meantime, e.g. by
+        the cron, is overwritten instead of failing on the unique constraint.
+        Return the rostered shifts.
+        """
+        if not vals_list:
+            return self
+        fnames = sorted(set().union(*vals_list))
+        columns = fnames + ['create_uid', 'create_date', 'write_uid', 'write_date']
+        updated_columns = [column for column in columns if column not in ('employee_id', 'date',
+                                                                          'create_uid', 'create_date')]
+        now = fields.Datetime.now()
+        rows = []
+        for vals in vals_list:
+            row = [self._fields[fname].convert_to_column(vals.get(fname), self) for fname in fnames]
+            rows.append(tuple(row + [self.env.uid, now, self.env.uid, now]))
+
+        roster_ids = []
+        for batch in self._cr.split_for_in_conditions(rows):
+            self._cr.execute(f"""
+                INSERT INTO {self._table} ({', '.join(f'"{column}"' for column in columns)})
+                VALUES {', '.join(['%s'] * len(batch))}
+                ON CONFLICT (employee_id, date) DO UPDATE
+                   SET {', '.join(f'"{column}" = EXCLUDED."{column}"' for column in updated_columns)}
+                RETURNING id
+            """, batch)
+            roster_ids.extend(row[0] for row in self._cr.fetchall())
+        self.invalidate_model()
+        return self.browse(roster_ids)
+
+    @api.model
+    def _invalidate_roster(self, employee_ids=None, calendar_ids=None, date_from=None, date_to=None):
+        """
+        Drop the rostered shifts of the employees, or of the employees working
+        with the given working hours, optionally limited to a date range. The
+        dropped days are rostered again by the roster cron, triggered after
+        the change, and lookups in between resolve the shifts directly. The
+        daily attendance facts of the same days are dropped as well, and the
+        attendances of the days queued for recomputation (see
+        hr.attendance.recompute.job).
+        """
+        self.env['hr.attendance.recompute.job']._enqueue(employee_ids, calendar_ids, date_from, date_to)
+        employee_ids = set(employee_ids or [])
+        if calendar_ids:
+            employee_ids.update(self.env['hr.employee'].sudo().with_context(active_test=False).search([
+                ('resource_calendar_id', 'in', list(calendar_ids)),
+            ]).ids)
+        if not employee_ids:
+            return
+        # The attendance facts of these days were computed with the old shifts
+        self.env['hr.attendance.daily.fact']._invalidate_facts(employee_ids, date_from, date_to)
+        query = f"DELETE FROM {self._table} WHERE employee_id IN %s"
+        params = [tuple(employee_ids)]
+        if date_from:
+            query += " AND date >= %s"
+            params.append(date_from)
+        if date_to:
+            query += " AND date <= %s"
+            params.append(date_to)
+        self.flush_model()
+        self._cr.execute(query, params)
+        dropped = self._cr.rowcount
+        self.invalidate_model()
+        if dropped:
+            cron = self.env.ref('hr_zk_attendance.cron_generate_shift_roster', raise_if_not_found=False)
+            if cron:
+                cron._trigger()
+
+    @api.model
+    def _cron_generate_roster(self):
+        """Roster the shifts of the active employees over the configured horizon"""
+        params = self.env['ir.config_parameter'].sudo()
+        past_days = int(params.get_param('hr_zk_attendance.shift_roster_past_days',
+                                         DEFAULT_ROSTER_PAST_DAYS))
+        horizon_days = int(params.get_param('hr_zk_attendance.shift_roster_horizon_days',
+                                            DEFAULT_ROSTER_HORIZON_DAYS))
+        today = fields.Date.context_today(self)
+        date_from = today - timedelta(days=past_days)
+        date_to = today + timedelta(days=horizon_days)
+        days = [date_from + timedelta(days=offset) for offset in range((date_to - date_from).days + 1)]
+        employee_ids = self.env['hr.employee'].sudo().search([]).ids
+        for batch_ids in tools.split_every(ROSTER_EMPLOYEE_BATCH, employee_ids):
+            keys = [(employee_id, day) for employee_id in batch_ids for day in days]
+            rosters = self._generate_roster(keys)
+            if rosters:
+                _logger.info(f"Rostered {len(rosters)} shifts between {date_from} and {date_to}.")
+                self.env.cr.commit()
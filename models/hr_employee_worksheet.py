@@ -1,5 +1,5 @@
 # -*- coding: utf-8 -*-
-from odoo import fields, models
+from odoo import api, fields, models
 
 class HrEmployeeWorksheet(models.Model):
     _name = 'hr.employee.worksheet'
@@ -19,4 +19,27 @@ class HrEmployeeWorksheet(models.Model):
     work_from = fields.Float(string='Work From')
     work_to = fields.Float(string='Work To')
     break_from = fields.Float(string='Break From')
-    break_to = fields.Float(string='Break To' )
\ No newline at end of file
+    break_to = fields.Float(string='Break To' )
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        worksheets = super().create(vals_list)
+        self.env['hr.employee']._invalidate_shift_cache()
+        self.env['hr.employee.shift.roster']._invalidate_roster(
+            calendar_ids=worksheets.resource_calendar_id.ids)
+        return worksheets
+
+    def write(self, vals):
+        calendar_ids = set(self.resource_calendar_id.ids)
+        res = super().write(vals)
+        calendar_ids.update(self.resource_calendar_id.ids)
+        self.env['hr.employee']._invalidate_shift_cache()
+        self.env['hr.employee.shift.roster']._invalidate_roster(calendar_ids=calendar_ids)
+        return res
+
+    def unlink(self):
+        calendar_ids = self.resource_calendar_id.ids
+        res = super().unlink()
+        self.env['hr.employee']._invalidate_shift_cache()
+        self.env['hr.employee.shift.roster']._invalidate_roster(calendar_ids=calendar_ids)
+        return res
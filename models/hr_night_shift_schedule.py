@@ -1,7 +1,65 @@
 # hr_zk_attendance/models/hr_night_shift_schedule.py
+from bisect import bisect_right
+from collections import namedtuple
 from odoo import fields, models, api, _
 from odoo.exceptions import ValidationError
 
+# Shift timings of a schedule, with the attribute names of the model fields
+ScheduleTimes = namedtuple('ScheduleTimes', ['time_from', 'time_to', 'break_from', 'break_to'])
+
+
+class NightShiftScheduleIndex:
+    """
+    Per-employee sorted intervals of the night shift schedules overlapping a
+    date range, answering "which schedule applies on day D" with a binary
+    search instead of one search per employee and day.
+    """
+
+    def __init__(self, date_from, date_to, rows):
+        self.date_from = date_from
+        self.date_to = date_to
+        intervals = {}
+        for employee_id, start, end, create_date, times in rows:
+            intervals.setdefault(employee_id, []).append((start, end, create_date, times))
+        self._starts = {}
+        self._intervals = {}
+        self._max_ends = {}
+        for employee_id, employee_intervals in intervals.items():
+            employee_intervals.sort(key=lambda interval: interval[:3])
+            max_ends, max_end = [], None
+            for interval in employee_intervals:
+                max_end = interval[1] if max_end is None else max(max_end, interval[1])
+                max_ends.append(max_end)
+            self._starts[employee_id] = [interval[0] for interval in employee_intervals]
+            self._intervals[employee_id] = employee_intervals
+            self._max_ends[employee_id] = max_ends
+
+    def covers(self, day):
+        """Whether the index was loaded for day"""
+        return self.date_from <= day <= self.date_to
+
+    def lookup(self, employee_id, day):
+        """
+        Return the ScheduleTimes of the schedule applying to the employee on
+        day, or None. Overlapping schedules are not allowed, but if some
+        exist the most recently created one wins, like the former search.
+        """
+        starts = self._starts.get(employee_id)
+        if not starts:
+            return None
+        intervals = self._intervals[employee_id]
+        max_ends = self._max_ends[employee_id]
+        best = None
+        index = bisect_right(starts, day) - 1
+        # Walk back only while an earlier interval can still reach the day
+        while index >= 0 and max_ends[index] >= day:
+            start, end, create_date, times = intervals[index]
+            if end >= day and (best is None or create_date > best[0]):
+                best = (create_date, times)
+            index -= 1
+        return best[1] if best else None
+
+
 class HrNightShiftSchedule(models.Model):
     _name = 'hr.night.shift.schedule'
     _description = 'Night Shift Schedule'
@@ -29,6 +87,56 @@ class HrNightShiftSchedule(models.Model):
     #             vals['name'] = self.env['ir.sequence'].next_by_code('hr.night.shift.schedule') or _('New')
     #     return super().create(vals_list)
 
+    @api.model
+    def _get_schedule_index(self, date_from, date_to, employee_ids=None):
+        """Load the schedules overlapping the date range in one query"""
+        field = self._fields['employee_ids']
+        query = f"""
+            SELECT rel.{field.column2}, s.date_from, s.date_to, s.create_date,
+                   s.time_from, s.time_to, s.break_from, s.break_to
+              FROM {self._table} s
+              JOIN {field.relation} rel ON rel.{field.column1} = s.id
+             WHERE s.date_from <= %s AND s.date_to >= %s
+        """
+        params = [date_to, date_from]
+        if employee_ids is not None:
+            if not employee_ids:
+                return NightShiftScheduleIndex(date_from, date_to, [])
+            query += f" AND rel.{field.column2} IN %s"
+            params.append(tuple(employee_ids))
+        self.flush_model()
+        self._cr.execute(query, params)
+        rows = [(employee_id, start, end, create_date, ScheduleTimes(*times))
+                for employee_id, start, end, create_date, *times in self._cr.fetchall()]
+        return NightShiftScheduleIndex(date_from, date_to, rows)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        schedules = super().create(vals_list)
+        self.env['hr.employee']._invalidate_shift_cache()
+        schedules._invalidate_roster()
+        return schedules
+
+    def write(self, vals):
+        self._invalidate_roster()
+        res = super().write(vals)
+        self.env['hr.employee']._invalidate_shift_cache()
+        self._invalidate_roster()
+        return res
+
+    def unlink(self):
+        self._invalidate_roster()
+        res = super().unlink()
+        self.env['hr.employee']._invalidate_shift_cache()
+        return res
+
+    def _invalidate_roster(self):
+        """Drop the rostered shifts of the schedules' employees over their periods"""
+        roster = self.env['hr.employee.shift.roster']
+        for schedule in self:
+            roster._invalidate_roster(employee_ids=schedule.employee_ids.ids,
+                                      date_from=schedule.date_from, date_to=schedule.date_to)
+
     @api.constrains('time_from', 'time_to', 'break_from', 'break_to')
     def _check_times(self):
         for rec in self:
@@ -0,0 +1,23 @@
+# hr_zk_attendance/models/res_company.py
+from odoo import fields, models
+
+ATTENDANCE_NOTIFICATION_MODES = [
+    ('instant', 'One Message per Event'),
+    ('employee', 'Digest per Employee'),
+    ('manager', 'Digest per Manager'),
+]
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    zk_notification_mode = fields.Selection(
+        ATTENDANCE_NOTIFICATION_MODES, string="Attendance Notifications", default='instant', required=True,
+        help="How the early, late and missed punches found by a device sync are notified. "
+             "One message per event posts every irregularity on its attendance, the digests "
+             "post one summary per employee, or send one summary to every attendance manager, "
+             "per sync run. Devices may override it.")
+    zk_notification_async = fields.Boolean(
+        string="Send Notifications After Commit",
+        help="Deliver the attendance notifications in their own transaction once the sync "
+             "is committed, so the sync does not wait for the messages.")
@@ -0,0 +1,107 @@
+# hr_zk_attendance/models/sync_metrics.py
+"""In-process counters of the attendance synchronization.
+
+The counters live in the memory of the server process, they are cheap to
+update from the ingestion and are exposed in the Prometheus text format by
+the /hr_zk_attendance/metrics route. With several workers every process
+reports its own counters, like any multi-process Prometheus target.
+"""
+import threading
+from bisect import bisect_left
+
+SYNC_DURATION_BUCKETS = (0.5, 1, 2, 5, 10, 30, 60, 120, 300)
+
+
+class SyncMetrics:
+    """Thread safe counters and histograms labelled by device"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.punches_ingested = {}
+        self.punches_duplicate = {}
+        self.connect_failures = {}
+        self.sync_failures = {}
+        self.sync_durations = {}
+
+    def _inc(self, counters, device, value=1):
+        with self._lock:
+            counters[device] = counters.get(device, 0) + value
+
+    def inc_punches(self, device, new, duplicate=0):
+        self._inc(self.punches_ingested, device, new)
+        if duplicate:
+            self._inc(self.punches_duplicate, device, duplicate)
+
+    def inc_connect_failure(self, device):
+        self._inc(self.connect_failures, device)
+
+    def observe_sync(self, device, duration, failed=False):
+        """Record the duration of the synchronization of one device"""
+        with self._lock:
+            buckets, total, count = self.sync_durations.get(
+                device, ([0] * (len(SYNC_DURATION_BUCKETS) + 1), 0.0, 0))
+            buckets[bisect_left(SYNC_DURATION_BUCKETS, duration)] += 1
+            self.sync_durations[device] = (buckets, total + duration, count + 1)
+            if failed:
+                self.sync_failures[device] = self.sync_failures.get(device, 0) + 1
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'punches_ingested': dict(self.punches_ingested),
+                'punches_duplicate': dict(self.punches_duplicate),
+                'connect_failures': dict(self.connect_failures),
+                'sync_failures': dict(self.sync_failures),
+                'sync_durations': {device: (list(buckets), total, count)
+                                   for device, (buckets, total, count) in self.sync_durations.items()},
+            }
+
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_metrics(snapshot, punch_ages, shift_cache_stats):
+    """
+    Render the metrics in the Prometheus text exposition format.
+    punch_ages maps device names to the age in seconds of their newest
+    downloaded punch.
+    """
+    lines = []
+
+    def family(name, metric_type, help_text, samples):
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples:
+            label_text = ','.join(f'{key}="{_label(val)}"' for key, val in labels)
+            lines.append(f"{name}{{{label_text}}} {value}" if label_text else f"{name} {value}")
+
+    family('zk_punches_ingested_total', 'counter', "Raw punches stored, per device.",
+           [((('device', device),), value) for device, value in sorted(snapshot['punches_ingested'].items())])
+    family('zk_punches_duplicate_total', 'counter', "Punches skipped as already stored, per device.",
+           [((('device', device),), value) for device, value in sorted(snapshot['punches_duplicate'].items())])
+    family('zk_device_connect_failures_total', 'counter', "Failed connections to a device.",
+           [((('device', device),), value) for device, value in sorted(snapshot['connect_failures'].items())])
+    family('zk_sync_failures_total', 'counter', "Failed device synchronizations.",
+           [((('device', device),), value) for device, value in sorted(snapshot['sync_failures'].items())])
+
+    lines.append("# HELP zk_sync_duration_seconds Duration of device synchronizations.")
+    lines.append("# TYPE zk_sync_duration_seconds histogram")
+    for device, (buckets, total, count) in sorted(snapshot['sync_durations'].items()):
+        device = _label(device)
+        cumulative = 0
+        for bound, bucket_count in zip(SYNC_DURATION_BUCKETS + ('+Inf',), buckets):
+            cumulative += bucket_count
+            lines.append(f'zk_sync_duration_seconds_bucket{{device="{device}",le="{bound}"}} {cumulative}')
+        lines.append(f'zk_sync_duration_seconds_sum{{device="{device}"}} {total:.3f}')
+        lines.append(f'zk_sync_duration_seconds_count{{device="{device}"}} {count}')
+
+    family('zk_newest_punch_age_seconds', 'gauge', "Age of the newest punch downloaded from a device.",
+           [((('device', device),), f"{age:.0f}") for device, age in sorted(punch_ages.items())])
+    family('zk_shift_cache_hits_total', 'counter', "Shift cache hits.", [((), shift_cache_stats['hits'])])
+    family('zk_shift_cache_misses_total', 'counter', "Shift cache misses.", [((), shift_cache_stats['misses'])])
+    family('zk_shift_cache_entries', 'gauge', "Shifts held by the shift cache.", [((), shift_cache_stats['size'])])
+    return '\n'.join(lines) + '\n'
+
+
+sync_metrics = SyncMetrics()
@@ -0,0 +1,51 @@
+# hr_zk_attendance/models/zk_attendance_purge_wizard.py
+from datetime import datetime, time
+import pytz
+from odoo import api, fields, models, _
+from odoo.exceptions import ValidationError
+
+
+class ZkAttendancePurgeWizard(models.TransientModel):
+    """Delete the raw punches of some devices over a period"""
+    _name = 'zk.attendance.purge.wizard'
+    _description = 'Purge Attendance Punches'
+
+    device_ids = fields.Many2many('biometric.device.details', string='Devices',
+                                  help="Leave empty to purge the punches of every device")
+    date_from = fields.Date(string='From Date')
+    date_to = fields.Date(string='To Date')
+    include_archive = fields.Boolean(string='Include Archive',
+                                     help="Also delete the matching archived punches")
+
+    @api.constrains('date_from', 'date_to')
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_from and wizard.date_to and wizard.date_from > wizard.date_to:
+                raise ValidationError(_("The start date cannot be after the end date."))
+
+    def action_purge(self):
+        self.ensure_one()
+        user_tz = pytz.timezone(self.env.user.tz or 'UTC')
+
+        def to_utc(day, day_time):
+            if not day:
+                return None
+            local_dt = user_tz.localize(datetime.combine(day, day_time))
+            return local_dt.astimezone(pytz.utc).replace(tzinfo=None)
+
+        deleted = self.env['zk.machine.attendance']._purge_punches(
+            device_ids=self.device_ids.ids or None,
+            date_from=to_utc(self.date_from, time.min),
+            date_to=to_utc(self.date_to, time.max),
+            include_archive=self.include_archive,
+        )
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'title': _('Punches Purged'),
+                'message': _('%s punches deleted.', deleted),
+                'type': 'success',
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }
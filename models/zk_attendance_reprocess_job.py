@@ -0,0 +1,85 @@
+# hr_zk_attendance/models/zk_attendance_reprocess_job.py
+import logging
+from odoo import api, fields, models
+
+_logger = logging.getLogger(__name__)
+
+
+class ZkAttendanceReprocessJob(models.Model):
+    """
+    Rebuild of the attendances of a period from the stored punches, queued
+    by the reprocessing wizard and run by a cron, batch by batch in
+    committed transactions (see zk.machine.attendance._reprocess_attendance).
+    """
+    _name = 'zk.attendance.reprocess.job'
+    _description = 'Attendance Reprocessing Job'
+    _order = 'id desc'
+    _rec_name = 'date_from'
+
+    date_from = fields.Date(string='From Date', required=True, readonly=True)
+    date_to = fields.Date(string='To Date', required=True, readonly=True)
+    employee_ids = fields.Many2many('hr.employee', string='Employees', readonly=True,
+                                    help="Empty to reprocess every employee")
+    device_ids = fields.Many2many('biometric.device.details', string='Devices', readonly=True,
+                                  help="Empty to use the punches of every device")
+    tz = fields.Char(string='Timezone', readonly=True,
+                     help="Operating timezone of the punches, the one of the requesting user")
+    user_id = fields.Many2one('res.users', string='Requested By', readonly=True,
+                              default=lambda self: self.env.user)
+    state = fields.Selection([('pending', 'Pending'), ('running', 'In Progress'), ('done', 'Done'),
+                              ('failed', 'Failed')], string='Status', default='pending', required=True)
+    employee_count = fields.Integer(string='Employees Processed', readonly=True)
+    punch_count = fields.Integer(string='Punches Processed', readonly=True)
+    workday_count = fields.Integer(string='Attendances Written', readonly=True)
+    removed_count = fields.Integer(string='Stale Attendances Removed', readonly=True,
+                                   help="Attendances built from punches in the period that no rebuilt workday matched")
+    corrected_count = fields.Integer(string='Corrected Attendances Kept', readonly=True,
+                                     help="Workdays whose attendance was corrected by hand")
+    duration = fields.Float(string='Duration (s)', digits=(16, 3), readonly=True)
+    punches_per_second = fields.Float(string='Punches per Second', digits=(16, 1), readonly=True)
+    date_done = fields.Datetime(string='Finished', readonly=True)
+    error = fields.Text(string='Error', readonly=True)
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        jobs = super().create(vals_list)
+        cron = self.env.ref('hr_zk_attendance.cron_process_reprocess_jobs', raise_if_not_found=False)
+        if cron:
+            cron._trigger()
+        return jobs
+
+    def _run(self):
+        """Reprocess the period of the job, committing after every batch of employees"""
+        self.ensure_one()
+        self.write({'state': 'running', 'error': False})
+        self.env.cr.commit()
+        stat_fields = ['employee_count', 'punch_count', 'workday_count', 'removed_count',
+                       'corrected_count', 'duration']
+        stats = self.env['zk.machine.attendance']._reprocess_attendance(
+            self.date_from, self.date_to,
+            employee_ids=self.employee_ids.ids or None,
+            device_ids=self.device_ids.ids or None,
+            commit=True,
+            tz_name=self.tz,
+            progress=lambda stats: self.write({name: stats[name] for name in stat_fields}),
+        )
+        self.write(dict({name: stats[name] for name in stat_fields}, state='done',
+                        punches_per_second=stats['punches_per_second'], date_done=fields.Datetime.now()))
+        self.env.cr.commit()
+
+    @api.model
+    def _cron_process_jobs(self):
+        """Run the queued reprocessing jobs, oldest first. Interrupted jobs are run again."""
+        for job in self.search([('state', 'in', ('pending', 'running'))], order='id'):
+            try:
+                job._run()
+            except Exception as e:
+                self.env.cr.rollback()
+                _logger.error(f"Attendance reprocessing job {job.id} failed: {e}")
+                job.write({'state': 'failed', 'error': str(e)})
+                self.env.cr.commit()
+
+    def action_retry(self):
+        """Queue the failed jobs again, a job is always run over its whole period"""
+        self.filtered(lambda job: job.state == 'failed').write({'state': 'pending', 'error': False})
+        self.env.ref('hr_zk_attendance.cron_process_reprocess_jobs')._trigger()
@@ -0,0 +1,42 @@
+# hr_zk_attendance/models/zk_attendance_reprocess_wizard.py
+from datetime import timedelta
+from odoo import api, fields, models, _
+from odoo.exceptions import ValidationError
+
+
+class ZkAttendanceReprocessWizard(models.TransientModel):
+    """Queue the rebuild of the attendances of a period from the stored punches"""
+    _name = 'zk.attendance.reprocess.wizard'
+    _description = 'Reprocess Attendances'
+
+    date_from = fields.Date(string='From Date', required=True,
+                            default=lambda self: fields.Date.context_today(self) - timedelta(days=30))
+    date_to = fields.Date(string='To Date', required=True, default=fields.Date.context_today)
+    employee_ids = fields.Many2many('hr.employee', string='Employees',
+                                    help="Leave empty to reprocess every employee")
+    device_ids = fields.Many2many('biometric.device.details', string='Devices',
+                                  help="Only use the punches of these devices, leave empty to use all of them")
+
+    @api.constrains('date_from', 'date_to')
+    def _check_dates(self):
+        for wizard in self:
+            if wizard.date_from > wizard.date_to:
+                raise ValidationError(_("The start date cannot be after the end date."))
+
+    def action_reprocess(self):
+        """Queue the reprocessing, a cron runs it out of the user's request"""
+        self.ensure_one()
+        job = self.env['zk.attendance.reprocess.job'].create({
+            'date_from': self.date_from,
+            'date_to': self.date_to,
+            'employee_ids': [(6, 0, self.employee_ids.ids)],
+            'device_ids': [(6, 0, self.device_ids.ids)],
+            'tz': self.env.user.tz or 'UTC',
+        })
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': job._name,
+            'res_id': job.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
@@ -0,0 +1,89 @@
+# hr_zk_attendance/models/zk_live_capture.py
+import logging
+from time import monotonic, sleep
+
+_logger = logging.getLogger(__name__)
+try:
+    from zk import ZK
+except ImportError:
+    _logger.error("Please Install pyzk library.")
+
+# Punches are handed to the ingestion in micro-batches of this size, or
+# earlier when no new punch arrived for LIVE_FLUSH_INTERVAL seconds.
+LIVE_BATCH_SIZE = 20
+LIVE_FLUSH_INTERVAL = 5
+LIVE_HEARTBEAT_INTERVAL = 30
+LIVE_BACKOFF_MIN = 2
+LIVE_BACKOFF_MAX = 60
+
+
+class LiveCaptureListener:
+    """Keeps a live capture session open on one device until a deadline.
+
+    The listener runs in its own thread and never touches an ORM
+    environment directly: every database access goes through ``call``,
+    which runs a device method in a new cursor (see
+    ``biometric.device.details._get_threaded_device_call``).
+    """
+
+    def __init__(self, call, device_id, device_name, device_ip, port_number, deadline):
+        self.call = call
+        self.device_id = device_id
+        self.device_name = device_name
+        self.device_ip = device_ip
+        self.port_number = port_number
+        self.deadline = deadline
+        self.buffer = []
+        self.last_flush = monotonic()
+        self.last_heartbeat = 0.0
+
+    def run(self):
+        """Listen until the deadline, reconnecting with exponential backoff"""
+        backoff = LIVE_BACKOFF_MIN
+        while monotonic() < self.deadline:
+            try:
+                self._listen()
+                backoff = LIVE_BACKOFF_MIN
+            except Exception as e:
+                _logger.warning(f"Live capture on device {self.device_name} interrupted: {e}. "
+                                f"Reconnecting in {backoff}s.")
+                self._flush(heartbeat=False)
+                sleep(min(backoff, max(0.0, self.deadline - monotonic())))
+                backoff = min(backoff * 2, LIVE_BACKOFF_MAX)
+        self._flush(heartbeat=False)
+
+    def _listen(self):
+        """Run one live capture session on a fresh connection"""
+        # Pick up the punches recorded while no listener was running. This
+        # uses its own connection, most devices accept only one at a time.
+        self.call(self.device_id, '_live_catch_up')
+        self.last_heartbeat = monotonic()
+        zk = ZK(self.device_ip, port=self.port_number, timeout=30)
+        conn = zk.connect()
+        try:
+            for punch in conn.live_capture(new_timeout=LIVE_FLUSH_INTERVAL):
+                if punch is not None:
+                    self.buffer.append(punch)
+                if len(self.buffer) >= LIVE_BATCH_SIZE or \
+                        monotonic() - self.last_flush >= LIVE_FLUSH_INTERVAL:
+                    self._flush()
+                if monotonic() >= self.deadline:
+                    # Let the generator end by itself so it unregisters the events
+                    conn.end_live_capture = True
+        finally:
+            conn.disconnect()
+
+    def _flush(self, heartbeat=True):
+        """Hand the buffered punches to the ingestion and refresh the heartbeat.
+
+        The heartbeat is only refreshed from a connected session, so that a
+        listener failing to connect lets the device fall back to polling.
+        """
+        punches, self.buffer = self.buffer, []
+        self.last_flush = monotonic()
+        if punches:
+            self.call(self.device_id, '_ingest_live_punches', punches)
+            self.last_heartbeat = self.last_flush
+        elif heartbeat and self.last_flush - self.last_heartbeat >= LIVE_HEARTBEAT_INTERVAL:
+            self.call(self.device_id, '_touch_live_heartbeat')
+            self.last_heartbeat = self.last_flush
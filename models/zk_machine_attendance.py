@@ -19,7 +19,23 @@
 #    If not, see <http://www.gnu.org/licenses/>.
 #
 ################################################################################
-from odoo import api, fields, models
+import logging
+from datetime import datetime, time, timedelta
+from time import monotonic
+import pytz
+from dateutil.relativedelta import relativedelta
+from odoo import api, fields, models, tools
+from . import attendance_engine
+
+_logger = logging.getLogger(__name__)
+
+# Rows inserted per INSERT statement by _insert_punches
+PUNCH_INSERT_BATCH = 1000
+# Rows moved or deleted per statement by the archival and the purges
+PUNCH_ARCHIVE_BATCH = 10000
+DEFAULT_RETENTION_MONTHS = 12
+# Employees computed and written back between two progress reports
+REPROCESS_EMPLOYEE_BATCH = 200
 
 
 class ZkMachineAttendance(models.Model):
@@ -51,7 +67,285 @@ class ZkMachineAttendance(models.Model):
          ('4', 'Card'), ('255', 'Duplicate')],
         string='Category',
         help="Attendance detecting methods")
-    punching_time = fields.Datetime(string='Punching Time',
+    punching_time = fields.Datetime(string='Punching Time', index=True,
                                     help="Punching time in the device")
     address_id = fields.Many2one('res.partner', string='Working Address',
-                                 help="Working address of the employee")
\ No newline at end of file
+                                 help="Working address of the employee")
+    device_id = fields.Many2one('biometric.device.details', string='Biometric Device',
+                                index=True, ondelete='set null',
+                                help="Device the punch was downloaded from")
+
+    def init(self):
+        """Enforce one raw punch per employee and punching time"""
+        index_name = 'zk_machine_attendance_employee_punch_uniq'
+        if tools.index_exists(self._cr, index_name):
+            return
+        # Drop the duplicates the former search-then-create ingestion let through
+        self._cr.execute("""
+            DELETE FROM zk_machine_attendance z
+             USING zk_machine_attendance d
+             WHERE z.employee_id = d.employee_id
+               AND z.punching_time = d.punching_time
+               AND z.id > d.id
+        """)
+        if self._cr.rowcount:
+            _logger.warning(f"Deleted {self._cr.rowcount} duplicate punches (same employee and punching "
+                            f"time) before creating the unique index {index_name}.")
+        tools.create_unique_index(self._cr, index_name, self._table,
+                                  ['employee_id', 'punching_time'])
+
+    @api.model
+    def _insert_punches(self, vals_list):
+        """
+        Insert raw punches in batches, skipping the ones already stored.
+        Duplicates, against the table as well as inside the batch, are
+        dropped by the unique index on (employee_id, punching_time). The
+        rows get the same default values as with create(), and the stored
+        computed and related fields of the new punches are computed after
+        the insert. Returns the ids of the newly inserted punches.
+        """
+        if not vals_list:
+            return []
+        self.flush_model()
+        defaults = self._add_missing_default_values({})
+        fnames = sorted(set(defaults).union(*vals_list))
+        fnames = [fname for fname in fnames
+                  if self._fields[fname].store and self._fields[fname].column_type]
+        columns = fnames + ['create_uid', 'create_date', 'write_uid', 'write_date']
+        now = fields.Datetime.now()
+
+        rows = []
+        for vals in vals_list:
+            vals = dict(defaults, **vals)
+            row = [self._fields[fname].convert_to_column(vals.get(fname), self) for fname in fnames]
+            rows.append(tuple(row + [self.env.uid, now, self.env.uid, now]))
+
+        inserted_ids = []
+        for batch in self._cr.split_for_in_conditions(rows, size=PUNCH_INSERT_BATCH):
+            self._cr.execute(f"""
+                INSERT INTO {self._table} ({', '.join(f'"{column}"' for column in columns)})
+                VALUES {', '.join(['%s'] * len(batch))}
+                ON CONFLICT (employee_id, punching_time) DO NOTHING
+                RETURNING id
+            """, batch)
+            inserted_ids.extend(row[0] for row in self._cr.fetchall())
+        if inserted_ids:
+            punches = self.browse(inserted_ids)
+            for field in self._fields.values():
+                if field.store and field.compute:
+                    self.env.add_to_compute(field, punches)
+            punches.flush_recordset()
+            self.env['daily.attendance']._schedule_refresh()
+        return inserted_ids
+
+    def unlink(self):
+        res = super().unlink()
+        self.env['daily.attendance']._schedule_refresh()
+        return res
+
+    @api.model
+    def _get_retention_cutoff(self):
+        """
+        Start of the hot range of raw punches: the first day of the month,
+        hr_zk_attendance.punch_retention_months months ago. Older punches
+        are moved to the archive. Returns None when the retention is disabled.
+        """
+        months = int(self.env['ir.config_parameter'].sudo().get_param(
+            'hr_zk_attendance.punch_retention_months', DEFAULT_RETENTION_MONTHS))
+        if months <= 0:
+            return None
+        month_start = fields.Datetime.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        return month_start - relativedelta(months=months)
+
+    @api.model
+    def _archive_punches(self, cutoff, batch_size=PUNCH_ARCHIVE_BATCH, commit=False):
+        """Move the punches older than cutoff to the archive, batch by batch"""
+        Archive = self.env['zk.machine.attendance.archive']
+        columns = ', '.join(Archive._get_archived_columns())
+        self.flush_model()
+        moved = 0
+        while True:
+            self._cr.execute(f"""
+                WITH moved AS (
+                    DELETE FROM {self._table}
+                     WHERE id IN (SELECT id FROM {self._table}
+                                   WHERE punching_time < %s AND employee_id IS NOT NULL
+                                   ORDER BY punching_time LIMIT %s)
+                 RETURNING {columns}
+                ), archived AS (
+                    INSERT INTO {Archive._table} ({columns})
+                    SELECT {columns} FROM moved
+                    ON CONFLICT (employee_id, punching_time) DO NOTHING
+                )
+                SELECT count(*) FROM moved
+            """, [cutoff, batch_size])
+            count = self._cr.fetchone()[0]
+            moved += count
+            if commit:
+                self._cr.commit()
+            if count < batch_size:
+                break
+        self.invalidate_model()
+        if moved:
+            self.env['daily.attendance']._schedule_refresh()
+        return moved
+
+    @api.model
+    def _purge_punches(self, device_ids=None, date_from=None, date_to=None, include_archive=False,
+                       batch_size=PUNCH_ARCHIVE_BATCH):
+        """
+        Delete the punches of the devices, all devices when None, punched
+        between date_from and date_to (datetimes, both optional), in batches
+        so that the table is never locked for long. Returns the number of
+        deleted punches.
+        """
+        conditions, params = [], []
+        if device_ids is not None:
+            conditions.append("device_id IN %s")
+            params.append(tuple(device_ids) or (None,))
+        if date_from:
+            conditions.append("punching_time >= %s")
+            params.append(date_from)
+        if date_to:
+            conditions.append("punching_time <= %s")
+            params.append(date_to)
+        where = ' AND '.join(conditions) or 'TRUE'
+
+        tables = [self._table]
+        if include_archive:
+            tables.append(self.env['zk.machine.attendance.archive']._table)
+        self.flush_model()
+        deleted = 0
+        for table in tables:
+            while True:
+                self._cr.execute(f"""
+                    DELETE FROM {table}
+                     WHERE id IN (SELECT id FROM {table} WHERE {where} LIMIT %s)
+                """, params + [batch_size])
+                deleted += self._cr.rowcount
+                if self._cr.rowcount < batch_size:
+                    break
+        self.invalidate_model()
+        if deleted:
+            self.env['daily.attendance']._schedule_refresh()
+        return deleted
+
+    @api.model
+    def _cron_archive_punches(self):
+        """Move the punches out of the retention period to the archive"""
+        cutoff = self._get_retention_cutoff()
+        if not cutoff:
+            return
+        moved = self._archive_punches(cutoff, commit=True)
+        _logger.info(f"Archived {moved} punches older than {cutoff}.")
+
+    @api.model
+    def _reprocess_attendance(self, date_from, date_to, employee_ids=None, device_ids=None,
+                              batch_size=REPROCESS_EMPLOYEE_BATCH, commit=False, tz_name=None,
+                              progress=None):
+        """
+        Rebuild the attendances of the workdays date_from..date_to from the
+        stored punches, of the given employees and devices (all when None).
+
+        The employees are split in batches, whose punches and shifts are
+        loaded and computed by the pure attendance engine one batch at a
+        time, in the server process. The results are written back batch by
+        batch: the attendance of each workday is rewritten, check-in
+        included, and the other attendances of the batch checked in during
+        the period that were built from punches are deleted, e.g. the second
+        half of a night shift that was wrongly split in two workdays (unless
+        only some devices are reprocessed).
+
+        Attendances corrected by hand are left untouched. progress is called
+        with the figures after every batch. Returns the figures of the run.
+        """
+        started = monotonic()
+        operating_tz = pytz.timezone(tz_name or self.env.user.tz or 'UTC')
+
+        def to_utc(day, day_time):
+            local_dt = operating_tz.localize(datetime.combine(day, day_time))
+            return local_dt.astimezone(pytz.utc).replace(tzinfo=None)
+
+        # The night shift of the last workday ends on the next day
+        conditions = ["employee_id IS NOT NULL", "punching_time BETWEEN %s AND %s"]
+        params = [to_utc(date_from, time.min), to_utc(date_to + timedelta(days=1), time.max)]
+        if employee_ids is not None:
+            conditions.append("employee_id IN %s")
+            params.append(tuple(employee_ids) or (None,))
+        if device_ids is not None:
+            conditions.append("device_id IN %s")
+            params.append(tuple(device_ids) or (None,))
+        where = ' AND '.join(conditions)
+        self.flush_model(['employee_id', 'punching_time', 'device_id'])
+        self._cr.execute(f"SELECT DISTINCT employee_id FROM {self._table} WHERE {where} ORDER BY employee_id",
+                         params)
+        all_employee_ids = [employee_id for employee_id, in self._cr.fetchall()]
+
+        stats = {'employee_count': len(all_employee_ids), 'punch_count': 0, 'workday_count': 0,
+                 'corrected_count': 0, 'removed_count': 0}
+        first_day, last_day = date_from - timedelta(days=1), date_to + timedelta(days=1)
+        days = [first_day + timedelta(days=offset) for offset in range((last_day - first_day).days + 1)]
+        # Attendances checked in during the period, replaced by the rebuilt ones
+        check_in_from, check_in_to = to_utc(date_from, time.min), to_utc(date_to + timedelta(days=1), time.min)
+        now = datetime.now()
+
+        def chunk_args():
+            """Punches and shifts of every batch, loaded when the batch is computed"""
+            for batch_ids in tools.split_every(batch_size, all_employee_ids):
+                self._cr.execute(f"""
+                    SELECT employee_id, punching_time FROM {self._table}
+                     WHERE {where} AND employee_id IN %s
+                     ORDER BY employee_id, punching_time
+                """, params + [batch_ids])
+                punches = [(employee_id, pytz.utc.localize(punching_time))
+                           for employee_id, punching_time in self._cr.fetchall()]
+                employees = self.env['hr.employee'].browse(batch_ids)
+                employees._prefetch_shifts(first_day, last_day, operating_tz)
+                shifts = {(employee.id, day): employee._get_employee_shift_for_day(day, operating_tz)
+                          for employee in employees for day in days}
+                yield batch_ids, len(punches), (punches, shifts, operating_tz.zone, now)
+
+        device = self.env['biometric.device.details'].with_context(zk_attendance_no_notification=True)
+
+        def write_results(batch_ids, punch_count, results):
+            results = [result for (_employee_id, workday), result in results.items()
+                       if date_from <= workday <= date_to]
+            attendances, corrected_count = device._upsert_attendance_batch(results, rewrite_check_in=True)
+            stale = self.env['hr.attendance']
+            if device_ids is None:
+                # With only some devices' punches, the other attendances may come from the other
+                # devices. Attendances not built from punches (kiosk, manual entries) are kept.
+                stale = stale.search([
+                    ('employee_id', 'in', list(batch_ids)),
+                    ('check_in', '>=', check_in_from),
+                    ('check_in', '<', check_in_to),
+                    ('from_device', '=', True),
+                    ('is_corrected', '=', False),
+                    ('id', 'not in', attendances.ids),
+                ])
+                stale.unlink()
+            stats['workday_count'] += len(results) - corrected_count
+            stats['corrected_count'] += corrected_count
+            stats['removed_count'] += len(stale)
+            stats['punch_count'] += punch_count
+            self.env.flush_all()
+            if progress:
+                progress(dict(stats, duration=monotonic() - started))
+            if commit:
+                self._cr.commit()
+            elapsed = monotonic() - started
+            _logger.info(f"Reprocessed the attendances of {stats['punch_count']} punches, "
+                         f"{stats['workday_count']} workdays ({stats['punch_count'] / elapsed:.0f} punches/s).")
+
+        # The engine runs in this process: forking an Odoo worker would copy its threads' locks
+        # and its open connections, and a spawned process could not import the addon.
+        for batch_ids, punch_count, args in chunk_args():
+            write_results(batch_ids, punch_count, attendance_engine.process_punch_chunk(*args))
+
+        stats['duration'] = monotonic() - started
+        stats['punches_per_second'] = stats['punch_count'] / stats['duration'] if stats['duration'] else 0.0
+        _logger.info(f"Reprocessed {stats['workday_count']} workdays of {stats['employee_count']} employees "
+                     f"between {date_from} and {date_to} in {stats['duration']:.1f}s, "
+                     f"{stats['removed_count']} stale attendances removed, "
+                     f"{stats['corrected_count']} corrected attendances kept.")
+        return stats
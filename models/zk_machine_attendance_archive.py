@@ -0,0 +1,41 @@
+# hr_zk_attendance/models/zk_machine_attendance_archive.py
+from odoo import api, fields, models
+
+
+class ZkMachineAttendanceArchive(models.Model):
+    """
+    Raw punches moved out of zk.machine.attendance once older than the
+    retention period (see zk.machine.attendance._archive_punches). Only the
+    punch itself is kept, without the attendance fields of hr.attendance nor
+    the access log columns.
+    """
+    _name = 'zk.machine.attendance.archive'
+    _description = 'Archived Attendance Punch'
+    _order = 'punching_time desc'
+    _rec_name = 'employee_id'
+    _log_access = False
+
+    employee_id = fields.Many2one('hr.employee', string='Employee', required=True,
+                                  ondelete='cascade')
+    device_id = fields.Many2one('biometric.device.details', string='Biometric Device',
+                                index=True, ondelete='set null')
+    device_id_num = fields.Char(string='Biometric Device ID')
+    punching_time = fields.Datetime(string='Punching Time', required=True, index=True)
+    punch_type = fields.Selection(
+        selection=lambda self: self.env['zk.machine.attendance']._fields['punch_type'].selection,
+        string='Punching Type')
+    attendance_type = fields.Selection(
+        selection=lambda self: self.env['zk.machine.attendance']._fields['attendance_type'].selection,
+        string='Category')
+    address_id = fields.Many2one('res.partner', string='Working Address')
+
+    _sql_constraints = [
+        ('employee_punch_uniq', 'unique(employee_id, punching_time)',
+         'A punch can only be archived once.'),
+    ]
+
+    @api.model
+    def _get_archived_columns(self):
+        """Columns copied from zk_machine_attendance, the archive's own id excluded"""
+        return ['employee_id', 'device_id', 'device_id_num', 'punching_time',
+                'punch_type', 'attendance_type', 'address_id']
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+# hr_zk_attendance/scripts/iclock_fake_client.py
+"""Fake push (ADMS/iclock) device to exercise the /iclock endpoints.
+
+It performs the handshake of a real terminal, uploads a generated
+attendance log in batches and checks every acknowledgement, e.g.::
+
+    python3 iclock_fake_client.py --url http://localhost:8069 --sn TEST0001 \\
+        --token <push token> --users 50 --days 5 --batch 200
+
+The device must exist in Odoo with the "ADMS Push" sync mode, the same
+serial number and push token (or an allowed network covering this
+host), and the employees need the matching Biometric
+Device IDs (1..N by default, see --first-user).
+"""
+import argparse
+import random
+import sys
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, timedelta
+
+
+def generate_attlog(users, days, first_user=1, start=None, seed=0):
+    """Return ATTLOG lines for a check-in and a check-out per user and day"""
+    rng = random.Random(seed)
+    start = start or date.today() - timedelta(days=days)
+    lines = []
+    for day in range(days):
+        current = datetime.combine(start + timedelta(days=day), datetime.min.time())
+        for pin in range(first_user, first_user + users):
+            check_in = current + timedelta(hours=9, minutes=rng.randint(-20, 20))
+            check_out = current + timedelta(hours=17, minutes=rng.randint(0, 45))
+            for state, stamp in ((0, check_in), (1, check_out)):
+                lines.append(f"{pin}\t{stamp:%Y-%m-%d %H:%M:%S}\t{state}\t15\t0\t0\t0")
+    return sorted(lines, key=lambda line: line.split('\t')[1])
+
+
+def request(url, data=None, token=None):
+    body = data.encode() if data is not None else None
+    headers = {'Content-Type': 'text/plain'}
+    if token:
+        headers['X-Push-Token'] = token
+    req = urllib.request.Request(url, data=body, headers=headers)
+    with urllib.request.urlopen(req, timeout=60) as response:
+        return response.read().decode()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://localhost:8069', help="Odoo base URL")
+    parser.add_argument('--sn', required=True, help="Serial number of the fake device")
+    parser.add_argument('--token', help="Push token of the device")
+    parser.add_argument('--users', type=int, default=10, help="Number of device users")
+    parser.add_argument('--days', type=int, default=1, help="Number of days of punches")
+    parser.add_argument('--first-user', type=int, default=1, help="PIN of the first user")
+    parser.add_argument('--batch', type=int, default=100, help="Records per upload")
+    args = parser.parse_args()
+
+    base = args.url.rstrip('/') + '/iclock'
+    query = urllib.parse.urlencode({'SN': args.sn, 'options': 'all', 'pushver': '2.4.1'})
+    options = request(f"{base}/cdata?{query}", token=args.token)
+    print(options.strip())
+
+    lines = generate_attlog(args.users, args.days, args.first_user)
+    started = time.monotonic()
+    for index in range(0, len(lines), args.batch):
+        batch = lines[index:index + args.batch]
+        stamp = str(index + len(batch))
+        query = urllib.parse.urlencode({'SN': args.sn, 'table': 'ATTLOG', 'Stamp': stamp})
+        answer = request(f"{base}/cdata?{query}", '\n'.join(batch) + '\n', args.token).strip()
+        if answer != f"OK: {len(batch)}":
+            print(f"Unexpected acknowledgement for records {index}-{stamp}: {answer!r}")
+            return 1
+    elapsed = time.monotonic() - started
+
+    print(request(f"{base}/getrequest?{urllib.parse.urlencode({'SN': args.sn})}", token=args.token).strip())
+    print(f"Uploaded {len(lines)} records in {elapsed:.2f}s "
+          f"({len(lines) / elapsed if elapsed else 0:.0f} records/s)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
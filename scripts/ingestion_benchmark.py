@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# hr_zk_attendance/scripts/ingestion_benchmark.py
+"""Benchmark of the attendance ingestion on generated datasets.
+
+For every dataset size it creates the employees and a device served by
+an in-process zk_device_simulator, then measures:
+
+    download          action_download_attendance, end to end
+    workday           _get_workday_for_punch of every punch
+    process           process_attendance of every employee workday
+    process_batch     attendance_engine.process_punch_batch of all the punches
+    attendance_create _create_or_update_attendance, creating the records
+    attendance_update _create_or_update_attendance, updating them
+    computes          worked_hours, status_mask and overtime_hours
+
+reporting items/s, SQL queries and peak Python memory (tracemalloc).
+Everything runs in one transaction that is rolled back, e.g.::
+
+    python3 ingestion_benchmark.py -c /etc/odoo/odoo.conf -d bench \\
+        --sizes 100,1000,10000 --days 30 --save
+
+The database needs this module installed. With --engine-only, neither
+Odoo nor a database is needed: only the pure attendance engine is
+measured, on the NumPy and on the scalar path::
+
+    engine_numpy      process_punch_batch with NumPy
+    engine_scalar     process_punch_batch without NumPy
+
+--save stores the results under the module version in the baseline
+file, along with the command and the environment of the run. Later runs
+are compared with the latest other version stored there and the script
+exits with 1 when a measure regressed by more than --tolerance.
+"""
+import argparse
+import ast
+import importlib.util
+import json
+import os
+import platform
+import sys
+import threading
+import time
+import tracemalloc
+from datetime import date, datetime, time as day_time, timedelta
+
+import pytz
+
+from zk_device_simulator import DeviceTCPServer, SimulatedDevice, TCPHandler, generate_attlog
+
+MODULE_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingestion_benchmark_baseline.json')
+BENCHMARKS = ['download', 'workday', 'process', 'process_batch', 'attendance_create', 'attendance_update', 'computes']
+ENGINE_BENCHMARKS = ['engine_numpy', 'engine_scalar']
+# Fixed period of the engine-only datasets, so that runs on different days are comparable
+ENGINE_START = date(2024, 3, 1)
+ATTENDANCE_COMPUTED_FIELDS = ['worked_hours', 'status_mask', 'overtime_hours']
+
+
+def get_module_version():
+    with open(os.path.join(MODULE_PATH, '__manifest__.py')) as manifest:
+        return ast.literal_eval(manifest.read())['version']
+
+
+def timed(items, function, trace_memory=True):
+    """Run function, return its duration, throughput and peak memory"""
+    if trace_memory:
+        tracemalloc.start()
+    started = time.perf_counter()
+    function()
+    elapsed = time.perf_counter() - started
+    peak = 0
+    if trace_memory:
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return {
+        'items': items,
+        'seconds': round(elapsed, 3),
+        'per_second': round(items / elapsed, 1) if elapsed else 0.0,
+        'queries': 0,
+        'peak_mb': round(peak / 1024 / 1024, 1),
+    }
+
+
+def measure(env, items, function, trace_memory=True):
+    """Run function, flushing and running the precommit hooks it queued"""
+    cr = env.cr
+    env.invalidate_all()
+    env.registry.clear_cache()
+    queries = cr.sql_log_count
+
+    def run():
+        function()
+        env.flush_all()
+        cr.precommit.run()
+    values = timed(items, run, trace_memory)
+    values['queries'] = cr.sql_log_count - queries
+    return values
+
+
+def load_engine():
+    """Import the attendance engine from its file, it does not depend on Odoo"""
+    spec = importlib.util.spec_from_file_location(
+        'attendance_engine', os.path.join(MODULE_PATH, 'models', 'attendance_engine.py'))
+    engine = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(engine)
+    return engine
+
+
+def run_engine_size(engine, size, args):
+    """Run the engine benchmarks on one dataset size, return {benchmark: results}"""
+    operating_tz = pytz.timezone(args.tz)
+    records = generate_attlog(size, args.days, start=ENGINE_START, jitter=args.jitter,
+                              duplicates=args.duplicates, night_shift=args.night_shift, seed=args.seed)
+    night_users = round(size * args.night_shift)
+    # The shifts of generate_attlog, built like hr.employee._build_shift
+    shifts = {}
+    for offset in range(-1, args.days + 1):
+        day = ENGINE_START + timedelta(days=offset)
+        midnight = datetime.combine(day, day_time.min)
+        for employee_id in range(1, size + 1):
+            work_from, work_to = (22, 30) if employee_id <= night_users else (9, 17)
+            shifts[(employee_id, day)] = {
+                'start_local': operating_tz.localize(midnight + timedelta(hours=work_from)),
+                'end_local': operating_tz.localize(midnight + timedelta(hours=work_to)),
+                'is_night_shift': work_to > 24,
+                'planned_work_hours': 8.0,
+                'is_holiday': False,
+            }
+    punches = [(int(user_id), stamp) for user_id, stamp, _status, _punch in records]
+    now = datetime.combine(ENGINE_START + timedelta(days=args.days + 1), day_time.min)
+
+    results = {}
+    for name, use_numpy in zip(ENGINE_BENCHMARKS, (True, False)):
+        if use_numpy and engine.np is None:
+            continue
+        results[name] = timed(len(punches), lambda: engine.process_punch_batch(
+            punches, operating_tz, lambda employee_id, day: shifts.get((employee_id, day)), now,
+            use_numpy=use_numpy), args.memory)
+    return results
+
+
+def get_environment(engine_only):
+    """Versions and hardware the results were measured with"""
+    environment = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'pytz': pytz.__version__,
+    }
+    try:
+        import numpy
+        environment['numpy'] = numpy.__version__
+    except ImportError:
+        environment['numpy'] = None
+    if not engine_only:
+        import odoo
+        environment['odoo'] = odoo.release.version
+    return environment
+
+
+def create_dataset(env, employees, days, night_shift, start):
+    """Create the employees, 1..N as device users, and their night shifts"""
+    Employee = env['hr.employee']
+    employees = Employee.create([{
+        'name': f"Benchmark Employee {index}",
+        'device_id_num': str(index),
+    } for index in range(1, employees + 1)])
+    night_employees = employees[:round(len(employees) * night_shift)]
+    if night_employees:
+        env['hr.night.shift.schedule'].create({
+            'name': "Benchmark Night Shift",
+            'date_from': start - timedelta(days=1),
+            'date_to': start + timedelta(days=days + 1),
+            'employee_ids': [(6, 0, night_employees.ids)],
+            'time_from': 22.0,
+            'time_to': 6.0,
+        })
+    return employees
+
+
+def run_size(env, size, args):
+    """Run the benchmarks on one dataset size, return {benchmark: results}"""
+    from odoo.addons.hr_zk_attendance.models import attendance_engine
+    cr = env.cr
+    start = date.today() - timedelta(days=args.days)
+    records = generate_attlog(size, args.days, start=start, jitter=args.jitter, duplicates=args.duplicates,
+                              night_shift=args.night_shift, seed=args.seed)
+    server = DeviceTCPServer(('127.0.0.1', 0), TCPHandler)
+    server.device = SimulatedDevice('benchmark', size, records, latency=args.latency, seed=args.seed)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    results = {}
+    try:
+        employees = create_dataset(env, size, args.days, args.night_shift, start)
+        device = env['biometric.device.details'].create({
+            'name': f"Benchmark Device {size}",
+            'device_ip': '127.0.0.1',
+            'port_number': server.server_address[1],
+        })
+        env.flush_all()
+        cr.execute("SAVEPOINT ingestion_benchmark_dataset")
+
+        results['download'] = measure(env, len(records), device.action_download_attendance, args.memory)
+        cr.execute("ROLLBACK TO SAVEPOINT ingestion_benchmark_dataset")
+        env.invalidate_all()
+        cr.precommit.clear()
+        cr.postcommit.clear()
+
+        operating_tz = pytz.timezone(env.user.tz or 'UTC')
+        employee_by_user = env['hr.employee']._get_device_user_map()
+        punches = [(env['hr.employee'].browse(employee_by_user[user_id]), operating_tz.localize(stamp))
+                   for user_id, stamp, _status, _punch in records if user_id in employee_by_user]
+        punch_days = [local_dt.date() for _employee, local_dt in punches]
+        workdays = []
+
+        def get_workdays():
+            employees._prefetch_shifts(min(punch_days) - timedelta(days=1),
+                                       max(punch_days) + timedelta(days=1), operating_tz)
+            workdays[:] = [device._get_workday_for_punch(employee, local_dt, operating_tz)
+                           for employee, local_dt in punches]
+        results['workday'] = measure(env, len(punches), get_workdays, args.memory)
+
+        punches_by_workday = {}
+        for (employee, local_dt), workday in zip(punches, workdays):
+            punches_by_workday.setdefault((employee, workday), []).append(
+                local_dt.astimezone(pytz.utc).replace(tzinfo=None))
+        shifts = {(employee, workday): employee._get_employee_shift_for_day(workday, operating_tz)
+                  or {'is_holiday': True, 'planned_work_hours': 0.0}
+                  for employee, workday in punches_by_workday}
+        process_results = []
+
+        def process():
+            process_results[:] = [(employee, device.process_attendance(stamps, employee,
+                                                                       shifts[(employee, workday)], operating_tz))
+                                  for (employee, workday), stamps in punches_by_workday.items()]
+        results['process'] = measure(env, len(punches_by_workday), process, args.memory)
+
+        def process_batch():
+            employees._prefetch_shifts(min(punch_days) - timedelta(days=1),
+                                       max(punch_days) + timedelta(days=1), operating_tz)
+            Employee = env['hr.employee']
+            attendance_engine.process_punch_batch(
+                [(employee.id, local_dt) for employee, local_dt in punches], operating_tz,
+                lambda employee_id, day: Employee.browse(employee_id)._get_employee_shift_for_day(day, operating_tz))
+        results['process_batch'] = measure(env, len(punches), process_batch, args.memory)
+
+        def create_or_update():
+            Attendance = env['hr.attendance']
+            for employee, result in process_results:
+                device._create_or_update_attendance(result, employee, Attendance)
+        results['attendance_create'] = measure(env, len(process_results), create_or_update, args.memory)
+        results['attendance_update'] = measure(env, len(process_results), create_or_update, args.memory)
+
+        attendances = env['hr.attendance'].search([('employee_id', 'in', employees.ids)])
+
+        def recompute():
+            for fname in ATTENDANCE_COMPUTED_FIELDS:
+                env.add_to_compute(attendances._fields[fname], attendances)
+            attendances.flush_recordset(ATTENDANCE_COMPUTED_FIELDS)
+        results['computes'] = measure(env, len(attendances), recompute, args.memory)
+    finally:
+        server.shutdown()
+        server.server_close()
+    return results
+
+
+def load_baseline(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path) as baseline_file:
+        return json.load(baseline_file)
+
+
+def compare(results, reference, tolerance):
+    """Print the changes from the reference results, return the regressions"""
+    regressions = []
+    for size, benchmarks in results.items():
+        for name, values in benchmarks.items():
+            old = reference.get(size, {}).get(name)
+            if not old:
+                continue
+            speed = values['per_second'] / old['per_second'] - 1 if old['per_second'] else 0.0
+            queries = values['queries'] / old['queries'] - 1 if old['queries'] else 0.0
+            print(f"{size:>7} {name:<18} {speed:+8.1%} items/s {queries:+8.1%} queries")
+            if speed < -tolerance or queries > tolerance:
+                regressions.append((size, name))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', help="Odoo configuration file")
+    parser.add_argument('-d', '--database', help="Database with the module installed")
+    parser.add_argument('--engine-only', action='store_true',
+                        help="Only measure the pure attendance engine, without Odoo nor database")
+    parser.add_argument('--tz', default='Europe/Paris', help="Operating timezone of the engine benchmarks")
+    parser.add_argument('--sizes', default='100,1000', help="Comma separated numbers of employees")
+    parser.add_argument('--days', type=int, default=30, help="Number of days of punches")
+    parser.add_argument('--jitter', type=int, default=20, help="Maximum shift of the punches, in minutes")
+    parser.add_argument('--duplicates', type=float, default=0.01,
+                        help="Probability that a punch is recorded twice")
+    parser.add_argument('--night-shift', type=float, default=0.1,
+                        help="Share of the employees working night shifts")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay of the simulated device replies")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generated punches")
+    parser.add_argument('--no-memory', dest='memory', action='store_false',
+                        help="Do not trace the memory, tracemalloc slows the benchmarks down")
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help="Baseline results file")
+    parser.add_argument('--save', action='store_true', help="Store the results in the baseline file")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Relative change reported as a regression")
+    args = parser.parse_args()
+    if not args.engine_only and not args.database:
+        parser.error("a database is required, unless --engine-only is given")
+
+    sizes = [int(size) for size in args.sizes.split(',')]
+    results = {}
+
+    def report(size, names):
+        for name in names:
+            values = results[str(size)].get(name)
+            if values:
+                print(f"{size:>7} {name:<18} {values['items']:>8} items {values['seconds']:>9.3f}s "
+                      f"{values['per_second']:>10.1f}/s {values['queries']:>8} queries "
+                      f"{values['peak_mb']:>8.1f} MB")
+
+    if args.engine_only:
+        engine = load_engine()
+        for size in sizes:
+            results[str(size)] = run_engine_size(engine, size, args)
+            report(size, ENGINE_BENCHMARKS)
+    else:
+        import odoo
+        odoo.tools.config.parse_config(['-c', args.config] if args.config else [])
+        registry = odoo.modules.registry.Registry(args.database)
+        with registry.cursor() as cr:
+            env = odoo.api.Environment(cr, odoo.SUPERUSER_ID, {})
+            try:
+                for size in sizes:
+                    results[str(size)] = run_size(env, size, args)
+                    report(size, BENCHMARKS)
+            finally:
+                cr.rollback()
+
+    version = get_module_version()
+    baseline = load_baseline(args.baseline)
+    references = [key for key in baseline if key != version]
+    regressions = []
+    if references:
+        print(f"Compared with version {references[-1]}:")
+        regressions = compare(results, baseline[references[-1]]['results'], args.tolerance)
+    if args.save:
+        # Engine-only and full runs of a version are stored side by side
+        entry = baseline.pop(version, {'runs': {}, 'results': {}})
+        entry['runs']['engine' if args.engine_only else 'full'] = {
+            'command': ' '.join(['python3', 'scripts/ingestion_benchmark.py'] + sys.argv[1:]),
+            'date': date.today().isoformat(),
+            'environment': get_environment(args.engine_only),
+        }
+        for size, benchmarks in results.items():
+            entry['results'].setdefault(size, {}).update(benchmarks)
+        baseline[version] = entry
+        with open(args.baseline, 'w') as baseline_file:
+            json.dump(baseline, baseline_file, indent=2)
+            baseline_file.write('\n')
+        print(f"Results of version {version} stored in {args.baseline}")
+    if regressions:
+        print(f"Regressions: {', '.join(f'{name} ({size})' for size, name in regressions)}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
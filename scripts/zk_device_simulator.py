@@ -0,0 +1,370 @@
+#!/usr/bin/env python3
+# hr_zk_attendance/scripts/zk_device_simulator.py
+"""Simulated ZK terminal speaking the binary TCP/UDP protocol used by pyzk.
+
+It answers the commands the module sends to a polled device (connect,
+disable/enable, read_sizes, get_users, get_attendance, set_time,
+clear_attendance, restart, disconnect) from a synthetic attendance log,
+so that the download can be run and benchmarked without terminals, e.g.::
+
+    python3 zk_device_simulator.py --port 4370 --users 500 --days 30 \\
+        --jitter 20 --duplicates 0.02 --night-shift 0.1 --latency 0.01
+
+With --devices N, N independent devices listen on consecutive ports.
+Every device listens on TCP and UDP. Configure the devices in Odoo with
+the simulator's address and port, and give the employees the matching
+Biometric Device IDs (1..N by default, see --first-user).
+
+--fail-connect and --drop-rate inject failures: refused connections and
+commands left unanswered (the TCP connection is closed) respectively.
+"""
+import argparse
+import random
+import socketserver
+import struct
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta
+
+MACHINE_PREPARE_DATA_1 = 0x5050
+MACHINE_PREPARE_DATA_2 = 0x7D82
+USHRT_MAX = 65535
+
+CMD_USERTEMP_RRQ = 9
+CMD_ATTLOG_RRQ = 13
+CMD_CLEAR_DATA = 14
+CMD_CLEAR_ATTLOG = 15
+CMD_GET_FREE_SIZES = 50
+CMD_STARTVERIFY = 60
+CMD_CANCELCAPTURE = 62
+CMD_GET_TIME = 201
+CMD_SET_TIME = 202
+CMD_REG_EVENT = 500
+CMD_CONNECT = 1000
+CMD_EXIT = 1001
+CMD_ENABLEDEVICE = 1002
+CMD_DISABLEDEVICE = 1003
+CMD_RESTART = 1004
+CMD_REFRESHDATA = 1013
+CMD_PREPARE_DATA = 1500
+CMD_DATA = 1501
+CMD_FREE_DATA = 1502
+CMD_READ_WITH_BUFFER = 1503
+CMD_READ_CHUNK = 1504
+CMD_ACK_OK = 2000
+CMD_ACK_ERROR = 2001
+
+# Commands acknowledged without any effect on the simulated device
+ACK_ONLY_COMMANDS = {CMD_STARTVERIFY, CMD_CANCELCAPTURE, CMD_REG_EVENT, CMD_REFRESHDATA}
+# Buffers up to this size are returned inline by read_with_buffer
+INLINE_BUFFER_SIZE = 1016
+UDP_DATA_PACKET_SIZE = 1024
+# Layouts of the ZK8 user (72 bytes) and attendance (40 bytes) records
+USER_RECORD_FORMAT = '<HB8s24sIx7sx24s'
+ATTLOG_RECORD_FORMAT = '<H24sB4sB8s'
+
+
+def encode_time(stamp):
+    """Encode a datetime like the device (see zkemsdk.c - EncodeTime)"""
+    return ((stamp.year % 100) * 12 * 31 + (stamp.month - 1) * 31 + stamp.day - 1) * 86400 + \
+        (stamp.hour * 60 + stamp.minute) * 60 + stamp.second
+
+
+def decode_time(value):
+    """Decode a device timestamp (see zkemsdk.c - DecodeTime)"""
+    second, value = value % 60, value // 60
+    minute, value = value % 60, value // 60
+    hour, value = value % 24, value // 24
+    day, value = value % 31 + 1, value // 31
+    month, value = value % 12 + 1, value // 12
+    return datetime(value + 2000, month, day, hour, minute, second)
+
+
+def checksum(packet):
+    """Checksum of a packet whose checksum field is zero (see zkemsdk.c)"""
+    if len(packet) % 2:
+        packet += b'\x00'
+    total = 0
+    for (word,) in struct.iter_unpack('<H', packet):
+        total += word
+        if total > USHRT_MAX:
+            total -= USHRT_MAX
+    return ~total % USHRT_MAX
+
+
+def make_packet(command, session_id, reply_id, data=b''):
+    header = struct.pack('<4H', command, 0, session_id, reply_id)
+    return struct.pack('<4H', command, checksum(header + data), session_id, reply_id) + data
+
+
+def generate_attlog(users, days, first_user=1, start=None, jitter=20, duplicates=0.0,
+                    night_shift=0.0, seed=0):
+    """
+    Return (user id, timestamp, status, punch) records of a check-in and a
+    check-out per user and day, in chronological order. The first users
+    (night_shift is their share) work from 22:00 to 06:00 the next day,
+    the others from 09:00 to 17:00. duplicates is the probability that a
+    punch is recorded twice, as a terminal does on a repeated verification.
+    """
+    rng = random.Random(seed)
+    start = start or date.today() - timedelta(days=days)
+    now = datetime.now()
+    night_users = round(users * night_shift)
+    records = []
+    for day in range(days):
+        current = datetime.combine(start + timedelta(days=day), datetime.min.time())
+        for index in range(users):
+            user_id = str(first_user + index)
+            if index < night_users:
+                shift = ((22, 0), (30, 0))
+            else:
+                shift = ((9, 0), (17, 0))
+            for punch, (hour, minute) in enumerate(shift):
+                stamp = current + timedelta(hours=hour, minutes=minute + rng.randint(-jitter, jitter),
+                                            seconds=rng.randint(0, 59))
+                if stamp > now:
+                    continue
+                records.append((user_id, stamp, 1, punch))
+                if rng.random() < duplicates:
+                    records.append((user_id, stamp, 1, punch))
+    records.sort(key=lambda record: record[1])
+    return records
+
+
+class SimulatedDevice:
+    """State of one terminal, shared by its TCP and UDP servers"""
+
+    def __init__(self, name, users, records, first_user=1, latency=0.0, fail_connect=0.0,
+                 drop_rate=0.0, seed=0):
+        self.name = name
+        self.users = [(uid, str(first_user + uid - 1)) for uid in range(1, users + 1)]
+        self.records = records
+        self.latency = latency
+        self.fail_connect = fail_connect
+        self.drop_rate = drop_rate
+        self.enabled = True
+        self.time_offset = timedelta()
+        self.buffers = {}
+        self.stats = {'connections': 0, 'refused': 0, 'dropped': 0, 'commands': 0}
+        self._next_session = 1
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _user_buffer(self):
+        uid_by_user = {user_id: uid for uid, user_id in self.users}
+        body = b''.join(struct.pack(USER_RECORD_FORMAT, uid, 0, b'', f"User {user_id}".encode(), 0,
+                                    b'1', user_id.encode())
+                        for uid, user_id in self.users)
+        return body, uid_by_user
+
+    def _attlog_buffer(self):
+        _users, uid_by_user = self._user_buffer()
+        return b''.join(struct.pack(ATTLOG_RECORD_FORMAT, uid_by_user.get(user_id, 0), user_id.encode(),
+                                    status, struct.pack('<I', encode_time(stamp)), punch, b'')
+                        for user_id, stamp, status, punch in self.records)
+
+    def _free_sizes(self):
+        fields = [0] * 20
+        fields[4] = len(self.users)
+        fields[8] = len(self.records)
+        fields[14], fields[15], fields[16] = 3000, 10000, 200000
+        fields[17] = fields[14]
+        fields[18] = fields[15] - len(self.users)
+        fields[19] = fields[16] - len(self.records)
+        return struct.pack('<20i', *fields) + struct.pack('<3i', 0, 0, 0)
+
+    def handle(self, command, session_id, data, tcp):
+        """
+        Execute a command and return the (command, data) replies to send,
+        None to leave it unanswered and drop the connection.
+        """
+        with self._lock:
+            self.stats['commands'] += 1
+            if command != CMD_CONNECT and self._rng.random() < self.drop_rate:
+                self.stats['dropped'] += 1
+                return None
+            if command == CMD_CONNECT:
+                self.stats['connections'] += 1
+                if self._rng.random() < self.fail_connect:
+                    self.stats['refused'] += 1
+                    return [(CMD_ACK_ERROR, b'')]
+                session_id = self._next_session
+                self._next_session = self._next_session % (USHRT_MAX - 1) + 1
+                return [(CMD_ACK_OK, b'')], session_id
+            if command in (CMD_EXIT, CMD_RESTART):
+                self.buffers.pop(session_id, None)
+                if command == CMD_RESTART:
+                    self.enabled = True
+                return [(CMD_ACK_OK, b'')]
+            if command in (CMD_ENABLEDEVICE, CMD_DISABLEDEVICE):
+                self.enabled = command == CMD_ENABLEDEVICE
+                return [(CMD_ACK_OK, b'')]
+            if command == CMD_GET_FREE_SIZES:
+                return [(CMD_ACK_OK, self._free_sizes())]
+            if command == CMD_GET_TIME:
+                return [(CMD_ACK_OK, struct.pack('<I', encode_time(datetime.now() + self.time_offset)))]
+            if command == CMD_SET_TIME:
+                self.time_offset = decode_time(struct.unpack('<I', data[:4])[0]) - datetime.now()
+                return [(CMD_ACK_OK, b'')]
+            if command == CMD_CLEAR_ATTLOG:
+                self.records = []
+                return [(CMD_ACK_OK, b'')]
+            if command == CMD_CLEAR_DATA:
+                self.records, self.users = [], []
+                return [(CMD_ACK_OK, b'')]
+            if command == CMD_READ_WITH_BUFFER:
+                _flag, table, _fct, _ext = struct.unpack('<bhii', data[:11])
+                if table == CMD_USERTEMP_RRQ:
+                    body = self._user_buffer()[0]
+                elif table == CMD_ATTLOG_RRQ:
+                    body = self._attlog_buffer()
+                else:
+                    body = b''
+                buffer = struct.pack('<I', len(body)) + body
+                if len(buffer) <= INLINE_BUFFER_SIZE:
+                    return [(CMD_DATA, buffer)]
+                self.buffers[session_id] = buffer
+                return [(CMD_ACK_OK, struct.pack('<BI', 0, len(buffer)))]
+            if command == CMD_READ_CHUNK:
+                start, size = struct.unpack('<ii', data[:8])
+                chunk = self.buffers.get(session_id, b'')[start:start + size]
+                if tcp:
+                    return [(CMD_DATA, chunk)]
+                return [(CMD_PREPARE_DATA, struct.pack('<I', len(chunk)))] + \
+                    [(CMD_DATA, chunk[offset:offset + UDP_DATA_PACKET_SIZE])
+                     for offset in range(0, len(chunk), UDP_DATA_PACKET_SIZE)] + \
+                    [(CMD_ACK_OK, b'')]
+            if command == CMD_FREE_DATA:
+                self.buffers.pop(session_id, None)
+                return [(CMD_ACK_OK, b'')]
+            if command in ACK_ONLY_COMMANDS:
+                return [(CMD_ACK_OK, b'')]
+            return [(CMD_ACK_ERROR, b'')]
+
+    def reply(self, command, session_id, reply_id, data, tcp):
+        """Return the packets answering a request and the session id to use"""
+        result = self.handle(command, session_id, data, tcp)
+        if result is None:
+            return None, session_id
+        if isinstance(result, tuple):
+            result, session_id = result
+        if self.latency:
+            time.sleep(self.latency)
+        return [make_packet(reply_command, session_id, reply_id, reply_data)
+                for reply_command, reply_data in result], session_id
+
+
+class TCPHandler(socketserver.BaseRequestHandler):
+    """One TCP connection, packets are framed by an 8 byte top header"""
+
+    def _recv_exact(self, size):
+        data = b''
+        while len(data) < size:
+            chunk = self.request.recv(size - len(data))
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+    def handle(self):
+        device = self.server.device
+        session_id = 0
+        while True:
+            top = self._recv_exact(8)
+            if not top:
+                return
+            magic_1, magic_2, length = struct.unpack('<HHI', top)
+            if (magic_1, magic_2) != (MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2) or length < 8:
+                return
+            packet = self._recv_exact(length)
+            if not packet:
+                return
+            command, _checksum, _session, reply_id = struct.unpack('<4H', packet[:8])
+            packets, session_id = device.reply(command, session_id, reply_id, packet[8:], tcp=True)
+            if packets is None:
+                return
+            self.request.sendall(b''.join(
+                struct.pack('<HHI', MACHINE_PREPARE_DATA_1, MACHINE_PREPARE_DATA_2, len(packet)) + packet
+                for packet in packets))
+            if command in (CMD_EXIT, CMD_RESTART):
+                return
+
+
+class UDPHandler(socketserver.BaseRequestHandler):
+    """One UDP datagram, the session id comes from the packet header"""
+
+    def handle(self):
+        packet, sock = self.request
+        if len(packet) < 8:
+            return
+        command, _checksum, session_id, reply_id = struct.unpack('<4H', packet[:8])
+        packets, _session_id = self.server.device.reply(command, session_id, reply_id, packet[8:], tcp=False)
+        for packet in packets or []:
+            sock.sendto(packet, self.client_address)
+
+
+class DeviceTCPServer(socketserver.ThreadingTCPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+class DeviceUDPServer(socketserver.ThreadingUDPServer):
+    allow_reuse_address = True
+    daemon_threads = True
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0', help="Address to listen on")
+    parser.add_argument('--port', type=int, default=4370, help="Port of the first device")
+    parser.add_argument('--devices', type=int, default=1, help="Number of devices, on consecutive ports")
+    parser.add_argument('--users', type=int, default=10, help="Number of device users")
+    parser.add_argument('--days', type=int, default=1, help="Number of days of punches")
+    parser.add_argument('--first-user', type=int, default=1, help="Device user id of the first user")
+    parser.add_argument('--jitter', type=int, default=20, help="Maximum shift of the punches, in minutes")
+    parser.add_argument('--duplicates', type=float, default=0.0,
+                        help="Probability that a punch is recorded twice")
+    parser.add_argument('--night-shift', type=float, default=0.0,
+                        help="Share of the users working from 22:00 to 06:00")
+    parser.add_argument('--latency', type=float, default=0.0, help="Delay before every reply, in seconds")
+    parser.add_argument('--fail-connect', type=float, default=0.0,
+                        help="Probability that a connection is refused")
+    parser.add_argument('--drop-rate', type=float, default=0.0,
+                        help="Probability that a command is left unanswered")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the generated data and failures")
+    args = parser.parse_args()
+
+    servers = []
+    devices = []
+    for index in range(args.devices):
+        port = args.port + index
+        records = generate_attlog(args.users, args.days, args.first_user, jitter=args.jitter,
+                                  duplicates=args.duplicates, night_shift=args.night_shift,
+                                  seed=args.seed + index)
+        device = SimulatedDevice(f"{args.host}:{port}", args.users, records, args.first_user,
+                                 latency=args.latency, fail_connect=args.fail_connect,
+                                 drop_rate=args.drop_rate, seed=args.seed + index)
+        for server_class, handler in ((DeviceTCPServer, TCPHandler), (DeviceUDPServer, UDPHandler)):
+            server = server_class((args.host, port), handler)
+            server.device = device
+            threading.Thread(target=server.serve_forever, daemon=True).start()
+            servers.append(server)
+        devices.append(device)
+        print(f"Device {device.name}: {len(device.users)} users, {len(records)} records")
+
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    for device in devices:
+        print(f"Device {device.name}: {device.stats}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
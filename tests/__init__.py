@@ -0,0 +1,6 @@
+# hr_zk_attendance/tests/__init__.py
+from . import test_attendance_engine
+from . import test_attendance_sync
+from . import test_iclock_push
+from . import test_attendance_status
+from . import test_attendance_daily_fact
@@ -0,0 +1,79 @@
+# hr_zk_attendance/tests/test_attendance_daily_fact.py
+from datetime import datetime, time, timedelta
+from odoo import fields
+from odoo.tests.common import TransactionCase
+from odoo.addons.hr_zk_attendance.models.hr_attendance_daily_fact import FACT_PRECOMMIT_KEY
+
+
+class TestAttendanceDailyFact(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.employee = cls.env['hr.employee'].create({'name': 'Test Employee', 'tz': 'UTC'})
+        # Facts start on the day the employee was created
+        cls.today = fields.Date.today()
+        cls.check_in = datetime.combine(cls.today, time(0, 1))
+        cls.Fact = cls.env['hr.attendance.daily.fact']
+
+    def _commit_facts(self):
+        """Run the precommit hooks like a commit would"""
+        self.env.flush_all()
+        self.env.cr.precommit.run()
+
+    def _get_fact(self):
+        return self.Fact.search([('employee_id', '=', self.employee.id), ('date', '=', self.today)])
+
+    def _create_attendance(self, **vals):
+        return self.env['hr.attendance'].create({'employee_id': self.employee.id, 'check_in': self.check_in, **vals})
+
+    def test_refresh_on_create(self):
+        self._create_attendance()
+        self.assertIn((self.employee.id, self.today), self.env.cr.precommit.data[FACT_PRECOMMIT_KEY])
+        self.assertFalse(self._get_fact(), "Facts are refreshed before commit, not on write")
+        self._commit_facts()
+        fact = self._get_fact()
+        self.assertEqual(fact.day_status, 'present')
+        self.assertEqual(fact.attendance_count, 1)
+        self.assertEqual(fact.checked_out_count, 0)
+
+    def test_refresh_on_write(self):
+        attendance = self._create_attendance()
+        self._commit_facts()
+        attendance.write({'check_out': self.check_in + timedelta(minutes=30)})
+        self._commit_facts()
+        self.assertEqual(self._get_fact().checked_out_count, 1)
+
+    def test_refresh_on_unlink(self):
+        attendance = self._create_attendance(check_out=self.check_in + timedelta(minutes=30))
+        self._commit_facts()
+        attendance.unlink()
+        self._commit_facts()
+        fact = self._get_fact()
+        self.assertEqual(fact.attendance_count, 0)
+        self.assertEqual(fact.present_days, 0)
+
+    def test_refresh_on_moved_attendance(self):
+        """Moving an attendance to another employee refreshes the facts of both"""
+        other_employee = self.env['hr.employee'].create({'name': 'Other Employee', 'tz': 'UTC'})
+        attendance = self._create_attendance()
+        self._commit_facts()
+        attendance.employee_id = other_employee
+        self._commit_facts()
+        self.assertEqual(self._get_fact().attendance_count, 0)
+        other_fact = self.Fact.search([('employee_id', '=', other_employee.id), ('date', '=', self.today)])
+        self.assertEqual(other_fact.attendance_count, 1)
+
+    def test_report_totals_read_only(self):
+        """The report counts the changes not committed yet and writes no fact"""
+        self._create_attendance()
+        totals = self.Fact._get_report_totals(self.employee.ids, self.today, self.today)
+        self.assertEqual(totals[self.employee.id]['present_days'], 1)
+        self.assertFalse(self._get_fact())
+
+        self._commit_facts()
+        attendance = self.env['hr.attendance'].search([('employee_id', '=', self.employee.id)])
+        attendance.unlink()
+        totals = self.Fact._get_report_totals(self.employee.ids, self.today, self.today)
+        self.assertEqual(totals[self.employee.id]['present_days'], 0)
+        self.assertEqual(self._get_fact().present_days, 1, "The stored fact is only refreshed on commit")
@@ -0,0 +1,150 @@
+# hr_zk_attendance/tests/test_attendance_engine.py
+import random
+import unittest
+from datetime import date, datetime, time, timedelta
+import pytz
+from odoo.tests.common import BaseCase
+from odoo.addons.hr_zk_attendance.models import attendance_engine
+
+# Timezones with DST transitions, half hour offsets and no DST at all
+TIMEZONES = ['UTC', 'Europe/Paris', 'America/New_York', 'Asia/Kolkata', 'Australia/Lord_Howe']
+# Periods covering the spring and autumn DST transitions of these timezones
+PERIODS = [(date(2024, 3, 8), date(2024, 4, 9)), (date(2024, 10, 24), date(2024, 11, 6))]
+# Working hours as (work from, work to, break from, break to), see hr.employee._build_shift
+DAY_SHIFT = (9.0, 18.0, 13.0, 14.0)
+NIGHT_SHIFT = (22.0, 6.0, 2.0, 2.5)
+EVENING_SHIFT = (14.0, 23.5, 18.0, 18.5)
+
+
+def build_shift(day, operating_tz, times):
+    """Shift of the day like hr.employee._build_shift, None on Sundays"""
+    if day.weekday() == 6:
+        return None
+    work_from, work_to, break_from, break_to = times
+    is_night_shift = work_to < work_from
+    midnight = datetime.combine(day, time.min)
+    end_day = midnight + timedelta(days=1) if is_night_shift else midnight
+    return {
+        'start_local': operating_tz.localize(midnight + timedelta(hours=work_from)),
+        'end_local': operating_tz.localize(end_day + timedelta(hours=work_to)),
+        'break_from_local': operating_tz.localize(midnight + timedelta(hours=break_from)),
+        'break_to_local': operating_tz.localize(midnight + timedelta(hours=break_to)),
+        'is_night_shift': is_night_shift,
+        'planned_work_hours': (work_to - work_from) % 24 - (break_to - break_from),
+        'is_holiday': False,
+    }
+
+
+def generate_punches(rng, operating_tz, employee_times, date_from, date_to):
+    """
+    Punches around the shift start and end of every employee day, with
+    missed check-outs, stray punches and punches at the DST transitions.
+    Half of them are naive times in the operating timezone, the others
+    timezone aware.
+    """
+    punches = []
+
+    def add(employee_id, naive_local):
+        try:
+            aware = operating_tz.localize(naive_local, is_dst=None)
+        except (pytz.AmbiguousTimeError, pytz.NonExistentTimeError):
+            # Only aware times can be given in a DST gap or overlap
+            punches.append((employee_id, operating_tz.localize(naive_local).astimezone(pytz.utc)))
+            return
+        punches.append((employee_id, naive_local if rng.random() < 0.5 else aware.astimezone(pytz.utc)))
+
+    for employee_id, times in employee_times.items():
+        day = date_from
+        while day <= date_to:
+            work_from, work_to = times[0], times[1]
+            midnight = datetime.combine(day, time.min)
+            check_in = midnight + timedelta(hours=work_from, minutes=rng.randint(-45, 45))
+            end_day = midnight + timedelta(days=1) if work_to < work_from else midnight
+            check_out = end_day + timedelta(hours=work_to, minutes=rng.randint(-90, 120))
+            draw = rng.random()
+            if draw < 0.1:
+                # Day off
+                pass
+            elif draw < 0.2:
+                add(employee_id, check_in)
+            else:
+                add(employee_id, check_in)
+                add(employee_id, check_out)
+                if draw > 0.8:
+                    add(employee_id, check_in + (check_out - check_in) * rng.random())
+            # Punches around 2-3am, when most DST transitions happen
+            if rng.random() < 0.15:
+                add(employee_id, midnight + timedelta(hours=2, minutes=rng.randint(0, 59)))
+            day += timedelta(days=1)
+    rng.shuffle(punches)
+    return punches
+
+
+@unittest.skipIf(attendance_engine.np is None, "NumPy is not installed")
+class TestProcessPunchBatch(BaseCase):
+    """The NumPy and the scalar paths of process_punch_batch return the same results"""
+
+    def assertSameResults(self, numpy_results, scalar_results):
+        self.assertEqual(list(numpy_results), list(scalar_results))
+        for key, scalar_result in scalar_results.items():
+            numpy_result = numpy_results[key]
+            self.assertEqual(set(numpy_result), set(scalar_result), key)
+            for name, value in scalar_result.items():
+                if name in ('worked_hours', 'extra_hours'):
+                    self.assertAlmostEqual(numpy_result[name], value, delta=0.01, msg=f"{key} {name}")
+                else:
+                    self.assertEqual(numpy_result[name], value, f"{key} {name}")
+
+    def _check_batch(self, tz_name, date_from, date_to, seed):
+        operating_tz = pytz.timezone(tz_name)
+        employee_times = {1: DAY_SHIFT, 2: NIGHT_SHIFT, 3: EVENING_SHIFT, 4: NIGHT_SHIFT}
+        shifts = {}
+        day = date_from - timedelta(days=1)
+        while day <= date_to + timedelta(days=1):
+            for employee_id, times in employee_times.items():
+                shifts[(employee_id, day)] = build_shift(day, operating_tz, times)
+            day += timedelta(days=1)
+        punches = generate_punches(random.Random(seed), operating_tz, employee_times, date_from, date_to)
+        now = datetime.combine(date_to, time(12))
+
+        def get_shift(employee_id, day):
+            return shifts.get((employee_id, day))
+
+        scalar_results = attendance_engine.process_punch_batch(punches, operating_tz, get_shift, now,
+                                                               use_numpy=False)
+        numpy_results = attendance_engine.process_punch_batch(punches, operating_tz, get_shift, now,
+                                                              use_numpy=True)
+        self.assertTrue(scalar_results)
+        self.assertSameResults(numpy_results, scalar_results)
+
+    def test_timezones(self):
+        for seed, tz_name in enumerate(TIMEZONES):
+            for date_from, date_to in PERIODS:
+                with self.subTest(tz=tz_name, date_from=date_from):
+                    self._check_batch(tz_name, date_from, date_to, seed)
+
+    def test_night_shift_boundary(self):
+        """Punches right before and after the night shift grace limit"""
+        operating_tz = pytz.timezone('Europe/Paris')
+        # The night of the autumn transition, an hour longer
+        day = date(2024, 10, 26)
+        shift = build_shift(day, operating_tz, NIGHT_SHIFT)
+        limit = (shift['end_local'] + attendance_engine.NIGHT_SHIFT_GRACE).astimezone(pytz.utc)
+        punches = [
+            (1, shift['start_local'].astimezone(pytz.utc)),
+            (1, limit),
+            (1, limit + timedelta(minutes=1)),
+            (2, shift['start_local'].astimezone(pytz.utc) - timedelta(minutes=5)),
+            (2, limit - timedelta(minutes=1)),
+        ]
+
+        def get_shift(employee_id, shift_day):
+            return build_shift(shift_day, operating_tz, NIGHT_SHIFT)
+
+        now = datetime(2024, 10, 30)
+        scalar_results = attendance_engine.process_punch_batch(punches, operating_tz, get_shift, now,
+                                                               use_numpy=False)
+        numpy_results = attendance_engine.process_punch_batch(punches, operating_tz, get_shift, now,
+                                                              use_numpy=True)
+        self.assertEqual(list(scalar_results), [(1, day), (1, day + timedelta(days=1)), (2, day)])
+        self.assertSameResults(numpy_results, scalar_results)
@@ -0,0 +1,59 @@
+# hr_zk_attendance/tests/test_attendance_status.py
+from datetime import datetime, timedelta
+from odoo.tests.common import TransactionCase
+from odoo.addons.hr_zk_attendance.models import attendance_engine
+
+
+class TestAttendanceStatus(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.employee = cls.env['hr.employee'].create({'name': 'Test Employee', 'tz': 'UTC'})
+        statuses = [['late_checkin'], ['late_checkin', 'early_checkout'], ['Missed checkout'], []]
+        cls.attendances = cls.env['hr.attendance']
+        for offset, status_list in enumerate(statuses):
+            check_in = datetime(2024, 3, 4, 9) + timedelta(days=offset)
+            attendance = cls.env['hr.attendance'].create({
+                'employee_id': cls.employee.id,
+                'check_in': check_in,
+                'check_out': check_in + timedelta(hours=8),
+            })
+            # Set the flags as such, whatever the shift of the employee
+            attendance.flush_recordset()
+            cls.env.cr.execute("UPDATE hr_attendance SET status_mask = %s WHERE id = %s",
+                               [attendance_engine.status_to_mask(status_list), attendance.id])
+            cls.attendances |= attendance
+        cls.attendances.invalidate_recordset()
+        cls.late, cls.late_early, cls.missed, cls.regular = cls.attendances
+        cls.tag_ids = cls.env['hr.attendance.status.tag']._get_tag_ids(list(attendance_engine.STATUS_BITS))
+
+    def _search(self, operator, value):
+        return self.env['hr.attendance'].search([('id', 'in', self.attendances.ids),
+                                                 ('status_ids', operator, value)])
+
+    def test_status_tags(self):
+        self.assertEqual(set(attendance_engine.STATUS_BITS), set(self.tag_ids),
+                         "Every status flag has a tag")
+        self.assertEqual(set(self.late_early.status_ids.mapped('name')), {'late_checkin', 'early_checkout'})
+        self.assertFalse(self.regular.status_ids)
+
+    def test_search_tag_ids(self):
+        late_tag = self.tag_ids['late_checkin']
+        self.assertEqual(self._search('in', [late_tag]), self.late | self.late_early)
+        self.assertEqual(self._search('in', [self.tag_ids['early_checkout'], self.tag_ids['Missed checkout']]),
+                         self.late_early | self.missed)
+        self.assertEqual(self._search('=', late_tag), self.late | self.late_early)
+        self.assertEqual(self._search('not in', [late_tag]), self.missed | self.regular)
+
+    def test_search_flag_name(self):
+        self.assertEqual(self._search('=', 'Missed checkout'), self.missed)
+        self.assertEqual(self._search('!=', 'late_checkin'), self.missed | self.regular)
+
+    def test_search_tag_name(self):
+        self.assertEqual(self._search('ilike', 'late'), self.late | self.late_early)
+        self.assertFalse(self._search('ilike', 'no such status'))
+
+    def test_search_without_status(self):
+        self.assertEqual(self._search('=', False), self.regular)
+        self.assertEqual(self._search('!=', False), self.late | self.late_early | self.missed)
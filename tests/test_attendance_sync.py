@@ -0,0 +1,205 @@
+# hr_zk_attendance/tests/test_attendance_sync.py
+import struct
+from datetime import datetime, timedelta
+from unittest.mock import Mock, patch
+from odoo.tests.common import TransactionCase
+from odoo.addons.hr_zk_attendance.models import attendance_engine, biometric_device_details
+
+
+def workday_result(employee, check_in, check_out, status=()):
+    """A workday result like attendance_engine.process_punches returns"""
+    return {
+        'employee_id': employee.id,
+        'check_in': check_in,
+        'check_out': check_out,
+        'worked_hours': (check_out - check_in).total_seconds() / 3600 if check_out else 0.0,
+        'status': list(status),
+        'extra_hours': 0.0,
+        'has_punches': True,
+    }
+
+
+def encode_zk_time(stamp):
+    """Pack a timestamp like the device, see biometric_device_details._decode_zk_time"""
+    value = ((stamp.year - 2000) * 12 + stamp.month - 1) * 31 + stamp.day - 1
+    value = ((value * 24 + stamp.hour) * 60 + stamp.minute) * 60 + stamp.second
+    return struct.pack('<I', value)
+
+
+class FakeConnection:
+    """Device connection serving an attendance log of 40 byte records"""
+
+    def __init__(self, punches):
+        self.records = len(punches)
+        self.freed = False
+        self.buffer_reads = 0
+        records = b''.join(
+            struct.pack(biometric_device_details.ATTLOG_RECORD_FORMAT, uid, user_id.encode(), 1,
+                        encode_zk_time(stamp), 0, b'')
+            for uid, (user_id, stamp) in enumerate(punches, start=1))
+        self.data = struct.pack('I', len(records)) + records
+
+    def read_sizes(self):
+        pass
+
+    def disable_device(self):
+        pass
+
+    def enable_device(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def read_with_buffer(self, command):
+        self.buffer_reads += 1
+        return self.data, len(self.data)
+
+    def free_data(self):
+        self.freed = True
+
+
+class TestAttendanceUpsert(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.device = cls.env['biometric.device.details'].with_context(zk_attendance_no_notification=True).create({
+            'name': 'Test Device',
+            'device_ip': '127.0.0.1',
+            'port_number': 4370,
+        })
+        cls.employee = cls.env['hr.employee'].create({'name': 'Test Employee', 'tz': 'UTC'})
+        cls.other_employee = cls.env['hr.employee'].create({'name': 'Other Employee', 'tz': 'UTC'})
+        cls.day = datetime(2024, 3, 4)
+
+    def _shift(self, days=0, hours=0):
+        return self.day + timedelta(days=days, hours=hours)
+
+    def _create_attendance(self, employee, days, **vals):
+        return self.env['hr.attendance'].create({
+            'employee_id': employee.id,
+            'check_in': self._shift(days, 9),
+            'check_out': self._shift(days, 17),
+            **vals,
+        })
+
+    def test_create_attendances(self):
+        results = [
+            workday_result(self.employee, self._shift(0, 9), self._shift(0, 17)),
+            workday_result(self.employee, self._shift(1, 9), self._shift(1, 18), ['late_checkout']),
+            workday_result(self.other_employee, self._shift(0, 8), None, ['Missed checkout']),
+        ]
+        attendances, corrected_count = self.device._upsert_attendance_batch(results)
+        self.assertEqual(len(attendances), 3)
+        self.assertEqual(corrected_count, 0)
+        self.assertTrue(all(attendances.mapped('from_device')))
+        late = attendances.filtered(lambda att: att.check_in == self._shift(1, 9))
+        self.assertEqual(late.check_out, self._shift(1, 18))
+        self.assertEqual(late.status_mask, attendance_engine.status_to_mask(['late_checkout']))
+        missed = attendances.filtered(lambda att: att.employee_id == self.other_employee)
+        self.assertTrue(missed.was_missing_checkout)
+
+    def test_same_day_in_batch(self):
+        """A second result of a day updates the attendance created by the first one"""
+        results = [
+            workday_result(self.employee, self._shift(0, 9), self._shift(0, 12)),
+            workday_result(self.employee, self._shift(0, 9), self._shift(0, 17)),
+        ]
+        attendances, _corrected_count = self.device._upsert_attendance_batch(results)
+        self.assertEqual(len(attendances), 1)
+        self.assertEqual(attendances.check_out, self._shift(0, 17))
+
+    def test_update_keeps_check_in(self):
+        attendance = self._create_attendance(self.employee, 0)
+        result = workday_result(self.employee, self._shift(0, 8), self._shift(0, 19))
+        attendances, _corrected_count = self.device._upsert_attendance_batch([result])
+        self.assertEqual(attendances, attendance)
+        self.assertEqual(attendance.check_in, self._shift(0, 9))
+        self.assertEqual(attendance.check_out, self._shift(0, 19))
+        self.assertFalse(attendance.is_corrected, "Sync updates are not manual corrections")
+
+        self.device._upsert_attendance_batch([result], rewrite_check_in=True)
+        self.assertEqual(attendance.check_in, self._shift(0, 8))
+
+    def test_updates_grouped_by_values(self):
+        attendances = self._create_attendance(self.employee, 0) | self._create_attendance(self.employee, 1) \
+            | self._create_attendance(self.other_employee, 0)
+        results = [
+            workday_result(self.employee, self._shift(0, 9), self._shift(0, 18)),
+            workday_result(self.other_employee, self._shift(0, 9), self._shift(0, 18)),
+            workday_result(self.employee, self._shift(1, 9), self._shift(1, 16), ['early_checkout']),
+        ]
+        HrAttendance = self.registry['hr.attendance']
+        with patch.object(HrAttendance, 'write', autospec=True, side_effect=HrAttendance.write) as write:
+            written, _corrected_count = self.device._upsert_attendance_batch(results)
+        self.assertEqual(written, attendances)
+        written_ids = sorted(sorted(call.args[0].ids) for call in write.call_args_list)
+        self.assertEqual(written_ids, sorted([sorted(attendances[0::2].ids), attendances[1].ids]))
+
+    def test_corrected_attendance_skipped(self):
+        corrected = self._create_attendance(self.employee, 0, is_corrected=True)
+        results = [
+            workday_result(self.employee, self._shift(0, 9), self._shift(0, 20)),
+            workday_result(self.employee, self._shift(1, 9), self._shift(1, 17)),
+        ]
+        attendances, corrected_count = self.device._upsert_attendance_batch(results)
+        self.assertEqual(corrected_count, 1)
+        self.assertNotIn(corrected, attendances)
+        self.assertEqual(len(attendances), 1)
+        self.assertEqual(corrected.check_out, self._shift(0, 17))
+
+    def test_results_without_punches_ignored(self):
+        attendances, corrected_count = self.device._upsert_attendance_batch([{'has_punches': False}])
+        self.assertFalse(attendances)
+        self.assertEqual(corrected_count, 0)
+
+
+class TestAttendanceWatermark(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.device = cls.env['biometric.device.details'].create({
+            'name': 'Test Device',
+            'device_ip': '127.0.0.1',
+            'port_number': 4370,
+        })
+        cls.punches = [(str(user_id), datetime(2024, 3, 4, 8, user_id)) for user_id in range(1, 6)]
+
+    def _fetch(self, conn):
+        zk = Mock()
+        zk.connect.return_value = conn
+        with patch.object(biometric_device_details, 'ZK', return_value=zk, create=True):
+            return self.device._fetch_attendance_data()
+
+    def test_read_from_watermark(self):
+        conn = FakeConnection(self.punches)
+        records = self.device._read_attendance_records(conn, 3)
+        self.assertEqual([(record.user_id, record.timestamp) for record in records], self.punches[3:])
+        self.assertTrue(conn.freed, "The device buffer must be freed once read")
+
+    def test_fetch_new_records(self):
+        self.device.last_record_count = 3
+        records, record_count = self._fetch(FakeConnection(self.punches))
+        self.assertEqual(record_count, 5)
+        self.assertEqual([record.user_id for record in records], ['4', '5'])
+
+    def test_fetch_without_new_records(self):
+        self.device.last_record_count = 5
+        conn = FakeConnection(self.punches)
+        records, record_count = self._fetch(conn)
+        self.assertEqual(record_count, 5)
+        self.assertFalse(records)
+        self.assertEqual(conn.buffer_reads, 0, "The log must not be downloaded without new records")
+
+    def test_fetch_cleared_log(self):
+        """A log smaller than the watermark was cleared, it is read from the start"""
+        self.device.last_record_count = 40
+        records, record_count = self._fetch(FakeConnection(self.punches[:2]))
+        self.assertEqual(record_count, 2)
+        self.assertEqual([record.user_id for record in records], ['1', '2'])
+
+    def test_ingest_stores_watermark(self):
+        self.device._ingest_attendance_data([], record_count=5)
+        self.assertEqual(self.device.last_record_count, 5)
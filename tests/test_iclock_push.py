@@ -0,0 +1,76 @@
+# hr_zk_attendance/tests/test_iclock_push.py
+from datetime import datetime, timedelta
+from unittest.mock import patch
+from odoo.tests.common import TransactionCase
+from odoo.addons.hr_zk_attendance.controllers import iclock
+
+
+class TestPushRequest(TransactionCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.device = cls.env['biometric.device.details'].create({
+            'name': 'Push Device',
+            'serial_number': 'TEST0001',
+            'sync_mode': 'push',
+        })
+
+    def test_token(self):
+        token = self.device.push_token
+        self.assertTrue(token, "A push token is generated on creation")
+        self.assertTrue(self.device._check_push_request(token, '203.0.113.7'))
+        self.assertFalse(self.device._check_push_request('wrong', '203.0.113.7'))
+        self.assertFalse(self.device._check_push_request(None, '203.0.113.7'))
+
+        self.device.action_generate_push_token()
+        self.assertFalse(self.device._check_push_request(token, '203.0.113.7'))
+
+    def test_allowed_networks(self):
+        self.device.write({'push_token': False, 'push_allowed_networks': '10.0.5.12, 192.168.1.0/24'})
+        self.assertTrue(self.device._check_push_request(None, '10.0.5.12'))
+        self.assertTrue(self.device._check_push_request(None, '192.168.1.200'))
+        self.assertFalse(self.device._check_push_request(None, '10.0.5.13'))
+        self.assertFalse(self.device._check_push_request(None, 'not an address'))
+
+    def test_token_and_networks(self):
+        self.device.push_allowed_networks = '192.168.1.0/24'
+        token = self.device.push_token
+        self.assertTrue(self.device._check_push_request(token, '192.168.1.10'))
+        self.assertFalse(self.device._check_push_request(token, '10.0.0.1'))
+        self.assertFalse(self.device._check_push_request('wrong', '192.168.1.10'))
+
+    def test_nothing_configured(self):
+        self.device.push_token = False
+        self.assertFalse(self.device._check_push_request(None, '192.168.1.10'))
+
+    def test_push_after_last_download(self):
+        """Uploads are ingested whatever the last download time of the device"""
+        employee = self.env['hr.employee'].create({'name': 'Push Employee', 'device_id_num': '42'})
+        self.device.last_download_time = datetime(2030, 1, 1)
+        # Recent punches, older ones are out of the retention period
+        day = (datetime.now() - timedelta(days=1)).strftime('%Y-%m-%d')
+        count = self.device._ingest_push_attlog(f"42\t{day} 09:02:00\t0\t1\n"
+                                                f"42\t{day} 17:31:00\t1\t1\n"
+                                                "malformed\n")
+        self.assertEqual(count, 2)
+        punches = self.env['zk.machine.attendance'].search([('employee_id', '=', employee.id)])
+        self.assertEqual(len(punches), 2)
+        self.assertEqual(self.device.last_download_time, datetime(2030, 1, 1))
+
+
+class TestRejectedPushTracker(TransactionCase):
+
+    def test_throttling(self):
+        tracker = iclock.RejectedPushTracker()
+        now = 1000.0
+        with patch.object(iclock, 'monotonic', side_effect=lambda: now):
+            for _i in range(iclock.REJECTED_PUSH_LIMIT):
+                self.assertFalse(tracker.reject('203.0.113.7', 'TEST0001', 'invalid token'))
+            self.assertTrue(tracker.reject('203.0.113.7', 'TEST0001', 'invalid token'))
+            self.assertFalse(tracker.reject('203.0.113.8', 'TEST0002', 'unknown device'),
+                             "Other sources are not throttled")
+
+            now += iclock.REJECTED_PUSH_WINDOW + 1
+            self.assertFalse(tracker.reject('203.0.113.7', 'TEST0001', 'invalid token'),
+                             "The throttling ends with the window")